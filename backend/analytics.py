@@ -0,0 +1,228 @@
+from collections import defaultdict
+
+from sqlalchemy import func
+
+import archive
+from models import db, Category, Dish, Order, OrderItem, DishSalesRollup, OrderSalesRollup
+
+GRANULARITIES = ('hour', 'day')
+
+
+def bucket_start(moment, granularity):
+    if granularity == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+# 计算一个订单对各汇总行的增量；items 为 (dish_id, category_id, quantity, price)
+# 状态变更会使原状态的汇总行减为0，查询时通过 HAVING 过滤
+def _order_deltas(created_at, status, items, sign):
+    dish_rows = []
+    order_rows = []
+    per_dish = defaultdict(lambda: [None, 0.0, 0])
+    for dish_id, category_id, quantity, price in items:
+        entry = per_dish[dish_id]
+        entry[0] = category_id
+        entry[1] += price * quantity
+        entry[2] += quantity
+    order_revenue = sum(entry[1] for entry in per_dish.values())
+
+    for granularity in GRANULARITIES:
+        bucket = bucket_start(created_at, granularity)
+        for dish_id, (category_id, revenue, quantity) in per_dish.items():
+            dish_rows.append({
+                'granularity': granularity,
+                'bucket': bucket,
+                'dish_id': dish_id,
+                'category_id': category_id,
+                'status': status,
+                'revenue': sign * revenue,
+                'quantity': sign * quantity,
+                'order_count': sign
+            })
+        order_rows.append({
+            'granularity': granularity,
+            'bucket': bucket,
+            'status': status,
+            'revenue': sign * order_revenue,
+            'order_count': sign
+        })
+    return dish_rows, order_rows
+
+
+# 累加到汇总表：SQLite/PostgreSQL 使用 INSERT ... ON CONFLICT DO UPDATE，其余数据库逐行更新
+def _accumulate(model, rows, keys, amounts, replace=()):
+    if not rows:
+        return
+    table = model.__table__
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table)
+        updates = {column: table.c[column] + stmt.excluded[column] for column in amounts}
+        updates.update({column: stmt.excluded[column] for column in replace})
+        db.session.execute(stmt.on_conflict_do_update(index_elements=keys, set_=updates), rows)
+        return
+
+    for row in rows:
+        criteria = [table.c[key] == row[key] for key in keys]
+        values = {column: table.c[column] + row[column] for column in amounts}
+        values.update({column: row[column] for column in replace})
+        if not db.session.execute(table.update().where(*criteria).values(values)).rowcount:
+            db.session.execute(table.insert().values(row))
+
+
+def _apply(created_at, status, items, sign):
+    dish_rows, order_rows = _order_deltas(created_at, status, items, sign)
+    _accumulate(DishSalesRollup, dish_rows, ['granularity', 'bucket', 'dish_id', 'status'],
+                ['revenue', 'quantity', 'order_count'], replace=['category_id'])
+    _accumulate(OrderSalesRollup, order_rows, ['granularity', 'bucket', 'status'],
+                ['revenue', 'order_count'])
+
+
+# 以下函数只在当前会话中执行语句，由调用方与订单的修改一起提交
+def record_order(created_at, status, items):
+    _apply(created_at, status, items, 1)
+
+
+def move_order_status(order, old_status, new_status):
+    if old_status == new_status:
+        return
+    items = db.session.query(
+        OrderItem.dish_id, Dish.category_id, OrderItem.quantity, OrderItem.price
+    ).outerjoin(Dish, OrderItem.dish_id == Dish.id) \
+        .filter(OrderItem.order_id == order.id).all()
+    _apply(order.created_at, old_status, items, -1)
+    _apply(order.created_at, new_status, items, 1)
+
+
+# 根据全部历史订单重建汇总表（一次性回填）。逐批读取订单项，内存占用只与汇总行数有关
+def backfill(batch_size=1000):
+    DishSalesRollup.query.delete()
+    OrderSalesRollup.query.delete()
+
+    dish_totals = {}
+    order_totals = {}
+
+    def merge(created_at, status, items):
+        dish_rows, order_rows = _order_deltas(created_at, status, items, 1)
+        for row in dish_rows:
+            key = (row['granularity'], row['bucket'], row['dish_id'], row['status'])
+            total = dish_totals.setdefault(key, dict(row, revenue=0.0, quantity=0, order_count=0))
+            total['category_id'] = row['category_id']
+            for column in ('revenue', 'quantity', 'order_count'):
+                total[column] += row[column]
+        for row in order_rows:
+            key = (row['granularity'], row['bucket'], row['status'])
+            total = order_totals.setdefault(key, dict(row, revenue=0.0, order_count=0))
+            for column in ('revenue', 'order_count'):
+                total[column] += row[column]
+
+    # 行按订单ID有序，逐个订单聚合；返回订单数
+    def merge_rows(rows):
+        orders = 0
+        current = None
+        items = []
+        for order_id, created_at, status, dish_id, category_id, quantity, price in rows:
+            if current is not None and current[0] != order_id:
+                merge(current[1], current[2], items)
+                items = []
+            if current is None or current[0] != order_id:
+                orders += 1
+                current = (order_id, created_at, status)
+            items.append((dish_id, category_id, quantity, price))
+        if current is not None:
+            merge(current[1], current[2], items)
+        return orders
+
+    rows = db.session.query(
+        Order.id, Order.created_at, Order.status,
+        OrderItem.dish_id, Dish.category_id, OrderItem.quantity, OrderItem.price
+    ).join(OrderItem, OrderItem.order_id == Order.id) \
+        .outerjoin(Dish, OrderItem.dish_id == Dish.id) \
+        .filter(Order.created_at.isnot(None)) \
+        .order_by(Order.id).yield_per(batch_size)
+    orders = merge_rows(rows)
+    # 已归档的订单同样计入
+    orders += merge_rows(archive.backfill_rows(batch_size))
+
+    if dish_totals:
+        db.session.execute(DishSalesRollup.__table__.insert(), list(dish_totals.values()))
+    if order_totals:
+        db.session.execute(OrderSalesRollup.__table__.insert(), list(order_totals.values()))
+    db.session.commit()
+    return orders
+
+
+# 时间范围内销售额最高的菜品（基于按天汇总）
+def top_dishes(start=None, end=None, status=None, limit=10):
+    query = db.session.query(
+        DishSalesRollup.dish_id,
+        Dish.name,
+        func.sum(DishSalesRollup.revenue).label('revenue'),
+        func.sum(DishSalesRollup.quantity).label('quantity'),
+        func.sum(DishSalesRollup.order_count).label('order_count')
+    ).outerjoin(Dish, DishSalesRollup.dish_id == Dish.id)
+    query = _filter_range(query, DishSalesRollup, 'day', start, end, status)
+    rows = query.group_by(DishSalesRollup.dish_id, Dish.name) \
+        .having(func.sum(DishSalesRollup.order_count) > 0) \
+        .order_by(func.sum(DishSalesRollup.revenue).desc()).limit(limit).all()
+    return [{
+        'dish_id': row.dish_id,
+        'name': row.name,
+        'revenue': round(row.revenue, 2),
+        'quantity': row.quantity,
+        'order_count': row.order_count
+    } for row in rows]
+
+
+# 时间范围内各分类的销售额
+def category_totals(start=None, end=None, status=None):
+    query = db.session.query(
+        DishSalesRollup.category_id,
+        Category.name,
+        func.sum(DishSalesRollup.revenue).label('revenue'),
+        func.sum(DishSalesRollup.quantity).label('quantity')
+    ).outerjoin(Category, DishSalesRollup.category_id == Category.id)
+    query = _filter_range(query, DishSalesRollup, 'day', start, end, status)
+    rows = query.group_by(DishSalesRollup.category_id, Category.name) \
+        .having(func.sum(DishSalesRollup.order_count) > 0) \
+        .order_by(func.sum(DishSalesRollup.revenue).desc()).all()
+    return [{
+        'category_id': row.category_id,
+        'name': row.name,
+        'revenue': round(row.revenue, 2),
+        'quantity': row.quantity
+    } for row in rows]
+
+
+# 按小时或按天的销售额与订单数时间序列
+def revenue_series(granularity='day', start=None, end=None, status=None):
+    query = db.session.query(
+        OrderSalesRollup.bucket,
+        func.sum(OrderSalesRollup.revenue).label('revenue'),
+        func.sum(OrderSalesRollup.order_count).label('order_count')
+    )
+    query = _filter_range(query, OrderSalesRollup, granularity, start, end, status)
+    rows = query.group_by(OrderSalesRollup.bucket) \
+        .having(func.sum(OrderSalesRollup.order_count) > 0) \
+        .order_by(OrderSalesRollup.bucket).all()
+    return [{
+        'bucket': row.bucket.isoformat(),
+        'revenue': round(row.revenue, 2),
+        'order_count': row.order_count
+    } for row in rows]
+
+
+def _filter_range(query, model, granularity, start, end, status):
+    query = query.filter(model.granularity == granularity)
+    if start is not None:
+        query = query.filter(model.bucket >= bucket_start(start, granularity))
+    if end is not None:
+        query = query.filter(model.bucket < end)
+    if status:
+        query = query.filter(model.status == status)
+    return query
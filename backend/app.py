@@ -1,77 +1,218 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Blueprint, Response, request, jsonify, json, stream_with_context
 from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt_identity, get_jwt
 from flask_cors import CORS
-from models import db, User, Dish, CartItem, Order, OrderItem, Review, Category
+from flask.cli import AppGroup
+import click
+from config import load_config
+from models import db, User, Dish, Order, OrderItem, Review, Category, DishInventory, OrderArchive
 from models import init_default_data  # 导入初始化数据函数
+from models import rebuild_dish_ratings
+import search
+import migrations
+from query_plans import check_query_plans
+import analytics
+import dish_import
+import archive
+from cache import menu_cache
+from compression import compression
+from metrics import metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from events import order_events, user_channel, ADMIN_CHANNEL
+from replicas import cached_read, stick_to_primary
+from auth_cache import auth_cache
+from cart_store import cart_store, validate_operation, CartOperationError, CartChanged
+from passwords import password_hasher, PasswordPoolBusy
+from serializers import (json_response, dish_rows, serialize_dish, serialize_admin_dish,
+                         DISH_DETAIL_COLUMNS, serialize_dish_detail, review_rows, serialize_review,
+                         RATING_SUMMARY_COLUMNS, serialize_rating_summary,
+                         serialize_cart, order_rows, serialize_orders)
+from pagination import InvalidPageRequest, parse_limit, encode_cursor, decode_cursor, keyset_after
+from sqlalchemy import or_, false
 from functools import wraps
+from collections import defaultdict
+import csv
+import io
+import itertools
+from datetime import date, datetime, timedelta
+from urllib.parse import urlencode
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///food_delivery.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['JWT_SECRET_KEY'] = 'food-delivery-secret-key'
+jwt = JWTManager()
+cors = CORS()
 
-db.init_app(app)
-jwt = JWTManager(app)
-CORS(app)
+# 全部接口与命令行命令注册在蓝图上，由 create_app() 挂载到应用
+api = Blueprint('api', __name__, cli_group=None)
+
+# 事件流令牌的 scope 声明；带 scope 的令牌只能用于对应的接口
+EVENTS_TOKEN_SCOPE = 'events'
+
+# 从JWT中解析用户并校验令牌版本；用户身份优先从缓存读取，命中时不查询数据库。
+# scope 为接口接受的令牌用途，普通接口只接受没有 scope 声明的访问令牌
+def resolve_current_user(scope=None):
+    if get_jwt().get('scope') != scope:
+        return None, (jsonify({'message': 'Token cannot be used for this endpoint'}), 401)
+    try:
+        user_id = int(get_jwt_identity())
+    except (ValueError, TypeError):
+        return None, (jsonify({'message': 'Invalid user ID in token'}), 422)
+    
+    entry = auth_cache.resolve(user_id)
+    if entry is None:
+        return None, (jsonify({'message': 'User not found'}), 403)
+    
+    # 权限以用户的当前状态为准，不读取令牌中的声明；旧令牌没有 ver 声明，按初始版本1校验
+    is_admin, token_version = entry
+    if get_jwt().get('ver', 1) != token_version:
+        return None, (jsonify({'message': 'Token has been revoked'}), 401)
+    return (user_id, is_admin), None
 
 # 管理员权限装饰器
 def admin_required(f):
     @wraps(f)
     @jwt_required()
     def decorated_function(*args, **kwargs):
-        current_user_id = get_jwt_identity()
-        # 将字符串ID转换为整数
-        try:
-            user_id = int(current_user_id)
-        except (ValueError, TypeError):
-            return jsonify({'message': 'Invalid user ID in token'}), 422
-            
-        user = User.query.get(user_id)
-        if not user or not user.is_admin:
+        user, error = resolve_current_user()
+        if error:
+            return error
+        if not user[1]:
             return jsonify({'message': 'Admin access required'}), 403
         return f(*args, **kwargs)
     return decorated_function
 
-# 用户权限装饰器（普通用户和管理员都可以）
+# 用户权限装饰器（普通用户和管理员都可以），解析出的用户ID以 current_user_id 参数传入视图
 def user_required(f):
     @wraps(f)
     @jwt_required()
     def decorated_function(*args, **kwargs):
-        current_user_id = get_jwt_identity()
-        # 将字符串ID转换为整数
-        try:
-            user_id = int(current_user_id)
-        except (ValueError, TypeError):
-            return jsonify({'message': 'Invalid user ID in token'}), 422
-            
-        user = User.query.get(user_id)
-        if not user:
-            return jsonify({'message': 'User not found'}), 403
-        return f(*args, **kwargs)
+        user, error = resolve_current_user()
+        if error:
+            return error
+        return f(*args, current_user_id=user[0], **kwargs)
     return decorated_function
 
-# 创建表的函数
-def create_tables():
-    with app.app_context():
-        db.create_all()
-        
-        # 创建一个默认管理员账户（用户名: admin, 密码: admin123）
-        admin_user = User.query.filter_by(username='admin').first()
-        if not admin_user:
-            admin_user = User(username='admin', email='admin@example.com', is_admin=True)
-            admin_user.set_password('admin123')
-            db.session.add(admin_user)
-        
-        # 初始化分类数据
-        init_default_data()
-        
-        db.session.commit()
+# 密码哈希进程池已满：返回429并提示客户端稍后重试
+@api.app_errorhandler(PasswordPoolBusy)
+def password_pool_busy(e):
+    response = jsonify({'message': 'Server is busy, please retry shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 429
+
+# 创建缺失的表，为已有数据库补齐新增的列和索引，并建立全文索引
+def init_db():
+    db.create_all()
+    executed = migrations.upgrade()
+    search.ensure_search_index()
+    return executed
+
+# 写入默认管理员账户与初始分类、菜品数据（已存在时跳过）
+def seed_db(admin_password='admin123'):
+    created = False
+    if not User.query.filter_by(username='admin').first():
+        admin_user = User(username='admin', email='admin@example.com', is_admin=True)
+        admin_user.set_password(admin_password)
+        db.session.add(admin_user)
+        created = True
+    
+    if init_default_data():
+        # 初始菜品需要加入全文索引
+        search.rebuild_search_index()
+    db.session.commit()
+    return created
+
+# 命令行：初始化数据库（flask init-db），部署新版本时在启动 worker 之前执行一次
+@api.cli.command('init-db')
+def init_db_command():
+    executed = init_db()
+    for migration in executed:
+        print(f'Applied {migration.revision}: {migration.description}')
+    print('Database initialized')
+
+# 命令行：写入默认管理员账户和初始数据（flask seed）
+@api.cli.command('seed')
+@click.option('--admin-password', default='admin123', help='Password for the default admin account.')
+def seed_command(admin_password):
+    if seed_db(admin_password):
+        print('Created admin user')
+    print('Seed data loaded')
+
+# 命令行：数据库迁移（flask db upgrade / flask db downgrade / flask db current）
+db_cli = AppGroup('db', help='Database schema migrations.')
+
+@db_cli.command('upgrade')
+def db_upgrade_command():
+    executed = migrations.upgrade()
+    for migration in executed:
+        print(f'Applied {migration.revision}: {migration.description}')
+    print(f'Database is at revision {migrations.current_revision()}')
+
+@db_cli.command('downgrade')
+def db_downgrade_command():
+    migration = migrations.downgrade()
+    if migration is None:
+        print('No migrations to downgrade')
+        return
+    print(f'Reverted {migration.revision}: {migration.description}')
+
+@db_cli.command('current')
+def db_current_command():
+    applied = set(migrations.applied_revisions())
+    for migration in migrations.MIGRATIONS:
+        mark = 'x' if migration.revision in applied else ' '
+        print(f'[{mark}] {migration.revision} {migration.description}')
+
+api.cli.add_command(db_cli)
+
+# 命令行：检查热点查询的执行计划，存在全表扫描时以非零状态退出（flask check-query-plans）
+@api.cli.command('check-query-plans')
+def check_query_plans_command():
+    if not search.search_available():
+        print('Query plan check requires SQLite')
+        return
+    failed = []
+    for name, plan, scans in check_query_plans():
+        print(f"{'FAIL' if scans else 'ok  '} {name}: {'; '.join(plan)}")
+        if scans:
+            failed.append(name)
+    if failed:
+        raise click.ClickException(f'Full table scans in: {", ".join(failed)}')
+
+# 命令行：根据评论表重建菜品评分聚合（flask rebuild-ratings）
+@api.cli.command('rebuild-ratings')
+def rebuild_ratings_command():
+    updated = rebuild_dish_ratings()
+    print(f'Rebuilt rating aggregates for {updated} dishes')
+
+# 命令行：根据历史订单回填销售汇总（flask backfill-analytics）
+@api.cli.command('backfill-analytics')
+def backfill_analytics_command():
+    orders = analytics.backfill()
+    print(f'Backfilled sales rollups from {orders} orders')
 
-# 在应用启动时创建表
-create_tables()
+# 命令行：把较早的已送达订单按批移到归档表（flask archive-orders），可以定期执行；
+# 参数默认取 ARCHIVE_AFTER_DAYS、ARCHIVE_BATCH_SIZE、ARCHIVE_BATCH_PAUSE
+@api.cli.command('archive-orders')
+@click.option('--days', type=int, default=None, help='Archive delivered orders older than this many days.')
+@click.option('--batch-size', type=int, default=None, help='Orders moved per transaction.')
+@click.option('--pause', type=float, default=None, help='Seconds to sleep between batches.')
+def archive_orders_command(days, batch_size, pause):
+    # 归档前订单时间须已由迁移统一格式，否则归档订单的分页比较会出错
+    if migrations.pending():
+        raise click.ClickException('Run flask db upgrade before archiving orders')
+    orders, items = archive.archive_orders(days, batch_size, pause)
+    print(f'Archived {orders} orders ({items} items)')
+
+# 命令行：重建菜品全文索引（flask rebuild-search-index）
+@api.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    indexed = search.rebuild_search_index()
+    print(f'Indexed {indexed} dishes')
+
+# 命令行：把键值存储中有变化的购物车立即写回 CartItem（flask flush-carts）
+@api.cli.command('flush-carts')
+def flush_carts_command():
+    flushed = cart_store.flush()
+    print(f'Flushed {flushed} carts')
 
 # 用户注册
-@app.route('/api/register', methods=['POST'])
+@api.route('/api/register', methods=['POST'])
 def register():
     data = request.get_json()
     username = data.get('username')
@@ -93,8 +234,12 @@ def register():
     
     return jsonify({'message': 'User registered successfully'}), 201
 
+# 签发访问令牌：用户ID转换为字符串，ver 为用户当前的令牌版本
+def issue_access_token(user):
+    return create_access_token(identity=str(user.id), additional_claims={'ver': user.token_version})
+
 # 用户登录
-@app.route('/api/login', methods=['POST'])
+@api.route('/api/login', methods=['POST'])
 def login():
     data = request.get_json()
     username = data.get('username')
@@ -103,10 +248,13 @@ def login():
     user = User.query.filter_by(username=username).first()
     
     if user and user.check_password(password):
-        # 将用户ID转换为字符串
-        access_token = create_access_token(identity=str(user.id))
+        # 工作因子配置变化后，在登录成功时透明地重新哈希
+        if user.password_needs_rehash():
+            user.set_password(password)
+            db.session.commit()
+        
         return jsonify({
-            'access_token': access_token,
+            'access_token': issue_access_token(user),
             'user': {
                 'id': user.id,
                 'username': user.username,
@@ -117,8 +265,29 @@ def login():
     
     return jsonify({'message': 'Invalid credentials'}), 401
 
+# 修改密码（需要登录和当前密码）：此前签发的令牌全部失效，返回新的令牌
+@api.route('/api/password', methods=['PUT'])
+@user_required
+def change_password(current_user_id):
+    data = request.get_json()
+    if not data or not data.get('current_password') or not data.get('new_password'):
+        return jsonify({'message': 'Current and new password are required'}), 400
+    
+    user = User.query.get_or_404(current_user_id)
+    if not user.check_password(data['current_password']):
+        return jsonify({'message': 'Invalid credentials'}), 401
+    
+    user.set_password(data['new_password'])
+    user.revoke_tokens()
+    db.session.commit()
+    
+    return jsonify({
+        'message': 'Password changed successfully',
+        'access_token': issue_access_token(user)
+    }), 200
+
 # 忘记密码（简化版，实际应该发送邮件）
-@app.route('/api/forgot-password', methods=['POST'])
+@api.route('/api/forgot-password', methods=['POST'])
 def forgot_password():
     data = request.get_json()
     email = data.get('email')
@@ -132,273 +301,592 @@ def forgot_password():
     
     return jsonify({'message': 'Email not found'}), 404
 
+# 菜品列表支持的排序方式：(排序列, 是否降序)，均以菜品ID作为次序键
+DISH_SORTS = {
+    'default': (Dish.id, False),
+    'price': (Dish.price, False),
+    'price_desc': (Dish.price, True),
+    'rating': (Dish.rating_avg, True),
+    'newest': (Dish.id, True),
+}
+
+# 按查询参数构建菜品查询（筛选、排序与键集游标条件）；返回 (查询, 排序方式)
+def dish_query(args):
+    sort = args.get('sort') or 'default'
+    if sort not in DISH_SORTS:
+        raise InvalidPageRequest('Invalid sort')
+    key, descending = DISH_SORTS[sort]
+
+    query = dish_rows()
+
+    category_id = args.get('category_id')
+    if category_id:
+        try:
+            query = query.filter(Dish.category_id == int(category_id))
+        except ValueError:
+            raise InvalidPageRequest('category_id must be an integer')
+
+    try:
+        min_price = float(args['min_price']) if args.get('min_price') else None
+        max_price = float(args['max_price']) if args.get('max_price') else None
+    except ValueError:
+        raise InvalidPageRequest('min_price and max_price must be numbers')
+    if min_price is not None:
+        query = query.filter(Dish.price >= min_price)
+    if max_price is not None:
+        query = query.filter(Dish.price <= max_price)
+
+    q = (args.get('q') or '').strip()
+    if q and search.search_available():
+        # 通过全文索引匹配，避免对名称和描述做全表 LIKE 扫描
+        matching = search.matching_ids(q)
+        query = query.filter(Dish.id.in_(matching) if matching is not None else false())
+    elif q:
+        pattern = f'%{q}%'
+        query = query.filter(or_(
+            Dish.name.ilike(pattern),
+            Dish.description.ilike(pattern),
+            Category.name.ilike(pattern)
+        ))
+
+    cursor = args.get('cursor')
+    if cursor:
+        values = decode_cursor(cursor, sort)
+        if len(values) != (1 if key is Dish.id else 2) or not isinstance(values[-1], int):
+            raise InvalidPageRequest('Invalid cursor')
+        if key is Dish.id:
+            query = query.filter(Dish.id < values[0] if descending else Dish.id > values[0])
+        else:
+            query = query.filter(keyset_after(key, Dish.id, values[0], values[1], descending))
+
+    if key is Dish.id:
+        order_by = [Dish.id.desc() if descending else Dish.id]
+    else:
+        order_by = [key.desc(), Dish.id.desc()] if descending else [key, Dish.id]
+    return query.order_by(*order_by), sort
+
+# 按查询参数在数据库中完成筛选、排序和键集分页
+def query_dishes(args, limit=None):
+    query, sort = dish_query(args)
+    key, _ = DISH_SORTS[sort]
+
+    if limit is None:
+        return query.all(), None
+
+    # 多取一条用于判断是否还有下一页
+    dishes = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(dishes) > limit:
+        dishes = dishes[:limit]
+        last = dishes[-1]
+        if key is Dish.id:
+            next_cursor = encode_cursor(sort, last.id)
+        else:
+            next_cursor = encode_cursor(sort, getattr(last, key.key), last.id)
+    return dishes, next_cursor
+
 # 获取菜品列表（无需登录）
-@app.route('/api/dishes', methods=['GET'])
+# 支持 category_id、q、min_price/max_price、sort 筛选；传入 limit 或 cursor 时按页返回
+@api.route('/api/dishes', methods=['GET'])
 def get_dishes():
-    dishes = Dish.query.all()
-    
-    # 为每个菜品计算平均评分
-    dish_list = []
-    for dish in dishes:
-        reviews = Review.query.filter_by(dish_id=dish.id).all()
-        if reviews:
-            average_rating = sum(review.rating for review in reviews) / len(reviews)
-            review_count = len(reviews)
-        else:
-            average_rating = 5.0  # 默认评分
-            review_count = 0
-            
-        dish_data = {
-            'id': dish.id,
-            'name': dish.name,
-            'description': dish.description,
-            'price': dish.price,
-            'image_url': dish.image_url,
-            'rating': round(average_rating, 1),
-            'reviewCount': review_count
-        }
-        
-        # 添加分类信息
-        if dish.category:
-            dish_data['category'] = {
-                'id': dish.category.id,
-                'name': dish.category.name
-            }
+    def build():
+        paginated = 'limit' in request.args or 'cursor' in request.args
+        try:
+            limit = parse_limit(request.args.get('limit')) if paginated else None
+            # 一次联表查询取出菜品及分类的所需列，评分直接使用预先聚合的字段
+            dishes, next_cursor = query_dishes(request.args, limit)
+        except InvalidPageRequest as e:
+            return jsonify({'message': str(e)}), 400
         
-        dish_list.append(dish_data)
+        dish_list = [serialize_dish(row) for row in dishes]
+        if paginated:
+            return {'items': dish_list, 'next_cursor': next_cursor}
+        return dish_list
+    
+    # 以规范化的查询参数作为缓存键
+    cache_key = urlencode(sorted(request.args.items(multi=True)))
+    return cached_read('dishes', cache_key, build)
+
+# 获取菜品分类（无需登录），用于菜单页的分类筛选（菜品按页加载，不能从已加载的菜品中汇总分类）
+@api.route('/api/categories', methods=['GET'])
+def get_categories():
+    def build():
+        return [{'id': row.id, 'name': row.name} for row in
+                db.session.query(Category.id, Category.name).order_by(Category.id)]
+    
+    return cached_read('categories', 'all', build)
+
+# 全文搜索菜品（无需登录），按相关度排序；autocomplete=1 时仅返回名称用于输入提示
+@api.route('/api/dishes/search', methods=['GET'])
+def search_dishes():
+    q = (request.args.get('q') or '').strip()
+    autocomplete = request.args.get('autocomplete') in ('1', 'true')
+    try:
+        limit = parse_limit(request.args.get('limit'), default=10 if autocomplete else 20)
+    except InvalidPageRequest as e:
+        return jsonify({'message': str(e)}), 400
+    
+    if not q:
+        return jsonify([]), 200
+    
+    if search.search_available():
+        dish_ids = search.search_dish_ids(q, limit, prefix=True)
+        dishes_by_id = {
+            row.id: row for row in dish_rows().filter(Dish.id.in_(dish_ids))
+        } if dish_ids else {}
+        dishes = [dishes_by_id[dish_id] for dish_id in dish_ids if dish_id in dishes_by_id]
+    else:
+        dishes, _ = query_dishes({'q': q}, limit)
     
-    return jsonify(dish_list), 200
+    if autocomplete:
+        return json_response([{'id': row.id, 'name': row.name} for row in dishes])
+    
+    return json_response([serialize_dish(row) for row in dishes])
 
 # 获取单个菜品详情（无需登录）
-@app.route('/api/dishes/<int:dish_id>', methods=['GET'])
+@api.route('/api/dishes/<int:dish_id>', methods=['GET'])
 def get_dish(dish_id):
-    dish = Dish.query.get_or_404(dish_id)
-    
-    # 计算平均评分
-    reviews = Review.query.filter_by(dish_id=dish_id).all()
-    if reviews:
-        average_rating = sum(review.rating for review in reviews) / len(reviews)
-        review_count = len(reviews)
-    else:
-        average_rating = 5.0  # 默认评分
-        review_count = 0
+    def build():
+        row = db.session.query(*DISH_DETAIL_COLUMNS).filter(Dish.id == dish_id, Dish.active()).first_or_404()
+        return serialize_dish_detail(row)
     
-    return jsonify({
-        'id': dish.id,
-        'name': dish.name,
-        'description': dish.description,
-        'price': dish.price,
-        'image_url': dish.image_url,
-        'averageRating': round(average_rating, 1),
-        'reviewCount': review_count
-    }), 200
+    return cached_read('dish', dish_id, build)
 
-# 获取菜品评论（无需登录）
-@app.route('/api/dishes/<int:dish_id>/reviews', methods=['GET'])
+# 获取菜品评论（无需登录），按发表时间倒序；支持 min_rating 筛选。
+# 传入 limit 或 cursor 时按页返回 {items, next_cursor, averageRating, reviewCount, histogram}，
+# 评分分布取自菜品上预先聚合的各星级计数
+@api.route('/api/dishes/<int:dish_id>/reviews', methods=['GET'])
 def get_dish_reviews(dish_id):
-    reviews = Review.query.filter_by(dish_id=dish_id).all()
-    return jsonify([{
-        'id': review.id,
-        'rating': review.rating,
-        'comment': review.comment,
-        'created_at': review.created_at.isoformat() if review.created_at else None,
-        'user': {
-            'id': review.user.id,
-            'username': review.user.username
-        }
-    } for review in reviews]), 200
+    def build():
+        paginated = 'limit' in request.args or 'cursor' in request.args
+        try:
+            limit = parse_limit(request.args.get('limit')) if paginated else None
+            reviews, next_cursor = query_reviews(dish_id, request.args, limit)
+        except InvalidPageRequest as e:
+            return jsonify({'message': str(e)}), 400
+        
+        # 评论与用户名一次联表查询
+        review_list = [serialize_review(row) for row in reviews]
+        if not paginated:
+            return review_list
+        
+        summary = db.session.query(*RATING_SUMMARY_COLUMNS).filter(Dish.id == dish_id, Dish.active()) \
+            .first_or_404()
+        return dict(serialize_rating_summary(summary), items=review_list, next_cursor=next_cursor)
+    
+    cache_key = '%d?%s' % (dish_id, urlencode(sorted(request.args.items(multi=True))))
+    return cached_read('reviews', cache_key, build)
+
+# 评论的筛选与按发表时间倒序的键集游标条件
+def review_query(dish_id, args):
+    query = review_rows().filter(Review.dish_id == dish_id)
+    
+    min_rating = args.get('min_rating')
+    if min_rating:
+        try:
+            min_rating = int(min_rating)
+        except ValueError:
+            raise InvalidPageRequest('min_rating must be an integer between 1 and 5')
+        if not 1 <= min_rating <= 5:
+            raise InvalidPageRequest('min_rating must be an integer between 1 and 5')
+        query = query.filter(Review.rating >= min_rating)
+    
+    cursor = args.get('cursor')
+    if cursor:
+        values = decode_cursor(cursor, 'reviews')
+        try:
+            created_at = datetime.fromisoformat(values[0])
+        except (ValueError, TypeError, IndexError):
+            raise InvalidPageRequest('Invalid cursor')
+        if len(values) != 2 or not isinstance(values[1], int):
+            raise InvalidPageRequest('Invalid cursor')
+        query = query.filter(keyset_after(Review.created_at, Review.id, created_at, values[1], descending=True))
+    
+    return query.order_by(Review.created_at.desc(), Review.id.desc())
+
+# 评论的筛选与按发表时间倒序的键集分页
+def query_reviews(dish_id, args, limit=None):
+    query = review_query(dish_id, args)
+    
+    if limit is None:
+        return query.all(), None
+    
+    reviews = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(reviews) > limit:
+        reviews = reviews[:limit]
+        last = reviews[-1]
+        next_cursor = encode_cursor('reviews', last.created_at.isoformat(), last.id)
+    return reviews, next_cursor
+
+# 执行购物车操作；失败时返回错误响应，成功时返回 None
+def apply_cart_operations(user_id, operations, with_index=False):
+    try:
+        cart_store.apply(user_id, operations)
+    except CartOperationError as e:
+        body = {'message': e.message}
+        if with_index:
+            body['index'] = e.index
+        return jsonify(body), e.status
+    return None
 
 # 添加到购物车（需要登录）
-@app.route('/api/cart', methods=['POST'])
+@api.route('/api/cart', methods=['POST'])
+@stick_to_primary
 @user_required
-def add_to_cart():
-    current_user_id = get_jwt_identity()
-    # 将字符串ID转换为整数
-    try:
-        current_user_id = int(current_user_id)
-    except (ValueError, TypeError):
-        return jsonify({'message': 'Invalid user ID'}), 422
-        
+def add_to_cart(current_user_id):
     data = request.get_json()
     
     # 检查数据是否存在
     if not data:
         return jsonify({'message': 'Missing JSON data'}), 400
     
-    dish_id = data.get('dish_id')
-    quantity = data.get('quantity', 1)
-    specifications = data.get('specifications', '')
+    operation = {
+        'op': 'add',
+        'dish_id': data.get('dish_id'),
+        'quantity': data.get('quantity', 1),
+        'specifications': data.get('specifications', '')
+    }
     
     # 验证参数
-    if dish_id is None:
-        return jsonify({'message': 'Dish ID is required'}), 400
-    
-    if not isinstance(quantity, int) or quantity <= 0:
-        return jsonify({'message': 'Quantity must be a positive integer'}), 400
-    
-    # 检查菜品是否存在
-    dish = Dish.query.get(dish_id)
-    if not dish:
-        return jsonify({'message': 'Dish not found'}), 404
-    
-    # 检查是否已经添加过同样的菜品和规格
-    cart_item = CartItem.query.filter_by(
-        user_id=current_user_id, 
-        dish_id=dish_id,
-        specifications=specifications
-    ).first()
+    error = validate_operation(operation)
+    if error:
+        return jsonify({'message': error}), 400
     
-    if cart_item:
-        # 如果已存在，增加数量
-        cart_item.quantity += quantity
-    else:
-        # 否则创建新的购物车项
-        cart_item = CartItem(
-            user_id=current_user_id,
-            dish_id=dish_id,
-            quantity=quantity,
-            specifications=specifications
-        )
-        db.session.add(cart_item)
-    
-    db.session.commit()
+    # 菜品不存在时返回404；已有同样的菜品和规格时增加数量
+    error = apply_cart_operations(current_user_id, [operation])
+    if error:
+        return error
     
     return jsonify({'message': 'Item added to cart'}), 201
 
+# 用户购物车的响应体（购物车项的菜品一次查询取出）
+def cart_payload(user_id):
+    return serialize_cart(cart_store.items(user_id))
+
 # 获取用户购物车（需要登录）
-@app.route('/api/cart', methods=['GET'])
+@api.route('/api/cart', methods=['GET'])
 @user_required
-def get_cart():
-    current_user_id = get_jwt_identity()
-    # 将字符串ID转换为整数
-    current_user_id = int(current_user_id)
-    cart_items = CartItem.query.filter_by(user_id=current_user_id).all()
-    
-    return jsonify([{
-        'id': item.id,
-        'dish': {
-            'id': item.dish.id,
-            'name': item.dish.name,
-            'price': item.dish.price,
-            'image_url': item.dish.image_url
-        },
-        'quantity': item.quantity,
-        'specifications': item.specifications
-    } for item in cart_items]), 200
+def get_cart(current_user_id):
+    return json_response(cart_payload(current_user_id))
+
+MAX_CART_OPERATIONS = 100
+
+# 批量修改购物车（需要登录）
+# 请求体：{"operations": [{"op": "add", "dish_id": 1, "quantity": 2, "specifications": ""},
+#                          {"op": "update", "id": 5, "quantity": 3}, {"op": "remove", "id": 6}]}
+# 按顺序执行，任一操作失败则全部不生效；成功时返回修改后的购物车
+@api.route('/api/cart', methods=['PATCH'])
+@stick_to_primary
+@user_required
+def patch_cart(current_user_id):
+    data = request.get_json(silent=True)
+    operations = data.get('operations') if isinstance(data, dict) else data
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'message': 'operations must be a non-empty list'}), 400
+    if len(operations) > MAX_CART_OPERATIONS:
+        return jsonify({'message': f'At most {MAX_CART_OPERATIONS} operations per request'}), 400
+    
+    for index, operation in enumerate(operations):
+        error = validate_operation(operation)
+        if error:
+            return jsonify({'message': error, 'index': index}), 400
+    
+    error = apply_cart_operations(current_user_id, operations, with_index=True)
+    if error:
+        return error
+    
+    return json_response(cart_payload(current_user_id))
 
 # 更新购物车项数量（需要登录）
-@app.route('/api/cart/<int:item_id>', methods=['PUT'])
+@api.route('/api/cart/<int:item_id>', methods=['PUT'])
 @user_required
-def update_cart_item(item_id):
-    current_user_id = get_jwt_identity()
-    # 将字符串ID转换为整数
-    current_user_id = int(current_user_id)
+def update_cart_item(item_id, current_user_id):
     data = request.get_json()
-    quantity = data.get('quantity')
+    operation = {'op': 'update', 'id': item_id, 'quantity': data.get('quantity')}
     
-    cart_item = CartItem.query.filter_by(id=item_id, user_id=current_user_id).first_or_404()
+    error = validate_operation(operation)
+    if error:
+        return jsonify({'message': error}), 400
     
-    if quantity <= 0:
-        db.session.delete(cart_item)
-    else:
-        cart_item.quantity = quantity
-    
-    db.session.commit()
+    # 数量小于等于0时删除该项
+    error = apply_cart_operations(current_user_id, [operation])
+    if error:
+        return error
     
     return jsonify({'message': 'Cart updated'}), 200
 
 # 删除购物车项（需要登录）
-@app.route('/api/cart/<int:item_id>', methods=['DELETE'])
+@api.route('/api/cart/<int:item_id>', methods=['DELETE'])
 @user_required
-def delete_cart_item(item_id):
-    current_user_id = get_jwt_identity()
-    # 将字符串ID转换为整数
-    current_user_id = int(current_user_id)
-    cart_item = CartItem.query.filter_by(id=item_id, user_id=current_user_id).first_or_404()
-    
-    db.session.delete(cart_item)
-    db.session.commit()
+def delete_cart_item(item_id, current_user_id):
+    error = apply_cart_operations(current_user_id, [{'op': 'remove', 'id': item_id}])
+    if error:
+        return error
     
     return jsonify({'message': 'Item removed from cart'}), 200
 
-# 创建订单（需要登录）
-@app.route('/api/orders', methods=['POST'])
-@user_required
-def create_order():
-    current_user_id = get_jwt_identity()
-    # 将字符串ID转换为整数
-    current_user_id = int(current_user_id)
-    data = request.get_json()
-    
-    # 获取用户的购物车项
-    cart_items = CartItem.query.filter_by(user_id=current_user_id).all()
-    
-    if not cart_items:
-        return jsonify({'message': 'Cart is empty'}), 400
+# 用取出的购物车条目创建订单并提交；返回 (订单, None)，无法下单时返回 (None, 错误响应)
+def place_order(user_id, cart_items):
+    # 一次查询取出购物车中菜品的当前价格及当日剩余库存（无库存记录时为None，表示不限量）
+    today = date.today()
+    dish_ids = {item['dish_id'] for item in cart_items}
+    dishes = {row.id: row for row in db.session.query(
+        Dish.id, Dish.price, Dish.category_id, DishInventory.remaining
+    ).outerjoin(
+        DishInventory,
+        (DishInventory.dish_id == Dish.id) & (DishInventory.date == today)
+    ).filter(Dish.id.in_(dish_ids), Dish.active())} if dish_ids else {}
+    # 菜品已被删除的购物车项不计入订单
+    cart_rows = [(item, dishes[item['dish_id']]) for item in cart_items if item['dish_id'] in dishes]
+    
+    if not cart_rows:
+        return None, (jsonify({'message': 'Cart is empty'}), 400)
+    
+    # 同一菜品可能以不同规格出现多次，按菜品合并所需数量后检查库存
+    needed = defaultdict(int)
+    remaining = {}
+    for item, dish in cart_rows:
+        if dish.remaining is not None:
+            needed[dish.id] += item['quantity']
+            remaining[dish.id] = dish.remaining
+    sold_out = [dish_id for dish_id, quantity in needed.items() if remaining[dish_id] < quantity]
+    if sold_out:
+        return None, (jsonify({'message': 'Insufficient stock', 'dish_ids': sold_out}), 409)
     
     # 计算总金额
-    total_amount = sum(item.dish.price * item.quantity for item in cart_items)
+    total_amount = sum(dish.price * item['quantity'] for item, dish in cart_rows)
+    
+    # 扣减库存：带条件的更新，若并发下单已把库存扣完则整单回滚
+    for dish_id, quantity in needed.items():
+        updated = DishInventory.query.filter(
+            DishInventory.dish_id == dish_id,
+            DishInventory.date == today,
+            DishInventory.remaining >= quantity
+        ).update({DishInventory.remaining: DishInventory.remaining - quantity}, synchronize_session=False)
+        if not updated:
+            return None, (jsonify({'message': 'Insufficient stock', 'dish_ids': [dish_id]}), 409)
     
     # 创建订单
-    order = Order(user_id=current_user_id, total_amount=total_amount)
+    order = Order(user_id=user_id, total_amount=total_amount, created_at=datetime.utcnow())
     db.session.add(order)
     db.session.flush()  # 获取order.id
     
-    # 创建订单项
-    for item in cart_items:
-        order_item = OrderItem(
-            order_id=order.id,
-            dish_id=item.dish_id,
-            quantity=item.quantity,
-            price=item.dish.price,
-            specifications=item.specifications
-        )
-        db.session.add(order_item)
-    
-    # 清空购物车
-    for item in cart_items:
-        db.session.delete(item)
+    # 批量创建订单项
+    db.session.execute(OrderItem.__table__.insert(), [{
+        'order_id': order.id,
+        'dish_id': dish.id,
+        'quantity': item['quantity'],
+        'price': dish.price,
+        'specifications': item['specifications']
+    } for item, dish in cart_rows])
     
+    # 在同一事务中累加销售汇总
+    analytics.record_order(order.created_at, order.status, [
+        (dish.id, dish.category_id, item['quantity'], dish.price) for item, dish in cart_rows
+    ])
     db.session.commit()
+    return order, None
+
+# 创建订单（需要登录）
+@api.route('/api/orders', methods=['POST'])
+@user_required
+def create_order(current_user_id):
+    # 从购物车存储中原子地取出购物车（与订单在同一事务中从 CartItem 删除），
+    # 并发的第二次结算只会取到空购物车
+    try:
+        cart_items = cart_store.take(current_user_id)
+    except CartChanged:
+        db.session.rollback()
+        return jsonify({'message': 'Cart changed during checkout, please retry'}), 409
+    
+    # 订单提交之前的任何失败（包括未预期的异常）：回滚并把购物车放回
+    def abort_checkout():
+        db.session.rollback()
+        cart_store.restore(current_user_id, cart_items)
+    
+    try:
+        order, error = place_order(current_user_id, cart_items)
+    except Exception:
+        abort_checkout()
+        raise
+    if error:
+        abort_checkout()
+        return error
+    
+    # 推送给下单用户和管理员（与管理员订单列表的结构相同）
+    order_events.order_created(serialize_orders(
+        order_rows(include_user=True).filter(Order.id == order.id).all(), include_user=True)[0])
     
     return jsonify({
         'message': 'Order created successfully',
         'order_id': order.id
     }), 201
 
-# 获取用户订单列表（需要登录）
-@app.route('/api/orders', methods=['GET'])
-@user_required
-def get_orders():
-    current_user_id = get_jwt_identity()
-    # 将字符串ID转换为整数
-    current_user_id = int(current_user_id)
-    orders = Order.query.filter_by(user_id=current_user_id).all()
+ORDER_STATUSES = ('pending', 'confirmed', 'delivered')
+
+# 解析日期范围参数：支持 YYYY-MM-DD 或完整的 ISO 时间，仅给出日期的结束时间包含当天
+def parse_date_range(args):
+    try:
+        start = datetime.fromisoformat(args['start']) if args.get('start') else None
+        end = datetime.fromisoformat(args['end']) if args.get('end') else None
+    except ValueError:
+        raise InvalidPageRequest('start and end must be ISO dates')
+    if end is not None and len(args['end']) == 10:
+        end += timedelta(days=1)
+    return start, end
+
+# 订单筛选：status、start/end；model 为 Order 或 OrderArchive
+def filter_orders(query, args, model=Order):
+    status = args.get('status')
+    if status:
+        if status not in ORDER_STATUSES:
+            raise InvalidPageRequest('Invalid status')
+        query = query.filter(model.status == status)
+    
+    start, end = parse_date_range(args)
+    if start is not None:
+        query = query.filter(model.created_at >= start)
+    if end is not None:
+        query = query.filter(model.created_at < end)
+    return query
+
+# 订单列表的筛选与按下单时间倒序的键集游标条件
+def order_query(query, args, model=Order):
+    query = filter_orders(query, args, model)
     
-    return jsonify([{
-        'id': order.id,
-        'total_amount': order.total_amount,
-        'status': order.status,
-        'created_at': order.created_at.isoformat() if order.created_at else None,
-        'items': [{
-            'dish': {
-                'id': item.dish.id,
-                'name': item.dish.name,
-                'price': item.dish.price
-            },
-            'quantity': item.quantity,
-            'price': item.price,
-            'specifications': item.specifications
-        } for item in order.order_items]
-    } for order in orders]), 200
+    cursor = args.get('cursor')
+    if cursor:
+        values = decode_cursor(cursor, 'orders')
+        try:
+            created_at = datetime.fromisoformat(values[0])
+        except (ValueError, TypeError, IndexError):
+            raise InvalidPageRequest('Invalid cursor')
+        if len(values) != 2 or not isinstance(values[1], int):
+            raise InvalidPageRequest('Invalid cursor')
+        query = query.filter(keyset_after(model.created_at, model.id, created_at, values[1], descending=True))
+    
+    return query.order_by(model.created_at.desc(), model.id.desc())
+
+# 订单列表的筛选与按下单时间倒序的键集分页
+def query_orders(query, args, limit=None, model=Order):
+    query = order_query(query, args, model)
+    
+    if limit is None:
+        return query.all(), None
+    
+    orders = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(orders) > limit:
+        orders = orders[:limit]
+        last = orders[-1]
+        next_cursor = encode_cursor('orders', last.created_at.isoformat(), last.id)
+    return orders, next_cursor
+
+# 合并归档订单：热表的当前页已经查出，只在这一页可能包含归档订单时才查询归档表
+# （状态筛选与时间范围见 archive.newest_matching；热表已满一页且最后一个订单比最新的归档订单还新时也不需要）。
+# 归档表用同样的游标取一页，与热表的结果按下单时间合并；返回 (订单, next_cursor, 归档订单ID)
+def merge_archived_orders(orders, next_cursor, args, limit, user_id=None, include_user=False):
+    start, _ = parse_date_range(args)
+    newest = archive.newest_matching(args.get('status'), start)
+    if newest is None:
+        return orders, next_cursor, set()
+    if limit is not None and len(orders) == limit and orders[-1].created_at > newest:
+        # 归档订单都在后面的页中
+        last = orders[-1]
+        return orders, encode_cursor('orders', last.created_at.isoformat(), last.id), set()
+    
+    archived, archived_next = query_orders(archive.order_rows(user_id), args, limit, OrderArchive)
+    # 归档中途失败时订单可能同时在两边，以热表为准
+    archived_ids = {row.id for row in archived}
+    if archived_ids:
+        archived_ids -= {row[0] for row in db.session.query(Order.id).filter(Order.id.in_(archived_ids))}
+    archived = [row for row in archived if row.id in archived_ids]
+    if include_user:
+        archived = archive.with_usernames(archived)
+    
+    merged = sorted(list(orders) + archived, key=lambda row: (row.created_at or datetime.min, row.id),
+                    reverse=True)
+    if limit is not None and (len(merged) > limit or next_cursor or archived_next):
+        merged = merged[:limit]
+        last = merged[-1]
+        next_cursor = encode_cursor('orders', last.created_at.isoformat(), last.id)
+    else:
+        next_cursor = None
+    return merged, next_cursor, archived_ids & {row.id for row in merged}
+
+# 按请求参数返回订单列表；传入 limit 或 cursor 时返回 {items, next_cursor}
+def order_list_response(user_id=None, include_user=False):
+    paginated = 'limit' in request.args or 'cursor' in request.args
+    query = order_rows(include_user)
+    if user_id is not None:
+        query = query.filter(Order.user_id == user_id)
+    try:
+        limit = parse_limit(request.args.get('limit')) if paginated else None
+        orders, next_cursor = query_orders(query, request.args, limit)
+        orders, next_cursor, archived_ids = merge_archived_orders(
+            orders, next_cursor, request.args, limit, user_id, include_user)
+    except InvalidPageRequest as e:
+        return jsonify({'message': str(e)}), 400
+    
+    # 订单项及其菜品按订单ID一次查询
+    order_list = serialize_orders(orders, include_user, archived_ids)
+    if paginated:
+        return json_response({'items': order_list, 'next_cursor': next_cursor})
+    return json_response(order_list)
+
+# 获取用户订单列表（需要登录），支持 status、start/end 筛选和分页
+@api.route('/api/orders', methods=['GET'])
+@user_required
+def get_orders(current_user_id):
+    return order_list_response(user_id=current_user_id)
+
+# 事件流令牌：EventSource 不能设置请求头，事件流只接受通过查询参数 token 传递的短期令牌
+# （EVENTS_TOKEN_EXPIRES 秒内有效，不能用于其他接口），访问令牌不会出现在 URL 和访问日志中。
+# 同时返回频道当前的最后事件ID：客户端先取令牌、再加载订单列表，然后以它作为 last_event_id 建立事件流，
+# 加载期间产生的事件会补发
+def event_stream_token(user_id, channel):
+    token = create_access_token(
+        identity=str(user_id),
+        additional_claims={'ver': get_jwt().get('ver', 1), 'scope': EVENTS_TOKEN_SCOPE},
+        expires_delta=timedelta(seconds=order_events.token_expires)
+    )
+    return jsonify({'token': token, 'last_event_id': order_events.last_id(channel)}), 200
+
+# 订单事件流（Server-Sent Events），重连时从 Last-Event-ID 头（或 last_event_id 参数）之后继续推送
+def order_event_stream(channel):
+    if not order_events.acquire_stream():
+        response = jsonify({'message': 'Too many event streams, please retry shortly'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    response = Response(order_events.stream(channel, last_event_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # 关闭 Nginx 的响应缓冲
+    response.call_on_close(order_events.release_stream)
+    return response
+
+# 当前用户订单事件流的令牌
+@api.route('/api/orders/events/token', methods=['POST'])
+@user_required
+def get_order_events_token(current_user_id):
+    return event_stream_token(current_user_id, user_channel(current_user_id))
+
+# 当前用户的订单事件：order_created、order_status、reset（需重新加载订单列表）
+@api.route('/api/orders/events', methods=['GET'])
+@jwt_required(locations=['query_string'])
+def get_order_events():
+    user, error = resolve_current_user(EVENTS_TOKEN_SCOPE)
+    if error:
+        return error
+    return order_event_stream(user_channel(user[0]))
 
 # 添加评论（需要登录）
-@app.route('/api/dishes/<int:dish_id>/reviews', methods=['POST'])
+@api.route('/api/dishes/<int:dish_id>/reviews', methods=['POST'])
+@stick_to_primary
 @user_required
-def add_review(dish_id):
-    current_user_id = get_jwt_identity()
-    # 将字符串ID转换为整数
-    current_user_id = int(current_user_id)
+def add_review(dish_id, current_user_id):
     data = request.get_json()
     
     # 检查参数
@@ -416,7 +904,7 @@ def add_review(dish_id):
         return jsonify({'message': 'Rating must be an integer between 1 and 5'}), 400
     
     # 检查菜品是否存在
-    dish = Dish.query.get(dish_id)
+    dish = Dish.query.filter(Dish.id == dish_id, Dish.active()).first()
     if not dish:
         return jsonify({'message': 'Dish not found'}), 404
     
@@ -429,25 +917,27 @@ def add_review(dish_id):
     )
     
     db.session.add(review)
+    # 在同一事务中更新菜品评分聚合
+    Dish.query.filter_by(id=dish_id).update({
+        Dish.rating_sum: Dish.rating_sum + rating,
+        Dish.rating_count: Dish.rating_count + 1,
+        Dish.rating_avg: (Dish.rating_sum + rating) * 1.0 / (Dish.rating_count + 1),
+        Dish.rating_count_column(rating): Dish.rating_count_column(rating) + 1
+    }, synchronize_session=False)
     db.session.commit()
+    menu_cache.bump()
     
     return jsonify({'message': 'Review added successfully'}), 201
 
 # 管理员：获取所有菜品
-@app.route('/api/admin/dishes', methods=['GET'])
+@api.route('/api/admin/dishes', methods=['GET'])
 @admin_required
 def admin_get_dishes():
-    dishes = Dish.query.all()
-    return jsonify([{
-        'id': dish.id,
-        'name': dish.name,
-        'description': dish.description,
-        'price': dish.price,
-        'image_url': dish.image_url
-    } for dish in dishes]), 200
+    dishes = dish_rows().order_by(Dish.id)
+    return json_response([serialize_admin_dish(row) for row in dishes])
 
 # 管理员：创建菜品
-@app.route('/api/admin/dishes', methods=['POST'])
+@api.route('/api/admin/dishes', methods=['POST'])
 @admin_required
 def admin_create_dish():
     data = request.get_json()
@@ -466,33 +956,83 @@ def admin_create_dish():
     )
     
     db.session.add(dish)
+    db.session.flush()  # 获取dish.id
+    search.index_dish(dish)
     db.session.commit()
-    
-    # 获取分类信息
-    category_info = None
-    if dish.category:
-        category_info = {
-            'id': dish.category.id,
-            'name': dish.category.name
-        }
+    menu_cache.bump()
     
     return jsonify({
         'message': 'Dish created successfully',
-        'dish': {
-            'id': dish.id,
-            'name': dish.name,
-            'description': dish.description,
-            'price': dish.price,
-            'image_url': dish.image_url,
-            'category': category_info
-        }
+        'dish': serialize_admin_dish(dish_rows().filter(Dish.id == dish.id).one())
     }), 201
 
+# 管理员：批量导入菜品。文件通过 multipart 的 file 字段上传，或直接作为请求体（Content-Type 为 text/csv、
+# application/x-ndjson 或 application/json）。参数：format=csv|ndjson|json、key=id|name（没有 id 的行按名称匹配已有菜品）、
+# create_categories=1（自动创建不存在的分类）、on_error=abort|skip、dry_run=1（只校验）。
+# 所有行在同一事务中写入：on_error=abort（默认）时任何一行有错误都不写入，skip 时跳过错误行；返回逐行错误报告
+@api.route('/api/admin/dishes/import', methods=['POST'])
+@admin_required
+def admin_import_dishes():
+    on_error = request.args.get('on_error', 'abort')
+    if on_error not in ('abort', 'skip'):
+        return jsonify({'message': 'on_error must be abort or skip'}), 400
+    dry_run = request.args.get('dry_run') in ('1', 'true')
+    
+    upload = request.files.get('file')
+    try:
+        if upload is not None:
+            file_format = dish_import.detect_format(request.args.get('format'), upload.filename, upload.mimetype)
+            stream = upload.stream
+        else:
+            file_format = dish_import.detect_format(request.args.get('format'), None, request.mimetype)
+            stream = request.stream
+        importer = dish_import.DishImporter(
+            key=request.args.get('key', 'id'),
+            create_categories=request.args.get('create_categories') in ('1', 'true')
+        )
+        for number, record, error in dish_import.read_records(stream, file_format):
+            importer.add(number, record, error)
+        importer.finish()
+    except dish_import.ImportFileError as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 400
+    
+    report = importer.report()
+    if dry_run or (importer.error_count and on_error == 'abort'):
+        db.session.rollback()
+        report['committed'] = False
+        if not dry_run:
+            return jsonify(dict(report, message='Import aborted, no dishes were changed')), 400
+        return jsonify(report), 200
+    
+    db.session.commit()
+    if importer.created or importer.updated or importer.created_categories:
+        menu_cache.bump()
+    report['committed'] = True
+    return jsonify(report), 200
+
+# 管理员：流式导出菜品（format=csv|ndjson），列与导入相同
+@api.route('/api/admin/dishes/export', methods=['GET'])
+@admin_required
+def admin_export_dishes():
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'message': 'Format must be ndjson or csv'}), 400
+    
+    rows = dish_import.export_rows()
+    if export_format == 'csv':
+        generate, filename, mimetype = dish_import.export_csv(rows), 'dishes.csv', 'text/csv'
+    else:
+        generate, filename, mimetype = dish_import.export_ndjson(rows), 'dishes.ndjson', 'application/x-ndjson'
+    return Response(stream_with_context(generate), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename={filename}'
+    })
+
 # 管理员：更新菜品
-@app.route('/api/admin/dishes/<int:dish_id>', methods=['PUT'])
+@api.route('/api/admin/dishes/<int:dish_id>', methods=['PUT'])
 @admin_required
 def admin_update_dish(dish_id):
-    dish = Dish.query.get_or_404(dish_id)
+    dish = Dish.query.filter(Dish.id == dish_id, Dish.active()).first_or_404()
     data = request.get_json()
     
     dish.name = data.get('name', dish.name)
@@ -501,88 +1041,274 @@ def admin_update_dish(dish_id):
     dish.image_url = data.get('image_url', dish.image_url)
     dish.category_id = data.get('category_id', dish.category_id)
     
+    search.index_dish(dish)
     db.session.commit()
-    
-    # 获取分类信息
-    category_info = None
-    if dish.category:
-        category_info = {
-            'id': dish.category.id,
-            'name': dish.category.name
-        }
+    menu_cache.bump()
     
     return jsonify({
         'message': 'Dish updated successfully',
-        'dish': {
-            'id': dish.id,
-            'name': dish.name,
-            'description': dish.description,
-            'price': dish.price,
-            'image_url': dish.image_url,
-            'category': category_info
-        }
+        'dish': serialize_admin_dish(dish_rows().filter(Dish.id == dish.id).one())
     }), 200
 
-# 管理员：删除菜品
-@app.route('/api/admin/dishes/<int:dish_id>', methods=['DELETE'])
+# 管理员：删除菜品（软删除）。菜品从菜单、搜索和购物车中移除，库存记录删除；
+# 历史订单项与评论保留，订单中仍显示该菜品的名称
+@api.route('/api/admin/dishes/<int:dish_id>', methods=['DELETE'])
 @admin_required
 def admin_delete_dish(dish_id):
-    dish = Dish.query.get_or_404(dish_id)
+    dish = Dish.query.filter(Dish.id == dish_id, Dish.active()).first_or_404()
     
-    # 删除相关的购物车项、订单项和评论
-    CartItem.query.filter_by(dish_id=dish_id).delete()
-    OrderItem.query.filter_by(dish_id=dish_id).delete()
-    Review.query.filter_by(dish_id=dish_id).delete()
+    cart_store.remove_dish(dish_id)
+    DishInventory.query.filter_by(dish_id=dish_id).delete()
     
-    db.session.delete(dish)
+    dish.deleted_at = datetime.utcnow()
+    search.remove_dish(dish_id)
     db.session.commit()
+    menu_cache.bump()
     
     return jsonify({'message': 'Dish deleted successfully'}), 200
 
-# 管理员：获取所有订单
-@app.route('/api/admin/orders', methods=['GET'])
+# 管理员：设置菜品某天的库存（remaining 为 null 时取消限量，date 默认为当天）
+@api.route('/api/admin/dishes/<int:dish_id>/inventory', methods=['PUT'])
 @admin_required
-def admin_get_orders():
-    orders = Order.query.all()
+def admin_set_dish_inventory(dish_id):
+    Dish.query.filter(Dish.id == dish_id, Dish.active()).first_or_404()
+    data = request.get_json()
     
-    return jsonify([{
-        'id': order.id,
-        'user': {
-            'id': order.user.id,
-            'username': order.user.username
-        },
-        'total_amount': order.total_amount,
-        'status': order.status,
-        'created_at': order.created_at.isoformat() if order.created_at else None,
-        'items': [{
-            'dish': {
-                'id': item.dish.id,
-                'name': item.dish.name,
-                'price': item.dish.price
-            },
-            'quantity': item.quantity,
-            'price': item.price,
-            'specifications': item.specifications
-        } for item in order.order_items]
-    } for order in orders]), 200
+    if not data or 'remaining' not in data:
+        return jsonify({'message': 'Remaining stock is required'}), 400
+    
+    remaining = data.get('remaining')
+    if remaining is not None and (not isinstance(remaining, int) or remaining < 0):
+        return jsonify({'message': 'Remaining stock must be a non-negative integer'}), 400
+    
+    try:
+        day = date.fromisoformat(data['date']) if data.get('date') else date.today()
+    except (ValueError, TypeError):
+        return jsonify({'message': 'Date must be in YYYY-MM-DD format'}), 400
+    
+    inventory = DishInventory.query.filter_by(dish_id=dish_id, date=day).first()
+    if remaining is None:
+        if inventory:
+            db.session.delete(inventory)
+    elif inventory:
+        inventory.remaining = remaining
+    else:
+        db.session.add(DishInventory(dish_id=dish_id, date=day, remaining=remaining))
+    db.session.commit()
+    
+    return jsonify({
+        'message': 'Inventory updated successfully',
+        'inventory': {
+            'dish_id': dish_id,
+            'date': day.isoformat(),
+            'remaining': remaining
+        }
+    }), 200
+
+# 管理员：获取所有订单，支持 status、start/end 筛选和分页
+@api.route('/api/admin/orders', methods=['GET'])
+@admin_required
+def admin_get_orders():
+    return order_list_response(include_user=True)
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# 管理员：流式导出订单（format=ndjson|csv，支持 status、start/end 筛选）
+# 使用服务端游标分批读取并逐行输出，内存占用与订单总量无关；筛选条件可能包含归档订单时在热表之后导出归档订单
+@api.route('/api/admin/orders/export', methods=['GET'])
+@admin_required
+def admin_export_orders():
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'message': 'Format must be ndjson or csv'}), 400
+    
+    query = db.session.query(
+        Order.id, Order.user_id, User.username, Order.status, Order.total_amount, Order.created_at,
+        OrderItem.dish_id, Dish.name, OrderItem.quantity, OrderItem.price, OrderItem.specifications
+    ).join(User, Order.user_id == User.id) \
+        .join(OrderItem, OrderItem.order_id == Order.id) \
+        .outerjoin(Dish, OrderItem.dish_id == Dish.id)
+    try:
+        query = filter_orders(query, request.args)
+        start, _ = parse_date_range(request.args)
+        archived_query = None
+        if archive.newest_matching(request.args.get('status'), start) is not None:
+            archived_query = filter_orders(archive.export_query(), request.args, OrderArchive)
+    except InvalidPageRequest as e:
+        return jsonify({'message': str(e)}), 400
+    rows = query.order_by(Order.id, OrderItem.id) \
+        .execution_options(stream_results=True).yield_per(EXPORT_BATCH_SIZE)
+    if archived_query is not None:
+        rows = itertools.chain(rows, archive.export_rows(archived_query, EXPORT_BATCH_SIZE))
+    
+    generate = export_orders_csv(rows) if export_format == 'csv' else export_orders_ndjson(rows)
+    filename = 'orders.csv' if export_format == 'csv' else 'orders.ndjson'
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(generate), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename={filename}'
+    })
+
+# 每个订单输出一行 JSON，订单项嵌套在 items 中（行按订单ID有序，逐个订单聚合）
+def export_orders_ndjson(rows):
+    lines = []
+    size = 0
+    current = None
+    for row in rows:
+        if current is None or current['id'] != row[0]:
+            if current is not None:
+                lines.append(json.dumps(current) + '\n')
+                size += len(lines[-1])
+                # 积累到一定大小再输出，减少小块写入
+                if size > EXPORT_CHUNK_SIZE:
+                    yield ''.join(lines)
+                    lines = []
+                    size = 0
+            current = {
+                'id': row[0],
+                'user': {'id': row[1], 'username': row[2]},
+                'status': row[3],
+                'total_amount': row[4],
+                'created_at': row[5].isoformat() if row[5] else None,
+                'items': []
+            }
+        current['items'].append({
+            'dish': {'id': row[6], 'name': row[7]},
+            'quantity': row[8],
+            'price': row[9],
+            'specifications': row[10]
+        })
+    if current is not None:
+        lines.append(json.dumps(current) + '\n')
+    yield ''.join(lines)
+
+# 每个订单项输出一行 CSV
+def export_orders_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([
+        'order_id', 'user_id', 'username', 'status', 'total_amount', 'created_at',
+        'dish_id', 'dish_name', 'quantity', 'price', 'specifications'
+    ])
+    for row in rows:
+        writer.writerow([
+            row[0], row[1], row[2], row[3], row[4], row[5].isoformat() if row[5] else '',
+            row[6], row[7], row[8], row[9], row[10]
+        ])
+        if buffer.tell() > EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
 
 # 管理员：更新订单状态
-@app.route('/api/admin/orders/<int:order_id>/status', methods=['PUT'])
+@api.route('/api/admin/orders/<int:order_id>/status', methods=['PUT'])
 @admin_required
 def admin_update_order_status(order_id):
     order = Order.query.get_or_404(order_id)
     data = request.get_json()
     status = data.get('status')
     
-    if status in ['pending', 'confirmed', 'delivered']:
+    if status in ORDER_STATUSES:
+        previous_status = order.status
+        # 在同一事务中把该订单的销售汇总从原状态移到新状态
+        analytics.move_order_status(order, previous_status, status)
         order.status = status
         db.session.commit()
+        if status != previous_status:
+            order_events.order_status_changed(order.id, order.user_id, status, previous_status)
         return jsonify({'message': 'Order status updated successfully'}), 200
     else:
         return jsonify({'message': 'Invalid status'}), 400
 
+# 管理员：所有订单事件流的令牌
+@api.route('/api/admin/orders/events/token', methods=['POST'])
+@admin_required
+def admin_get_order_events_token():
+    return event_stream_token(get_jwt_identity(), ADMIN_CHANNEL)
+
+# 管理员：所有订单的事件流
+@api.route('/api/admin/orders/events', methods=['GET'])
+@jwt_required(locations=['query_string'])
+def admin_get_order_events():
+    user, error = resolve_current_user(EVENTS_TOKEN_SCOPE)
+    if error:
+        return error
+    if not user[1]:
+        return jsonify({'message': 'Admin access required'}), 403
+    return order_event_stream(ADMIN_CHANNEL)
+
+# 管理员：设置用户角色（is_admin），角色变化时该用户此前签发的令牌全部失效
+# （其他 worker 上同样最迟在 AUTH_CACHE_TTL 秒后生效，见 admin_revoke_user_tokens）
+@api.route('/api/admin/users/<int:user_id>/role', methods=['PUT'])
+@admin_required
+def admin_set_user_role(user_id):
+    user = User.query.get_or_404(user_id)
+    data = request.get_json()
+    if not data or not isinstance(data.get('is_admin'), bool):
+        return jsonify({'message': 'is_admin must be true or false'}), 400
+    
+    if bool(user.is_admin) != data['is_admin']:
+        user.is_admin = data['is_admin']
+        user.revoke_tokens()
+        db.session.commit()
+    
+    return jsonify({'message': 'User role updated successfully'}), 200
+
+# 管理员：撤销用户此前签发的全部令牌（用户需要重新登录）。
+# 处理本请求的 worker 在提交后立即生效；其他 worker 缓存的用户身份最迟在 AUTH_CACHE_TTL 秒（默认60秒）后过期，
+# 在此之前旧令牌在这些 worker 上仍可使用
+@api.route('/api/admin/users/<int:user_id>/revoke-tokens', methods=['POST'])
+@admin_required
+def admin_revoke_user_tokens(user_id):
+    user = User.query.get_or_404(user_id)
+    user.revoke_tokens()
+    db.session.commit()
+    
+    return jsonify({'message': 'Tokens revoked successfully'}), 200
+
+# 管理员：销售统计（基于汇总表，耗时与历史订单量无关）
+# 参数：start/end、status、granularity=hour|day、limit（热销菜品数量）
+@api.route('/api/admin/analytics', methods=['GET'])
+@admin_required
+def admin_analytics():
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in analytics.GRANULARITIES:
+        return jsonify({'message': 'Granularity must be hour or day'}), 400
+    
+    status = request.args.get('status')
+    if status and status not in ORDER_STATUSES:
+        return jsonify({'message': 'Invalid status'}), 400
+    
+    try:
+        start, end = parse_date_range(request.args)
+        limit = parse_limit(request.args.get('limit'), default=10)
+    except InvalidPageRequest as e:
+        return jsonify({'message': str(e)}), 400
+    
+    return jsonify({
+        'top_dishes': analytics.top_dishes(start, end, status, limit),
+        'categories': analytics.category_totals(start, end, status),
+        'revenue': analytics.revenue_series(granularity, start, end, status)
+    }), 200
+
+# 管理员：查看菜单缓存与压缩缓存统计
+@api.route('/api/admin/cache/stats', methods=['GET'])
+@admin_required
+def admin_cache_stats():
+    return jsonify(dict(menu_cache.stats(), compression=compression.stats())), 200
+
+# Prometheus 指标（每个 worker 进程分别统计），配置了 METRICS_TOKEN 时需要 Bearer 令牌
+@api.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    if not metrics.enabled:
+        return jsonify({'message': '未启用监控指标'}), 404
+    if not metrics.authorized():
+        return jsonify({'message': '无权访问监控指标'}), 401
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
 # 管理员：获取所有菜品分类
-@app.route('/api/admin/categories', methods=['GET'])
+@api.route('/api/admin/categories', methods=['GET'])
 @admin_required
 def admin_get_categories():
     categories = Category.query.all()
@@ -593,7 +1319,7 @@ def admin_get_categories():
     } for category in categories]), 200
 
 # 管理员：创建菜品分类
-@app.route('/api/admin/categories', methods=['POST'])
+@api.route('/api/admin/categories', methods=['POST'])
 @admin_required
 def admin_create_category():
     data = request.get_json()
@@ -607,6 +1333,7 @@ def admin_create_category():
     category = Category(name=name, description=description)
     db.session.add(category)
     db.session.commit()
+    menu_cache.bump()
     
     return jsonify({
         'message': '分类创建成功',
@@ -618,7 +1345,7 @@ def admin_create_category():
     }), 201
 
 # 管理员：更新菜品分类
-@app.route('/api/admin/categories/<int:category_id>', methods=['PUT'])
+@api.route('/api/admin/categories/<int:category_id>', methods=['PUT'])
 @admin_required
 def admin_update_category(category_id):
     category = Category.query.get_or_404(category_id)
@@ -626,6 +1353,7 @@ def admin_update_category(category_id):
     
     # 检查分类名称是否已存在（排除自己）
     name = data.get('name')
+    old_name = category.name
     if name and name != category.name:
         if Category.query.filter_by(name=name).first():
             return jsonify({'message': '分类名称已存在'}), 400
@@ -633,7 +1361,11 @@ def admin_update_category(category_id):
     category.name = data.get('name', category.name)
     category.description = data.get('description', category.description)
     
+    # 分类名称参与全文索引，改名时同步更新该分类下的菜品
+    if name and name != old_name:
+        search.reindex_category(category.id)
     db.session.commit()
+    menu_cache.bump()
     
     return jsonify({
         'message': '分类更新成功',
@@ -645,20 +1377,49 @@ def admin_update_category(category_id):
     }), 200
 
 # 管理员：删除菜品分类
-@app.route('/api/admin/categories/<int:category_id>', methods=['DELETE'])
+@api.route('/api/admin/categories/<int:category_id>', methods=['DELETE'])
 @admin_required
 def admin_delete_category(category_id):
     category = Category.query.get_or_404(category_id)
     
-    # 检查是否有菜品关联到该分类
-    dish_count = Dish.query.filter_by(category_id=category_id).count()
+    # 检查是否有菜品关联到该分类（已删除的菜品不计入，删除分类时其分类置空）
+    dish_count = Dish.query.filter(Dish.category_id == category_id, Dish.active()).count()
     if dish_count > 0:
         return jsonify({'message': f'无法删除分类，还有{dish_count}个菜品关联到该分类'}), 400
     
     db.session.delete(category)
     db.session.commit()
+    menu_cache.bump()
     
     return jsonify({'message': '分类删除成功'}), 200
 
+# 应用工厂：只加载配置并初始化扩展，不访问数据库、不计算密码哈希，worker 可以快速启动。
+# 建表与初始数据由 init-db / seed 命令完成
+def create_app(config=None):
+    app = Flask(__name__)
+    # 配置见 config.py，可通过环境变量或 FOOD_DELIVERY_SETTINGS 配置文件覆盖
+    load_config(app, config)
+    
+    db.init_app(app)
+    # 最先注册，after_request 最后执行，统计的耗时与响应大小包含压缩
+    metrics.init_app(app)
+    jwt.init_app(app)
+    cors.init_app(app)
+    menu_cache.init_app(app)
+    auth_cache.init_app(app)
+    password_hasher.init_app(app)
+    cart_store.init_app(app)
+    compression.init_app(app)
+    order_events.init_app(app)
+    app.register_blueprint(api)
+    return app
+
+# 供 Gunicorn（app:app）和 flask 命令使用
+app = create_app()
+
 if __name__ == '__main__':
+    # 开发服务器：首次运行时自动建表并写入初始数据
+    with app.app_context():
+        init_db()
+        seed_db()
     app.run(debug=True)
\ No newline at end of file
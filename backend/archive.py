@@ -0,0 +1,184 @@
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from models import db, User, Dish, Order, OrderItem, OrderArchive, OrderItemArchive
+
+# 订单冷热分离：超过 ARCHIVE_AFTER_DAYS 天的已送达订单按批从 Order/OrderItem（热表）移到 OrderArchive/OrderItemArchive，
+# 热表只保留近期和未完成的订单。归档订单只读，订单ID不变。
+# 订单列表只在可能包含归档订单时才查询归档表：状态筛选不是 delivered、时间范围的起点晚于最新的归档订单，
+# 或热表已经能填满一页且这一页的最后一个订单比最新的归档订单还新时，不访问归档表。
+
+ARCHIVED_STATUS = 'delivered'
+
+ArchivedOrderRow = namedtuple('ArchivedOrderRow', 'id total_amount status created_at user_id username')
+ArchivedItemRow = namedtuple('ArchivedItemRow', 'order_id dish_id name price quantity item_price specifications')
+
+
+def _chunks(values, size):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+# 把一批订单（含订单项）复制到归档表后从热表删除。
+# 两步分别提交（归档表可能在另一个数据库中）：中途失败时订单同时存在于两边，
+# 再次执行时跳过已归档的订单并完成删除；读取时以热表为准
+def _archive_batch(order_ids):
+    orders = db.session.query(Order.id, Order.user_id, Order.total_amount, Order.status, Order.created_at) \
+        .filter(Order.id.in_(order_ids)).all()
+    items = db.session.query(OrderItem.id, OrderItem.order_id, OrderItem.dish_id, OrderItem.quantity,
+                             OrderItem.price, OrderItem.specifications) \
+        .filter(OrderItem.order_id.in_(order_ids)).all()
+
+    archived = {row[0] for row in db.session.query(OrderArchive.id).filter(OrderArchive.id.in_(order_ids))}
+    now = datetime.utcnow()
+    new_orders = [dict(row._asdict(), archived_at=now) for row in orders if row.id not in archived]
+    if new_orders:
+        db.session.execute(OrderArchive.__table__.insert(), new_orders)
+        db.session.execute(OrderItemArchive.__table__.insert(),
+                           [row._asdict() for row in items if row.order_id not in archived])
+    db.session.commit()
+
+    OrderItem.query.filter(OrderItem.order_id.in_(order_ids)).delete(synchronize_session=False)
+    Order.query.filter(Order.id.in_(order_ids)).delete(synchronize_session=False)
+    db.session.commit()
+    return len(orders), len(items)
+
+
+# 归档 older_than_days 天前的已送达订单；返回 (订单数, 订单项数)。
+# 销售汇总表不受影响（汇总的是全部历史订单）
+def archive_orders(older_than_days=None, batch_size=None, pause=None, max_batches=None, progress=None):
+    config = current_app.config
+    older_than_days = config['ARCHIVE_AFTER_DAYS'] if older_than_days is None else older_than_days
+    batch_size = batch_size or config['ARCHIVE_BATCH_SIZE']
+    pause = config['ARCHIVE_BATCH_PAUSE'] if pause is None else pause
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+
+    # SQLite 的整数主键会复用最大的ID：始终保留ID最大的订单，新订单的ID不会与归档订单重复
+    newest_id = db.session.query(db.func.max(Order.id)).scalar()
+    totals = [0, 0]
+    batches = 0
+    last_id = 0
+    while newest_id is not None and (max_batches is None or batches < max_batches):
+        order_ids = [row[0] for row in db.session.query(Order.id).filter(
+            Order.status == ARCHIVED_STATUS,
+            Order.created_at < cutoff,
+            Order.id > last_id,
+            Order.id < newest_id
+        ).order_by(Order.id).limit(batch_size)]
+        if not order_ids:
+            break
+        orders, items = _archive_batch(order_ids)
+        totals[0] += orders
+        totals[1] += items
+        batches += 1
+        last_id = order_ids[-1]
+        if progress:
+            progress(totals[0], totals[1])
+        # 批之间暂停，让请求中的写操作获得写锁
+        if pause:
+            time.sleep(pause)
+    return tuple(totals)
+
+
+# 最新的归档订单的下单时间；没有归档订单时为 None
+def newest_archived_at():
+    return db.session.query(db.func.max(OrderArchive.created_at)).scalar()
+
+
+# 按状态筛选与时间范围的起点判断是否可能存在符合条件的归档订单：
+# 可能存在时返回最新的归档订单的下单时间，否则返回 None（状态筛选排除归档订单时不查询）
+def newest_matching(status, start):
+    if status and status != ARCHIVED_STATUS:
+        return None
+    newest = newest_archived_at()
+    if newest is None or (start is not None and start > newest):
+        return None
+    return newest
+
+
+def order_rows(user_id=None):
+    query = db.session.query(OrderArchive.id, OrderArchive.total_amount, OrderArchive.status,
+                             OrderArchive.created_at, OrderArchive.user_id)
+    if user_id is not None:
+        query = query.filter(OrderArchive.user_id == user_id)
+    return query
+
+
+# 归档表不能与主库联表：用户名按用户ID一次查询
+def with_usernames(rows):
+    user_ids = {row.user_id for row in rows}
+    usernames = dict(db.session.query(User.id, User.username).filter(User.id.in_(user_ids))) if user_ids else {}
+    return [ArchivedOrderRow(row.id, row.total_amount, row.status, row.created_at, row.user_id,
+                             usernames.get(row.user_id)) for row in rows]
+
+
+# 归档订单的订单项，菜品名称与当前价格按菜品ID一次查询（已删除的菜品同样可以查到）
+def item_rows(order_ids):
+    items = db.session.query(OrderItemArchive.order_id, OrderItemArchive.dish_id, OrderItemArchive.quantity,
+                             OrderItemArchive.price, OrderItemArchive.specifications) \
+        .filter(OrderItemArchive.order_id.in_(order_ids)) \
+        .order_by(OrderItemArchive.id).all()
+    dish_ids = {item.dish_id for item in items}
+    dishes = {row.id: row for row in db.session.query(Dish.id, Dish.name, Dish.price)
+              .filter(Dish.id.in_(dish_ids))} if dish_ids else {}
+    rows = []
+    for item in items:
+        dish = dishes.get(item.dish_id)
+        rows.append(ArchivedItemRow(item.order_id, item.dish_id, dish.name if dish else None,
+                                    dish.price if dish else None, item.quantity, item.price,
+                                    item.specifications))
+    return rows
+
+
+# 订单导出的归档部分：与热表导出的行结构相同
+# (订单ID, 用户ID, 用户名, 状态, 金额, 下单时间, 菜品ID, 菜品名称, 数量, 单价, 规格)
+def export_rows(query, batch_size=1000):
+    rows = query.join(OrderItemArchive, OrderItemArchive.order_id == OrderArchive.id) \
+        .order_by(OrderArchive.id, OrderItemArchive.id) \
+        .execution_options(stream_results=True).yield_per(batch_size)
+    usernames = {}
+    dish_names = {}
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield from _resolve_export_batch(batch, usernames, dish_names)
+            batch = []
+    yield from _resolve_export_batch(batch, usernames, dish_names)
+
+
+def export_query():
+    return db.session.query(
+        OrderArchive.id, OrderArchive.user_id, OrderArchive.status, OrderArchive.total_amount,
+        OrderArchive.created_at, OrderItemArchive.dish_id, OrderItemArchive.quantity, OrderItemArchive.price,
+        OrderItemArchive.specifications
+    )
+
+
+def _resolve_export_batch(batch, usernames, dish_names):
+    missing_users = {row[1] for row in batch} - usernames.keys()
+    for user_ids in _chunks(missing_users, 500):
+        usernames.update(db.session.query(User.id, User.username).filter(User.id.in_(user_ids)))
+    missing_dishes = {row[5] for row in batch} - dish_names.keys()
+    for dish_ids in _chunks(missing_dishes, 500):
+        dish_names.update(db.session.query(Dish.id, Dish.name).filter(Dish.id.in_(dish_ids)))
+    for order_id, user_id, status, total_amount, created_at, dish_id, quantity, price, specifications in batch:
+        yield (order_id, user_id, usernames.get(user_id), status, total_amount, created_at,
+               dish_id, dish_names.get(dish_id), quantity, price, specifications)
+
+
+# 销售汇总回填的归档部分：(订单ID, 下单时间, 状态, 菜品ID, 分类ID, 数量, 单价)，分类按菜品一次查询
+def backfill_rows(batch_size=1000):
+    categories = dict(db.session.query(Dish.id, Dish.category_id))
+    rows = db.session.query(
+        OrderArchive.id, OrderArchive.created_at, OrderArchive.status,
+        OrderItemArchive.dish_id, OrderItemArchive.quantity, OrderItemArchive.price
+    ).join(OrderItemArchive, OrderItemArchive.order_id == OrderArchive.id) \
+        .filter(OrderArchive.created_at.isnot(None)) \
+        .order_by(OrderArchive.id).yield_per(batch_size)
+    for order_id, created_at, status, dish_id, quantity, price in rows:
+        yield order_id, created_at, status, dish_id, categories.get(dish_id), quantity, price
@@ -0,0 +1,97 @@
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from models import User
+from extensions import AppExtension
+
+
+# 已认证用户的身份缓存：user_id -> (is_admin, token_version)，带过期时间。
+# 命中时鉴权无需查询 User 表；用户被修改或删除时在事务提交后失效（本进程），
+# 其他 worker 最迟在 TTL 到期后读取到新状态。
+class UserAuthCache:
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.ttl = 60
+        self.max_entries = 10000
+        self.hits = 0
+        self.misses = 0
+        # 失效次数；查询数据库期间发生过失效时不写入缓存，避免写入提交前读到的旧状态
+        self._evictions = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('AUTH_CACHE_TTL', 60)
+        app.config.setdefault('AUTH_CACHE_MAX_ENTRIES', 10000)
+        self.ttl = app.config['AUTH_CACHE_TTL']
+        self.max_entries = app.config['AUTH_CACHE_MAX_ENTRIES']
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[2] <= now:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def set(self, user_id, is_admin, token_version, evictions=None):
+        now = time.monotonic()
+        with self._lock:
+            if evictions is not None and evictions != self._evictions:
+                return
+            if len(self._entries) >= self.max_entries:
+                # 容量满时先清理过期条目，仍然满则整体清空
+                self._entries = {key: value for key, value in self._entries.items() if value[2] > now}
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+            self._entries[user_id] = (bool(is_admin), token_version, now + self.ttl)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._evictions += 1
+            self._entries.pop(user_id, None)
+
+    # 返回 (is_admin, token_version)；用户不存在时返回 None
+    def resolve(self, user_id):
+        entry = self.get(user_id)
+        if entry is not None:
+            return entry
+        evictions = self._evictions
+        user = User.query.get(user_id)
+        if user is None:
+            return None
+        self.set(user_id, user.is_admin, user.token_version, evictions)
+        return bool(user.is_admin), user.token_version
+
+
+auth_cache = AppExtension('auth_cache', UserAuthCache)
+
+
+# flush 时只记录被修改的用户，提交后再失效：提交前其他请求仍会读到旧状态并写回缓存
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _record_user_change(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('auth_cache_changed', set()).add(target.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_users(session):
+    user_ids = session.info.pop('auth_cache_changed', None)
+    # 缓存属于当前应用；没有应用上下文（或应用未启用该扩展）时没有需要失效的缓存
+    if user_ids and has_app_context() and 'auth_cache' in current_app.extensions:
+        for user_id in user_ids:
+            auth_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_user_changes(session):
+    session.info.pop('auth_cache_changed', None)
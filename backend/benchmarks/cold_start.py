@@ -0,0 +1,61 @@
+# 冷启动时间：在新的 Python 进程中导入应用并创建 app，直到处理完第一个请求。
+# 启动路径不访问数据库、不计算密码哈希，目标是远小于1秒；同时给出仅导入 Flask/SQLAlchemy
+# 本身所需的时间作为参照，两者之差即应用自身的启动开销。
+#
+#   cd backend && python -m benchmarks.cold_start --runs 5 --target-ms 1000
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+_PROBE = '''
+import json, time
+started = time.perf_counter()
+from app import create_app
+application = create_app()
+ready = time.perf_counter()
+response = application.test_client().get('/api/dishes?limit=1')
+first = time.perf_counter()
+print(json.dumps({"ready_ms": (ready - started) * 1000, "first_request_ms": (first - started) * 1000,
+                  "status": response.status_code}))
+'''
+
+_FRAMEWORK_PROBE = '''
+import json, time
+started = time.perf_counter()
+import flask, flask_sqlalchemy, flask_jwt_extended, flask_cors
+print(json.dumps({"ready_ms": (time.perf_counter() - started) * 1000}))
+'''
+
+
+def measure(runs, probe=_PROBE):
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-W', 'ignore', '-c', probe],
+                                check=True, capture_output=True, text=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure worker cold-start time')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--target-ms', type=float, default=1000)
+    args = parser.parse_args()
+
+    samples = measure(args.runs)
+    ready = statistics.median(sample['ready_ms'] for sample in samples)
+    first = statistics.median(sample['first_request_ms'] for sample in samples)
+    framework = statistics.median(sample['ready_ms'] for sample in measure(args.runs, _FRAMEWORK_PROBE))
+    print(f'framework imports only: {framework:.0f} ms')
+    print(f'import + create_app: {ready:.0f} ms (median of {args.runs}, app overhead {ready - framework:.0f} ms)')
+    print(f'first request served: {first:.0f} ms (status {samples[-1]["status"]})')
+    if ready > args.target_ms:
+        print(f'FAIL: startup exceeds the {args.target_ms:.0f} ms target')
+        sys.exit(1)
+    print(f'ok: within the {args.target_ms:.0f} ms target')
+
+
+if __name__ == '__main__':
+    main()
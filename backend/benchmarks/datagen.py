@@ -0,0 +1,182 @@
+# 合成餐厅数据：按给定规模生成分类、菜品、用户、评论、订单与订单项，同一个 --seed 生成相同的数据。
+# 评论与订单集中在少数热门菜品上（Zipf 分布），下单时间分布在最近一年内。
+# 所有账户（包括管理员 admin）的密码均为 BENCH_PASSWORD，哈希使用较低的工作因子以免登录成为瓶颈。
+#
+#   cd backend && python -m benchmarks.datagen --database /tmp/bench.db \
+#       --dishes 10000 --users 20000 --reviews 1000000 --order-items 5000000
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import bcrypt
+
+import search
+import analytics
+from models import db, User, Category, Dish, Review, Order, OrderItem, rebuild_dish_ratings
+
+BENCH_PASSWORD = 'benchmark'
+BENCH_BCRYPT_ROUNDS = 4
+BATCH_SIZE = 20000
+
+COMMENTS = ['', '很好吃', '分量足，下次还点', '偏咸了一点', '送餐很快', '一般般', '味道正宗，推荐', '有点凉了']
+ORDER_STATUSES = (('delivered', 80), ('confirmed', 12), ('pending', 8))
+RATINGS = ((5, 40), (4, 35), (3, 15), (2, 5), (1, 5))
+
+
+# 基准应用：与线上相同的 create_app()，指向基准数据库，密码哈希因子与生成的数据一致
+def bench_config(path):
+    return {
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + path,
+        'BCRYPT_LOG_ROUNDS': BENCH_BCRYPT_ROUNDS,
+        'PASSWORD_POOL_WORKERS': 0
+    }
+
+
+def _progress(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def _insert(table, rows):
+    if rows:
+        db.session.execute(table.insert(), rows)
+
+
+# 热门程度服从 Zipf 分布的累计权重，供 random.choices 使用
+def _zipf_weights(count, exponent=1.1):
+    cumulative = []
+    total = 0.0
+    for rank in range(1, count + 1):
+        total += 1.0 / rank ** exponent
+        cumulative.append(total)
+    return cumulative
+
+
+def generate(dishes=10000, users=20000, reviews=1000000, order_items=5000000, categories=20,
+             seed=42, with_analytics=False):
+    rng = random.Random(seed)
+    now = datetime.utcnow().replace(microsecond=0)
+    started = time.perf_counter()
+
+    db.create_all()
+    if Dish.query.first() is not None:
+        raise RuntimeError('The benchmark database already contains data')
+
+    _insert(Category.__table__, [
+        {'id': i + 1, 'name': '分类%d' % (i + 1), 'description': '合成数据分类'} for i in range(categories)
+    ])
+
+    prices = [round(rng.uniform(8, 128), 1) for _ in range(dishes)]
+    _insert(Dish.__table__, [{
+        'id': i + 1,
+        'name': '菜品%d' % (i + 1),
+        'description': '精选食材，现点现做。第%d号招牌菜，口味%s。' % (i + 1, rng.choice(['麻辣', '清淡', '酸甜', '咸鲜'])),
+        'price': prices[i],
+        'image_url': 'https://example.com/dishes/%d.jpg' % (i + 1),
+        'category_id': i % categories + 1
+    } for i in range(dishes)])
+
+    password_hash = bcrypt.hashpw(BENCH_PASSWORD.encode('utf-8'),
+                                  bcrypt.gensalt(BENCH_BCRYPT_ROUNDS)).decode('utf-8')
+    _insert(User.__table__, [{'id': 1, 'username': 'admin', 'email': 'admin@example.com',
+                              'password_hash': password_hash, 'is_admin': True}])
+    for start in range(0, users, BATCH_SIZE):
+        _insert(User.__table__, [{
+            'id': i + 2, 'username': 'bench%d' % i, 'email': 'bench%d@example.com' % i,
+            'password_hash': password_hash, 'is_admin': False
+        } for i in range(start, min(start + BATCH_SIZE, users))])
+    db.session.commit()
+    _progress('catalog and %d users: %.1fs' % (users, time.perf_counter() - started))
+
+    popularity = _zipf_weights(dishes)
+    dish_ids = range(1, dishes + 1)
+    rating_values, rating_weights = zip(*RATINGS)
+    status_values, status_weights = zip(*ORDER_STATUSES)
+    year = 365 * 24 * 3600
+
+    for start in range(0, reviews, BATCH_SIZE):
+        count = min(BATCH_SIZE, reviews - start)
+        _insert(Review.__table__, [{
+            'user_id': rng.randint(2, users + 1),
+            'dish_id': dish_id,
+            'rating': rating,
+            'comment': rng.choice(COMMENTS),
+            'created_at': now - timedelta(seconds=rng.randrange(year))
+        } for dish_id, rating in zip(rng.choices(dish_ids, cum_weights=popularity, k=count),
+                                     rng.choices(rating_values, rating_weights, k=count))])
+        db.session.commit()
+    _progress('%d reviews: %.1fs' % (reviews, time.perf_counter() - started))
+
+    # 每个订单1-4个订单项，直到订单项总数达到 order_items
+    order_id = 0
+    generated = 0
+    while generated < order_items:
+        orders = []
+        items = []
+        while generated < order_items and len(items) < BATCH_SIZE:
+            order_id += 1
+            count = min(rng.randint(1, 4), order_items - generated)
+            total = 0.0
+            for dish_id in rng.choices(dish_ids, cum_weights=popularity, k=count):
+                quantity = rng.randint(1, 3)
+                price = prices[dish_id - 1]
+                total += price * quantity
+                items.append({'order_id': order_id, 'dish_id': dish_id, 'quantity': quantity,
+                              'price': price, 'specifications': ''})
+            generated += count
+            orders.append({
+                'id': order_id,
+                'user_id': rng.randint(2, users + 1),
+                'total_amount': round(total, 2),
+                'status': rng.choices(status_values, status_weights)[0],
+                'created_at': now - timedelta(seconds=rng.randrange(year))
+            })
+        _insert(Order.__table__, orders)
+        _insert(OrderItem.__table__, items)
+        db.session.commit()
+    _progress('%d orders, %d order items: %.1fs' % (order_id, generated, time.perf_counter() - started))
+
+    rebuild_dish_ratings()
+    search.rebuild_search_index()
+    if with_analytics:
+        analytics.backfill()
+    db.session.commit()
+    _progress('aggregates and search index: %.1fs' % (time.perf_counter() - started))
+    return {'dishes': dishes, 'users': users + 1, 'reviews': reviews, 'orders': order_id,
+            'order_items': generated}
+
+
+# 已生成数据集的规模（供负载测试选择随机的菜品和用户）
+def dataset_size():
+    return {
+        'dishes': db.session.query(db.func.max(Dish.id)).scalar() or 0,
+        'users': db.session.query(db.func.max(User.id)).scalar() or 0,
+        'reviews': db.session.query(db.func.max(Review.id)).scalar() or 0,
+        'orders': db.session.query(db.func.max(Order.id)).scalar() or 0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic restaurant dataset')
+    parser.add_argument('--database', required=True, help='SQLite file to create')
+    parser.add_argument('--dishes', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--reviews', type=int, default=1000000)
+    parser.add_argument('--order-items', type=int, default=5000000)
+    parser.add_argument('--categories', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--analytics', action='store_true', help='Also backfill the sales rollups')
+    args = parser.parse_args()
+
+    from app import create_app, init_db
+    app = create_app(bench_config(args.database))
+    with app.app_context():
+        init_db()
+        counts = generate(args.dishes, args.users, args.reviews, args.order_items, args.categories,
+                          args.seed, args.analytics)
+    print(counts)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+# SQLite 并发读写基准：对比默认设置（回滚日志、synchronous=FULL、每次新建连接）
+# 与 config.py 中的 WAL 配置。每个进程模拟一个 worker，读进程查询菜品列表与详情，
+# 写进程模拟加入购物车。
+#
+#   cd backend && python -m benchmarks.db_concurrency --readers 6 --writers 2 --seconds 5
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from flask import Flask
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import joinedload
+
+from benchmarks.report import percentile
+from config import load_config
+from models import db, User, Category, Dish, CartItem
+
+PROFILES = {
+    # 调整前：SQLite 默认值，Flask-SQLAlchemy 对文件库使用 NullPool
+    'baseline': {
+        'SQLITE_JOURNAL_MODE': None,
+        'SQLITE_SYNCHRONOUS': None,
+        'SQLITE_BUSY_TIMEOUT': None,
+        'SQLITE_MMAP_SIZE': None,
+        'SQLITE_CACHE_SIZE': None,
+        'DB_POOL_SIZE': 0
+    },
+    # 调整后：config.py 的默认配置
+    'tuned': {}
+}
+
+
+def make_app(path, profile):
+    app = Flask(__name__)
+    load_config(app)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+    app.config.update(PROFILES[profile])
+    db.init_app(app)
+    return app
+
+
+def seed(app, dishes, users):
+    with app.app_context():
+        db.create_all()
+        categories = [Category(name='分类%d' % i, description='') for i in range(10)]
+        db.session.add_all(categories)
+        db.session.flush()
+        db.session.add_all([Dish(name='菜品%d' % i, description='描述' * 20, price=10 + i % 50,
+                                 category_id=categories[i % 10].id) for i in range(dishes)])
+        db.session.add_all([User(username='bench%d' % i, email='bench%d@example.com' % i,
+                                 password_hash='x') for i in range(users)])
+        db.session.commit()
+
+
+def read_once(dish_count):
+    Dish.query.options(joinedload(Dish.category)).order_by(Dish.id) \
+        .offset(random.randrange(max(dish_count - 20, 1))).limit(20).all()
+    Dish.query.get(random.randint(1, dish_count))
+
+
+def write_once(user_id, dish_count):
+    dish_id = random.randint(1, dish_count)
+    item = CartItem.query.filter_by(user_id=user_id, dish_id=dish_id).first()
+    if item:
+        item.quantity += 1
+    else:
+        db.session.add(CartItem(user_id=user_id, dish_id=dish_id, quantity=1))
+    db.session.commit()
+
+
+def worker(path, profile, role, index, dish_count, seconds, results):
+    app = make_app(path, profile)
+    latencies = []
+    errors = 0
+    with app.app_context():
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                if role == 'read':
+                    read_once(dish_count)
+                else:
+                    write_once(index + 1, dish_count)
+                latencies.append(time.perf_counter() - started)
+            except OperationalError:  # database is locked
+                db.session.rollback()
+                errors += 1
+            finally:
+                db.session.remove()  # 与请求结束时一样归还连接
+        db.engine.dispose()
+    results.put((role, latencies, errors))
+
+
+def run(profile, readers, writers, seconds, dishes):
+    directory = tempfile.mkdtemp(prefix='bench-')
+    path = os.path.join(directory, 'bench.db')
+    try:
+        seed(make_app(path, profile), dishes, writers)
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        processes = [context.Process(target=worker, args=(path, profile, 'read', i, dishes, seconds, results))
+                     for i in range(readers)]
+        processes += [context.Process(target=worker, args=(path, profile, 'write', i, dishes, seconds, results))
+                      for i in range(writers)]
+        for process in processes:
+            process.start()
+        collected = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    summary = {}
+    for role in ('read', 'write'):
+        latencies = [value for r, values, _ in collected if r == role for value in values]
+        summary[role] = {
+            'ops_per_sec': round(len(latencies) / seconds, 1),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'errors': sum(errors for r, _, errors in collected if r == role)
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SQLite concurrent read/write benchmark')
+    parser.add_argument('--readers', type=int, default=6)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--dishes', type=int, default=500)
+    parser.add_argument('--profile', choices=sorted(PROFILES), action='append')
+    args = parser.parse_args()
+
+    print('%-9s %-6s %10s %9s %9s %7s' % ('profile', 'role', 'ops/sec', 'p50 ms', 'p95 ms', 'errors'))
+    for profile in args.profile or ['baseline', 'tuned']:
+        summary = run(profile, args.readers, args.writers, args.seconds, args.dishes)
+        for role, stats in summary.items():
+            print('%-9s %-6s %10.1f %9.2f %9.2f %7d' % (
+                profile, role, stats['ops_per_sec'], stats['p50_ms'], stats['p95_ms'], stats['errors']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+# 负载测试：虚拟用户按场景（浏览 → 加入购物车 → 结算，管理员查看订单）访问接口，
+# 按接口输出吞吐、p50/p95/p99 延迟和每个请求的 SQL 查询数（JSON），可与基线结果对比。
+#
+#   --mode client：在当前进程内通过 Flask 测试客户端顺序执行，没有网络开销，查询数稳定可复现
+#   --mode http：启动本地 HTTP 服务（或使用 --url 指向已运行的服务），多个客户端进程并发请求
+#
+#   cd backend && python -m benchmarks.datagen --database /tmp/bench.db
+#   python -m benchmarks.load --database /tmp/bench.db --mode client --seconds 30 --output baseline.json
+#   python -m benchmarks.load --database /tmp/bench.db --mode http --processes 8 --seconds 30 \
+#       --baseline baseline.json
+#
+# 负载测试会写入购物车和订单，需要可重复的结果时请每次使用重新生成的数据库。
+import argparse
+import http.client
+import json
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import time
+from datetime import datetime
+from urllib.parse import urlencode, urlparse
+
+from flask import request
+
+from benchmarks import report
+from benchmarks.datagen import BENCH_PASSWORD, bench_config, dataset_size
+from metrics import request_stats
+
+ENDPOINT_HEADER = 'X-Bench-Endpoint'
+QUERIES_HEADER = 'X-Bench-Queries'
+
+# 场景权重：大部分用户只浏览，部分用户下单，少量管理员查看订单
+SCENARIOS = (('browse', 70), ('checkout', 25), ('admin', 5))
+DISH_SORTS = ('default', 'price', 'price_desc', 'rating', 'newest')
+
+
+# 基准应用：在响应头中返回路由规则与本次请求执行的 SQL 语句数（来自 metrics 的请求统计）
+def make_bench_app(path):
+    from app import create_app
+    app = create_app(dict(bench_config(path), METRICS_ENABLED=True))
+
+    @app.after_request
+    def report_query_count(response):
+        rule = request.url_rule.rule if request.url_rule else request.path
+        stats = request_stats()
+        response.headers[ENDPOINT_HEADER] = '%s %s' % (request.method, rule)
+        response.headers[QUERIES_HEADER] = str(stats.queries if stats is not None else 0)
+        return response
+
+    return app
+
+
+# 进程内测试客户端
+class ClientTransport:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None, headers=None):
+        response = self.client.open(path, method=method, json=body, headers=headers or {})
+        return response.status_code, response.get_json(silent=True), response.headers
+
+    def close(self):
+        pass
+
+
+# HTTP 客户端，每个虚拟用户一个长连接
+class HTTPTransport:
+    def __init__(self, url):
+        parsed = urlparse(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.connection = None
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            try:
+                self.connection.request(method, path, data, headers)
+                response = self.connection.getresponse()
+                payload = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                # 服务端关闭了空闲连接时重连一次
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+        try:
+            parsed = json.loads(payload) if payload else None
+        except ValueError:
+            parsed = None
+        return response.status, parsed, response.headers
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+
+# 一个虚拟用户：登录后按权重反复执行场景，记录每个请求的 (接口, 耗时, 状态码, 查询数)
+class VirtualUser:
+    def __init__(self, transport, rng, dataset, samples):
+        self.transport = transport
+        self.rng = rng
+        self.dataset = dataset
+        self.samples = samples
+        self.headers = {}
+        self.admin_headers = {}
+
+    def call(self, label, method, path, body=None, headers=None):
+        started = time.perf_counter()
+        try:
+            status, payload, response_headers = self.transport.request(method, path, body, headers)
+        except (http.client.HTTPException, OSError):
+            self.samples.append((label, time.perf_counter() - started, 0, None))
+            return None
+        elapsed = time.perf_counter() - started
+        endpoint = response_headers.get(ENDPOINT_HEADER) or label
+        queries = response_headers.get(QUERIES_HEADER)
+        self.samples.append((endpoint, elapsed, status, int(queries) if queries is not None else None))
+        return payload if status < 400 else None
+
+    def login(self, username):
+        payload = self.call('POST /api/login', 'POST', '/api/login',
+                            {'username': username, 'password': BENCH_PASSWORD})
+        return {'Authorization': 'Bearer ' + payload['access_token']} if payload else {}
+
+    def start(self):
+        self.headers = self.login('bench%d' % self.rng.randrange(max(self.dataset['users'] - 1, 1)))
+        self.admin_headers = self.login('admin')
+
+    def random_dish(self):
+        return self.rng.randint(1, self.dataset['dishes'])
+
+    def browse(self):
+        params = {'limit': 20, 'sort': self.rng.choice(DISH_SORTS)}
+        if self.rng.random() < 0.5:
+            params['category_id'] = self.rng.randint(1, 20)
+        page = self.call('GET /api/dishes', 'GET', '/api/dishes?' + urlencode(params))
+        if page and page.get('next_cursor') and self.rng.random() < 0.3:
+            params['cursor'] = page['next_cursor']
+            self.call('GET /api/dishes', 'GET', '/api/dishes?' + urlencode(params))
+        dish_id = self.random_dish()
+        self.call('GET /api/dishes/<int:dish_id>', 'GET', '/api/dishes/%d' % dish_id)
+        self.call('GET /api/dishes/<int:dish_id>/reviews', 'GET', '/api/dishes/%d/reviews?limit=10' % dish_id)
+        return dish_id
+
+    def checkout(self):
+        for _ in range(self.rng.randint(1, 3)):
+            dish_id = self.browse()
+            self.call('POST /api/cart', 'POST', '/api/cart',
+                      {'dish_id': dish_id, 'quantity': self.rng.randint(1, 2)}, self.headers)
+        self.call('GET /api/cart', 'GET', '/api/cart', headers=self.headers)
+        self.call('POST /api/orders', 'POST', '/api/orders', {}, self.headers)
+        self.call('GET /api/orders', 'GET', '/api/orders?limit=10', headers=self.headers)
+
+    def admin(self):
+        params = {'limit': 50}
+        if self.rng.random() < 0.5:
+            params['status'] = 'pending'
+        self.call('GET /api/admin/orders', 'GET', '/api/admin/orders?' + urlencode(params),
+                  headers=self.admin_headers)
+
+    def run(self, deadline=None, scenarios=None):
+        names, weights = zip(*SCENARIOS)
+        completed = 0
+        while ((scenarios is None or completed < scenarios)
+               and (deadline is None or time.perf_counter() < deadline)):
+            getattr(self, self.rng.choices(names, weights)[0])()
+            completed += 1
+        return completed
+
+
+def run_client(path, seconds, scenarios, seed):
+    app = make_bench_app(path)
+    with app.app_context():
+        dataset = dataset_size()
+    samples = []
+    user = VirtualUser(ClientTransport(app), random.Random(seed), dataset, samples)
+    user.start()
+    del samples[:]  # 登录不计入结果
+    started = time.perf_counter()
+    user.run(deadline=None if scenarios else started + seconds, scenarios=scenarios)
+    return dataset, samples, time.perf_counter() - started
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _serve(path, port):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    # 支持长连接，避免每个请求新建 TCP 连接；不输出访问日志
+    WSGIRequestHandler.protocol_version = 'HTTP/1.1'
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    make_server('127.0.0.1', port, make_bench_app(path), threaded=True).serve_forever()
+
+
+def _wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('Benchmark server did not start')
+
+
+def _http_worker(url, dataset, seed, seconds, scenarios, start_at, results):
+    samples = []
+    transport = HTTPTransport(url)
+    user = VirtualUser(transport, random.Random(seed), dataset, samples)
+    user.start()
+    del samples[:]  # 登录不计入结果
+    while time.time() < start_at:
+        time.sleep(0.01)
+    user.run(deadline=None if scenarios else time.perf_counter() + seconds, scenarios=scenarios)
+    transport.close()
+    results.put(samples)
+
+
+def run_http(path, url, processes, seconds, scenarios, seed):
+    context = multiprocessing.get_context('fork')
+    server = None
+    if url is None:
+        port = _free_port()
+        server = context.Process(target=_serve, args=(path, port), daemon=True)
+        server.start()
+        _wait_for_port(port)
+        url = 'http://127.0.0.1:%d' % port
+
+    try:
+        app = make_bench_app(path)
+        with app.app_context():
+            dataset = dataset_size()
+        results = context.Queue()
+        # 所有客户端登录完成后同时开始
+        start_at = time.time() + 1 + processes * 0.05
+        workers = [context.Process(target=_http_worker,
+                                   args=(url, dataset, seed + index, seconds, scenarios, start_at, results))
+                   for index in range(processes)]
+        for worker in workers:
+            worker.start()
+        samples = []
+        for _ in workers:
+            samples.extend(results.get())
+        elapsed = max(time.time() - start_at, 1e-9)
+        for worker in workers:
+            worker.join()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+    return dataset, samples, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the API with browse/cart/checkout scenarios')
+    parser.add_argument('--database', required=True, help='SQLite file generated by benchmarks.datagen')
+    parser.add_argument('--mode', choices=('client', 'http'), default='client')
+    parser.add_argument('--url', help='Target an already running server using the same database '
+                                      '(http mode, no query counts)')
+    parser.add_argument('--processes', type=int, default=4, help='Client processes in http mode')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--scenarios', type=int, help='Run a fixed number of scenarios per client instead')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Write the JSON result to this file instead of stdout')
+    parser.add_argument('--baseline', help='Compare with a previously saved JSON result')
+    args = parser.parse_args()
+    if not os.path.exists(args.database):
+        parser.error('%s does not exist, generate it with python -m benchmarks.datagen' % args.database)
+
+    if args.mode == 'client':
+        dataset, samples, elapsed = run_client(args.database, args.seconds, args.scenarios, args.seed)
+    else:
+        dataset, samples, elapsed = run_http(args.database, args.url, args.processes, args.seconds,
+                                             args.scenarios, args.seed)
+
+    result = {
+        'mode': args.mode,
+        'started_at': datetime.utcnow().isoformat(),
+        'options': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        'dataset': dataset,
+        'duration_s': round(elapsed, 2),
+        **report.summarize(samples, elapsed)
+    }
+    report.write(result, args.output)
+    if args.baseline:
+        print('\n'.join(report.compare(report.load(args.baseline), result)), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
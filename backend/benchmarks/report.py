@@ -0,0 +1,89 @@
+# 基准结果的统计与对比：按接口汇总请求数、吞吐、延迟分位数与 SQL 查询数，输出 JSON，
+# 并可与之前保存的基线结果逐项对比
+import json
+from collections import defaultdict
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def _latency_stats(latencies):
+    return {
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2)
+    }
+
+
+# samples：[(接口, 耗时秒, 状态码, 查询数或None)]；状态码为0表示连接失败
+def summarize(samples, seconds):
+    by_endpoint = defaultdict(list)
+    for sample in samples:
+        by_endpoint[sample[0]].append(sample)
+
+    endpoints = {}
+    for endpoint, rows in sorted(by_endpoint.items()):
+        queries = [row[3] for row in rows if row[3] is not None]
+        endpoints[endpoint] = dict(
+            requests=len(rows),
+            errors=sum(1 for row in rows if row[2] == 0 or row[2] >= 500),
+            client_errors=sum(1 for row in rows if 400 <= row[2] < 500),
+            throughput_rps=round(len(rows) / seconds, 1),
+            mean_queries=round(sum(queries) / len(queries), 2) if queries else None,
+            max_queries=max(queries) if queries else None,
+            **_latency_stats([row[1] for row in rows])
+        )
+    return {
+        'requests': len(samples),
+        'errors': sum(stats['errors'] for stats in endpoints.values()),
+        'throughput_rps': round(len(samples) / seconds, 1),
+        **_latency_stats([sample[1] for sample in samples]),
+        'endpoints': endpoints
+    }
+
+
+def write(result, path=None):
+    text = json.dumps(result, ensure_ascii=False, indent=2, sort_keys=True)
+    if path:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _change(old, new):
+    if old is None or new is None:
+        return '%10s' % '-'
+    if not old:
+        return '%10s' % 'n/a'
+    return '%+9.1f%%' % ((new - old) * 100.0 / old)
+
+
+# 与基线逐个接口对比 p50/p95/p99 延迟、吞吐和平均查询数，返回可打印的文本行
+def compare(baseline, current):
+    lines = ['%-40s %10s %10s %10s %10s %10s' % ('endpoint', 'p50', 'p95', 'p99', 'rps', 'queries')]
+    rows = [('(all)', baseline, current)]
+    for endpoint in sorted(set(baseline['endpoints']) | set(current['endpoints'])):
+        rows.append((endpoint, baseline['endpoints'].get(endpoint), current['endpoints'].get(endpoint)))
+    for name, old, new in rows:
+        if old is None or new is None:
+            lines.append('%-40s %s' % (name, 'only in current' if old is None else 'only in baseline'))
+            continue
+        lines.append('%-40s %s %s %s %s %s' % (
+            name,
+            _change(old['p50_ms'], new['p50_ms']),
+            _change(old['p95_ms'], new['p95_ms']),
+            _change(old['p99_ms'], new['p99_ms']),
+            _change(old['throughput_rps'], new['throughput_rps']),
+            _change(old.get('mean_queries'), new.get('mean_queries'))
+        ))
+    return lines
@@ -0,0 +1,128 @@
+# 列表响应序列化基准：对比逐行构造 ORM 对象 + 标准库 json（调整前）与
+# 只查询所需列的行元组 + serializers.dumps（调整后）生成 10k 行菜品列表和订单列表的耗时。
+#
+#   cd backend && python -m benchmarks.serialization --rows 10000 --repeat 5
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+from flask import Flask, json
+from sqlalchemy.orm import contains_eager, selectinload, joinedload
+
+import serializers
+from config import load_config
+from models import db, User, Category, Dish, Order, OrderItem
+from serializers import dish_rows, serialize_dish, order_rows, serialize_orders
+
+
+def make_app(path):
+    app = Flask(__name__)
+    load_config(app)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+    db.init_app(app)
+    return app
+
+
+def seed(rows):
+    db.create_all()
+    categories = [Category(name='分类%d' % i, description='') for i in range(10)]
+    db.session.add_all(categories)
+    db.session.flush()
+    db.session.execute(Dish.__table__.insert(), [{
+        'name': '菜品%d' % i, 'description': '描述' * 20, 'price': 10 + i % 50,
+        'image_url': 'https://example.com/%d.jpg' % i, 'category_id': categories[i % 10].id,
+        'rating_sum': 0, 'rating_count': 0, 'rating_avg': 5.0
+    } for i in range(rows)])
+    user = User(username='bench', email='bench@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    now = datetime.utcnow()
+    db.session.execute(Order.__table__.insert(), [{
+        'user_id': user.id, 'total_amount': 50.0, 'status': 'delivered', 'created_at': now
+    } for _ in range(rows)])
+    # 每个订单两个订单项
+    db.session.execute(OrderItem.__table__.insert(), [{
+        'order_id': i // 2 + 1, 'dish_id': i % rows + 1, 'quantity': 1, 'price': 25.0, 'specifications': ''
+    } for i in range(rows * 2)])
+    db.session.commit()
+
+
+# 调整前：与原先 get_dishes / get_orders 相同的实现
+def dishes_orm():
+    dishes = Dish.query.outerjoin(Dish.category).options(contains_eager(Dish.category)).order_by(Dish.id).all()
+    payload = []
+    for dish in dishes:
+        data = {'id': dish.id, 'name': dish.name, 'description': dish.description, 'price': dish.price,
+                'image_url': dish.image_url, 'rating': dish.average_rating, 'reviewCount': dish.rating_count}
+        if dish.category:
+            data['category'] = {'id': dish.category.id, 'name': dish.category.name}
+        payload.append(data)
+    return json.dumps(payload).encode('utf-8')
+
+
+def orders_orm():
+    orders = Order.query.options(selectinload(Order.order_items).joinedload(OrderItem.dish)) \
+        .order_by(Order.created_at.desc(), Order.id.desc()).all()
+    return json.dumps([{
+        'id': order.id, 'total_amount': order.total_amount, 'status': order.status,
+        'created_at': order.created_at.isoformat(),
+        'items': [{'dish': {'id': item.dish.id, 'name': item.dish.name, 'price': item.dish.price},
+                   'quantity': item.quantity, 'price': item.price, 'specifications': item.specifications}
+                  for item in order.order_items]
+    } for order in orders]).encode('utf-8')
+
+
+# 调整后：serializers 模块
+def dishes_rows():
+    return serializers.dumps([serialize_dish(row) for row in dish_rows().order_by(Dish.id)])
+
+
+def orders_rows():
+    rows = order_rows().order_by(Order.created_at.desc(), Order.id.desc()).all()
+    return serializers.dumps(serialize_orders(rows))
+
+
+CASES = [
+    ('dishes', 'orm+json', dishes_orm),
+    ('dishes', 'rows+dumps', dishes_rows),
+    ('orders', 'orm+json', orders_orm),
+    ('orders', 'rows+dumps', orders_rows),
+]
+
+
+def measure(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = function()
+        timings.append(time.perf_counter() - started)
+        db.session.remove()
+    return min(timings), sorted(timings)[len(timings) // 2], len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='List response serialization benchmark')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bench-')
+    try:
+        app = make_app(os.path.join(directory, 'bench.db'))
+        with app.app_context():
+            seed(args.rows)
+            print('encoder: %s' % ('orjson' if serializers.orjson is not None else 'json'))
+            print('%-7s %-11s %9s %9s %10s' % ('list', 'variant', 'min ms', 'p50 ms', 'bytes'))
+            for name, variant, function in CASES:
+                best, median, size = measure(function, args.repeat)
+                print('%-7s %-11s %9.1f %9.1f %10d' % (name, variant, best * 1000, median * 1000, size))
+            db.engine.dispose()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,356 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+from flask import Response, request
+
+from serializers import dumps
+from extensions import AppExtension
+
+
+class CachedPayload:
+    __slots__ = ('version', 'body', 'etag')
+
+    def __init__(self, version, body, etag=None):
+        self.version = version
+        self.body = body
+        # 强ETag：目录版本号 + 内容摘要
+        self.etag = etag or '%d-%s' % (version, hashlib.sha1(body).hexdigest()[:16])
+
+    def dumps(self):
+        return self.etag.encode('ascii') + b'\n' + self.body
+
+    @classmethod
+    def loads(cls, version, raw):
+        etag, _, body = raw.partition(b'\n')
+        return cls(version, body, etag.decode('ascii'))
+
+
+# 有容量上限的LRU，记录命中、未命中和淘汰次数
+class LRUCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+
+# 缓存后端只需实现字节值的读写、目录版本号的读取与递增，以及最近一次递增的时间。
+# 多个 worker 共享同一个后端时，版本号递增即是跨进程的失效通知。
+
+# 进程内缓存，适用于单 worker 部署和开发环境
+class MemoryBackend:
+    def __init__(self, max_entries=2048):
+        self._lock = threading.Lock()
+        self._lru = LRUCache(max_entries)
+        self._version = 1
+        self._bumped_at = 0.0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._lru.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        return value if expires is None or expires > time.time() else None
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._lru.put(key, (value, time.time() + ttl if ttl else None))
+
+    def get_version(self):
+        return self._version
+
+    def get_bumped_at(self):
+        return self._bumped_at
+
+    def bump_version(self):
+        with self._lock:
+            self._version += 1
+            self._bumped_at = time.time()
+            self._lru.clear()
+            return self._version
+
+    def stats(self):
+        with self._lock:
+            return self._lru.stats()
+
+
+# 基于本地 SQLite 文件的共享缓存，同一台机器上的多个 worker 共用。
+# 连接在每个进程、每个线程第一次使用时打开（预加载应用后 fork 的 worker 不共用父进程的连接）
+class SQLiteBackend:
+    # 命中时最多每隔这么多秒更新一次访问时间，读取通常不需要获取写锁
+    ACCESS_RESOLUTION = 60
+
+    def __init__(self, path, max_entries=2048):
+        self.path = path
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._schema_pid = None
+        self._writes = 0
+
+    def _ensure_schema(self, conn):
+        with self._lock:
+            if self._schema_pid == os.getpid():
+                return
+            conn.execute('CREATE TABLE IF NOT EXISTS cache_entry ('
+                         'key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+                         'expires REAL, accessed REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_entry_accessed '
+                         'ON cache_entry (accessed)')
+            conn.execute('CREATE TABLE IF NOT EXISTS cache_version ('
+                         'id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)')
+            conn.execute('INSERT OR IGNORE INTO cache_version (id, version) VALUES (1, 1)')
+            conn.execute('CREATE TABLE IF NOT EXISTS cache_bump ('
+                         'id INTEGER PRIMARY KEY CHECK (id = 1), bumped_at REAL NOT NULL)')
+            self._schema_pid = os.getpid()
+
+    def _connect(self):
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._ensure_schema(conn)
+            self._local.conn = conn
+            self._local.pid = pid
+        return self._local.conn
+
+    def get(self, key):
+        conn = self._connect()
+        row = conn.execute('SELECT value, expires, accessed FROM cache_entry WHERE key = ?', (key,)).fetchone()
+        now = time.time()
+        if row is None or (row[1] is not None and row[1] <= now):
+            return None
+        if row[2] < now - self.ACCESS_RESOLUTION:
+            conn.execute('UPDATE cache_entry SET accessed = ? WHERE key = ?', (now, key))
+        return row[0]
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        conn = self._connect()
+        conn.execute('INSERT OR REPLACE INTO cache_entry (key, value, expires, accessed) '
+                     'VALUES (?, ?, ?, ?)', (key, value, now + ttl if ttl else None, now))
+        # 每写入一定次数检查一次容量，按最近访问时间淘汰
+        self._writes += 1
+        if self._writes % 64 == 0:
+            self._prune(conn, now)
+
+    def _prune(self, conn, now):
+        expired = conn.execute('DELETE FROM cache_entry WHERE expires <= ?', (now,)).rowcount
+        (size,) = conn.execute('SELECT COUNT(*) FROM cache_entry').fetchone()
+        overflow = size - self.max_entries
+        if overflow > 0:
+            conn.execute('DELETE FROM cache_entry WHERE key IN ('
+                         'SELECT key FROM cache_entry ORDER BY accessed LIMIT ?)', (overflow,))
+        self.evictions += expired + max(overflow, 0)
+
+    def get_version(self):
+        return self._connect().execute('SELECT version FROM cache_version WHERE id = 1').fetchone()[0]
+
+    def get_bumped_at(self):
+        row = self._connect().execute('SELECT bumped_at FROM cache_bump WHERE id = 1').fetchone()
+        return row[0] if row else 0.0
+
+    def bump_version(self):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('UPDATE cache_version SET version = version + 1 WHERE id = 1')
+            conn.execute('INSERT OR REPLACE INTO cache_bump (id, bumped_at) VALUES (1, ?)', (time.time(),))
+            version = conn.execute('SELECT version FROM cache_version WHERE id = 1').fetchone()[0]
+            conn.execute('DELETE FROM cache_entry')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return version
+
+    def stats(self):
+        (size,) = self._connect().execute('SELECT COUNT(*) FROM cache_entry').fetchone()
+        return {'size': size, 'max_entries': self.max_entries, 'evictions': self.evictions}
+
+
+# Redis 协议的共享缓存，适用于多机多 worker 部署；容量由 Redis 的 maxmemory 策略控制
+class RedisBackend:
+    VERSION_KEY = 'menu:version'
+    BUMPED_AT_KEY = 'menu:bumped_at'
+
+    def __init__(self, client, prefix='food-delivery:'):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url):
+        # 可选依赖，仅在 CACHE_URL 使用 redis:// 时导入（导入较慢，不放在模块顶部以免拖慢启动）
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('The redis package is required for CACHE_URL=%s' % url)
+        return cls(redis.Redis.from_url(url))
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, value, ex=ttl)
+
+    def get_version(self):
+        version = self.client.get(self.prefix + self.VERSION_KEY)
+        return int(version) if version is not None else 0
+
+    def get_bumped_at(self):
+        bumped_at = self.client.get(self.prefix + self.BUMPED_AT_KEY)
+        return float(bumped_at) if bumped_at is not None else 0.0
+
+    def bump_version(self):
+        # 各 worker 每次读取缓存时都从 Redis 取当前版本，无需广播；旧版本的条目不会再被读取，由 TTL 回收
+        pipeline = self.client.pipeline()
+        pipeline.incr(self.prefix + self.VERSION_KEY)
+        pipeline.set(self.prefix + self.BUMPED_AT_KEY, time.time())
+        return pipeline.execute()[0]
+
+    def stats(self):
+        import redis
+        try:
+            info = self.client.info('stats')
+        except redis.exceptions.ResponseError:  # 部分兼容实现不支持 INFO
+            return {}
+        return {'evictions': info.get('evicted_keys'), 'expired': info.get('expired_keys')}
+
+
+# 根据 CACHE_URL 创建缓存后端：memory://、sqlite:///path/to/cache.db 或 redis://host:port/db
+def create_backend(url, max_entries=2048):
+    scheme = urlparse(url).scheme
+    if scheme == 'memory':
+        return MemoryBackend(max_entries)
+    if scheme == 'sqlite':
+        path = url[len('sqlite:///'):]
+        if not path:
+            raise ValueError('CACHE_URL sqlite:/// requires a file path')
+        return SQLiteBackend(os.path.abspath(path), max_entries)
+    if scheme in ('redis', 'rediss', 'unix'):
+        return RedisBackend.from_url(url)
+    raise ValueError('Unsupported CACHE_URL: %s' % url)
+
+
+# 菜单缓存：保存菜品列表、菜品详情与菜品评论序列化后的响应体。
+# 条目键中包含目录版本号，管理员修改菜品/分类或新增评论时版本号递增，旧条目随之失效。
+class MenuCache:
+    def __init__(self, app=None):
+        self.backend = None
+        self.ttl = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CACHE_URL', 'memory://')
+        app.config.setdefault('CACHE_MAX_ENTRIES', 2048)
+        app.config.setdefault('CACHE_DEFAULT_TTL', 300)
+        self.backend = create_backend(app.config['CACHE_URL'], app.config['CACHE_MAX_ENTRIES'])
+        self.ttl = app.config['CACHE_DEFAULT_TTL']
+
+    @property
+    def version(self):
+        return self.backend.get_version()
+
+    # 最近一次失效（版本递增）的时间，没有失效过时为0
+    @property
+    def bumped_at(self):
+        return self.backend.get_bumped_at()
+
+    def get(self, namespace, key, version):
+        raw = self.backend.get('menu:%d:%s:%s' % (version, namespace, key))
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return CachedPayload.loads(version, raw)
+
+    def put(self, namespace, key, version, payload, ttl=None):
+        entry = CachedPayload(version, dumps(payload))
+        # 生成期间目录已被修改时不写入缓存，避免保存过期内容
+        if version == self.version:
+            self.backend.set('menu:%d:%s:%s' % (version, namespace, key), entry.dumps(), ttl or self.ttl)
+        return entry
+
+    # 目录发生变化：递增共享的版本号，所有 worker 随即读取新版本的条目
+    def bump(self):
+        self.invalidations += 1
+        return self.backend.bump_version()
+
+    def stats(self):
+        return {
+            'backend': type(self.backend).__name__,
+            'version': self.version,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'storage': self.backend.stats()
+        }
+
+
+# 读取缓存，未命中时调用 build() 生成负载并写入缓存；build 可返回 Flask 响应以跳过缓存（如错误）。
+# refresh 为真时跳过读取、直接重新生成并覆盖缓存条目；ttl 覆盖默认有效期
+def cached_json(namespace, key, build, ttl=None, refresh=False):
+    version = menu_cache.version
+    entry = None if refresh else menu_cache.get(namespace, key, version)
+    if entry is None:
+        payload = build()
+        if isinstance(payload, (Response, tuple)):
+            return payload
+        entry = menu_cache.put(namespace, key, version, payload, ttl)
+    return cached_response(entry)
+
+
+# 根据缓存条目生成响应，If-None-Match 命中时返回304
+def cached_response(entry):
+    if request.if_none_match.contains(entry.etag):
+        response = Response(status=304)
+    else:
+        response = Response(entry.body, mimetype='application/json')
+    response.set_etag(entry.etag)
+    # 允许浏览器缓存，但每次使用前须带ETag重新验证
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+menu_cache = AppExtension('menu_cache', MenuCache)
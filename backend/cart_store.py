@@ -0,0 +1,462 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+from sqlalchemy import func
+
+from models import db, CartItem, Dish
+from extensions import AppExtension
+
+logger = logging.getLogger(__name__)
+
+# 购物车存储。默认直接读写 CartItem 表；配置 CART_STORE_URL 后购物车保存在键值存储中
+# （memory:// 进程内，或 redis://），由后台线程定期把有变化的购物车批量写回 CartItem（write-behind），
+# 购物车的高频写入不再竞争数据库写锁。CartItem 表此时是持久化副本，进程重启后从中加载。
+
+CART_OPERATIONS = ('add', 'update', 'remove')
+
+
+class CartOperationError(Exception):
+    def __init__(self, message, status=400, index=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.index = index
+
+
+# 并发结算时购物车已被另一个请求取走
+class CartChanged(Exception):
+    pass
+
+
+# 校验单个操作的格式，返回错误信息或 None
+def validate_operation(operation):
+    if not isinstance(operation, dict) or operation.get('op') not in CART_OPERATIONS:
+        return 'op must be one of add, update, remove'
+    if operation['op'] == 'add':
+        dish_id = operation.get('dish_id')
+        if dish_id is None:
+            return 'Dish ID is required'
+        if not isinstance(dish_id, int) or isinstance(dish_id, bool):
+            return 'Dish ID must be an integer'
+        quantity = operation.get('quantity', 1)
+        if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+            return 'Quantity must be a positive integer'
+    else:
+        item_id = operation.get('id')
+        if not isinstance(item_id, int) or isinstance(item_id, bool):
+            return 'Cart item ID is required'
+        if operation['op'] == 'update':
+            quantity = operation.get('quantity')
+            if not isinstance(quantity, int) or isinstance(quantity, bool):
+                return 'Quantity must be an integer'
+    return None
+
+
+def _existing_dishes(operations):
+    dish_ids = {operation['dish_id'] for operation in operations if operation['op'] == 'add'}
+    if not dish_ids:
+        return set()
+    return {dish_id for (dish_id,) in db.session.query(Dish.id).filter(Dish.id.in_(dish_ids), Dish.active())}
+
+
+# 按顺序对购物车条目执行操作，返回新的条目列表；新条目的 id 为 None，由存储分配。
+# 条目格式：{'id', 'dish_id', 'quantity', 'specifications'}
+def apply_operations(items, operations, existing_dishes):
+    items = [dict(item) for item in items]
+    for index, operation in enumerate(operations):
+        if operation['op'] == 'add':
+            dish_id = operation['dish_id']
+            if dish_id not in existing_dishes:
+                raise CartOperationError('Dish not found', 404, index)
+            specifications = operation.get('specifications', '')
+            quantity = operation.get('quantity', 1)
+            # 同样的菜品和规格只增加数量
+            item = next((item for item in items
+                         if item['dish_id'] == dish_id and item['specifications'] == specifications), None)
+            if item:
+                item['quantity'] += quantity
+            else:
+                items.append({'id': None, 'dish_id': dish_id, 'quantity': quantity,
+                              'specifications': specifications})
+            continue
+
+        item = next((item for item in items
+                     if item['id'] is not None and item['id'] == operation['id']), None)
+        if item is None:
+            raise CartOperationError('Cart item not found', 404, index)
+        if operation['op'] == 'update' and operation['quantity'] > 0:
+            item['quantity'] = operation['quantity']
+        else:
+            # 数量小于等于0的更新与删除相同
+            items.remove(item)
+    return items
+
+
+def _entry(row):
+    return {'id': row.id, 'dish_id': row.dish_id, 'quantity': row.quantity,
+            'specifications': row.specifications}
+
+
+def _load_rows(user_id):
+    rows = db.session.query(CartItem.id, CartItem.dish_id, CartItem.quantity, CartItem.specifications) \
+        .filter(CartItem.user_id == user_id).order_by(CartItem.id).all()
+    return [_entry(row) for row in rows]
+
+
+# 直接读写 CartItem 表（默认）
+class DatabaseCartStore:
+    def items(self, user_id):
+        return _load_rows(user_id)
+
+    # 一次查询取出用户已有的购物车项，在内存中执行操作后只写入有变化的行，一次提交
+    def apply(self, user_id, operations):
+        rows = CartItem.query.filter_by(user_id=user_id).all()
+        items = apply_operations([_entry(row) for row in rows], operations, _existing_dishes(operations))
+
+        rows_by_id = {row.id: row for row in rows}
+        kept = set()
+        for item in items:
+            if item['id'] is None:
+                db.session.add(CartItem(user_id=user_id, dish_id=item['dish_id'],
+                                        quantity=item['quantity'], specifications=item['specifications']))
+                continue
+            kept.add(item['id'])
+            row = rows_by_id[item['id']]
+            if row.quantity != item['quantity']:
+                row.quantity = item['quantity']
+        for row in rows:
+            if row.id not in kept:
+                db.session.delete(row)
+        db.session.commit()
+
+    # 结算：取出并删除购物车项，与订单在同一事务中提交；回滚即恢复
+    def take(self, user_id):
+        items = _load_rows(user_id)
+        if items:
+            deleted = CartItem.query.filter(CartItem.id.in_([item['id'] for item in items])) \
+                .delete(synchronize_session=False)
+            # 删除行数不符说明购物车已被另一个并发请求结算
+            if deleted != len(items):
+                raise CartChanged()
+        return items
+
+    def restore(self, user_id, items):
+        pass
+
+    # 菜品被删除时从所有购物车中移除（由调用方提交）
+    def remove_dish(self, dish_id):
+        CartItem.query.filter_by(dish_id=dish_id).delete(synchronize_session=False)
+
+    def flush(self):
+        return 0
+
+
+# 进程内键值存储，适用于单 worker 部署
+class MemoryCartBackend:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._carts = {}
+        self._dirty = set()
+        self._id_lock = threading.Lock()
+        self._next_id = None
+
+    def get(self, user_id):
+        with self._lock:
+            items = self._carts.get(user_id)
+            return [dict(item) for item in items] if items is not None else None
+
+    def set_if_absent(self, user_id, items):
+        with self._lock:
+            self._carts.setdefault(user_id, items)
+
+    # 在锁内读取、修改并写回一个购物车
+    def update(self, user_id, mutate):
+        with self._lock:
+            items = mutate([dict(item) for item in self._carts.get(user_id, [])])
+            self._carts[user_id] = items
+            return items
+
+    def take(self, user_id):
+        with self._lock:
+            items = self._carts.get(user_id) or []
+            self._carts[user_id] = []
+            return items
+
+    def user_ids(self):
+        with self._lock:
+            return list(self._carts)
+
+    def mark_dirty(self, user_ids):
+        with self._lock:
+            self._dirty.update(user_ids)
+
+    def pop_dirty(self, count):
+        with self._lock:
+            user_ids = [self._dirty.pop() for _ in range(min(count, len(self._dirty)))]
+            return user_ids
+
+    def ids_seeded(self):
+        return self._next_id is not None
+
+    def seed_ids(self, value):
+        with self._id_lock:
+            if self._next_id is None:
+                self._next_id = value
+
+    def next_id(self):
+        with self._id_lock:
+            self._next_id += 1
+            return self._next_id
+
+
+# Redis 键值存储，多个 worker 共享购物车
+class RedisCartBackend:
+    def __init__(self, client, prefix='food-delivery:'):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('The redis package is required for CART_STORE_URL=%s' % url)
+        return cls(redis.Redis.from_url(url))
+
+    def _key(self, user_id):
+        return '%scart:user:%d' % (self.prefix, user_id)
+
+    def get(self, user_id):
+        raw = self.client.get(self._key(user_id))
+        return json.loads(raw) if raw is not None else None
+
+    def set_if_absent(self, user_id, items):
+        self.client.set(self._key(user_id), json.dumps(items), nx=True)
+
+    # WATCH/MULTI 乐观事务，并发修改时自动重试
+    def update(self, user_id, mutate):
+        key = self._key(user_id)
+
+        def transaction(pipe):
+            raw = pipe.get(key)
+            items = mutate(json.loads(raw) if raw is not None else [])
+            pipe.multi()
+            pipe.set(key, json.dumps(items))
+            return items
+
+        return self.client.transaction(transaction, key, value_from_callable=True)
+
+    def take(self, user_id):
+        raw = self.client.getset(self._key(user_id), '[]')
+        return json.loads(raw) if raw is not None else []
+
+    def user_ids(self):
+        start = len(self.prefix) + len('cart:user:')
+        return [int(key[start:]) for key in self.client.scan_iter(match=self.prefix + 'cart:user:*')]
+
+    def mark_dirty(self, user_ids):
+        if user_ids:
+            self.client.sadd(self.prefix + 'cart:dirty', *user_ids)
+
+    def pop_dirty(self, count):
+        return [int(user_id) for user_id in self.client.spop(self.prefix + 'cart:dirty', count) or []]
+
+    def ids_seeded(self):
+        return bool(self.client.exists(self.prefix + 'cart:next_id'))
+
+    def seed_ids(self, value):
+        self.client.set(self.prefix + 'cart:next_id', value, nx=True)
+
+    def next_id(self):
+        return self.client.incr(self.prefix + 'cart:next_id')
+
+
+# 键值存储 + 定期批量写回 CartItem
+class KeyValueCartStore:
+    def __init__(self, app, backend, flush_interval=1.0, batch_size=500):
+        self.app = app
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._flusher = None
+        self._flusher_pid = None
+        self._flusher_lock = threading.Lock()
+        atexit.register(self._flush_at_exit)
+
+    # 存储中没有该用户的购物车时（首次访问或进程重启后）从 CartItem 加载
+    def _ensure_loaded(self, user_id):
+        items = self.backend.get(user_id)
+        if items is None:
+            self.backend.set_if_absent(user_id, _load_rows(user_id))
+            items = self.backend.get(user_id)
+        return items
+
+    # 新条目的ID从 CartItem 现有最大ID之后开始分配，写回时保持不变
+    def _seed_ids(self):
+        if not self.backend.ids_seeded():
+            self.backend.seed_ids(db.session.query(func.coalesce(func.max(CartItem.id), 0)).scalar())
+
+    def _assign_ids(self, items):
+        for item in items:
+            if item['id'] is None:
+                item['id'] = self.backend.next_id()
+        return items
+
+    def items(self, user_id):
+        return self._ensure_loaded(user_id)
+
+    def apply(self, user_id, operations):
+        existing_dishes = _existing_dishes(operations)
+        self._ensure_loaded(user_id)
+        self._seed_ids()
+        self.backend.update(user_id, lambda items: self._assign_ids(
+            apply_operations(items, operations, existing_dishes)))
+        self._mark_dirty([user_id])
+
+    # 结算：原子地取出并清空购物车，同时删除 CartItem 中的副本（与订单在同一事务中提交）；
+    # 下单失败时由调用方 restore
+    def take(self, user_id):
+        self._ensure_loaded(user_id)
+        items = self.backend.take(user_id)
+        CartItem.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+        self._mark_dirty([user_id])
+        return items
+
+    # 把取出的条目放回购物车，与期间新加入的条目合并
+    def restore(self, user_id, items):
+        def merge(current):
+            for item in items:
+                if any(entry['id'] == item['id'] for entry in current):
+                    continue
+                same = next((entry for entry in current if entry['dish_id'] == item['dish_id']
+                             and entry['specifications'] == item['specifications']), None)
+                if same:
+                    same['quantity'] += item['quantity']
+                else:
+                    current.append(dict(item))
+            return current
+
+        self.backend.update(user_id, merge)
+        self._mark_dirty([user_id])
+
+    def remove_dish(self, dish_id):
+        changed = []
+        for user_id in self.backend.user_ids():
+            def without_dish(items):
+                remaining = [item for item in items if item['dish_id'] != dish_id]
+                if len(remaining) != len(items):
+                    changed.append(user_id)
+                return remaining
+            self.backend.update(user_id, without_dish)
+        CartItem.query.filter_by(dish_id=dish_id).delete(synchronize_session=False)
+        self._mark_dirty(changed)
+
+    def _mark_dirty(self, user_ids):
+        self.backend.mark_dirty(user_ids)
+        self._ensure_flusher()
+
+    # 写回线程在第一次写入时启动（每个 worker 进程各一个），不影响应用启动
+    def _ensure_flusher(self):
+        if self._flusher is not None and self._flusher_pid == os.getpid():
+            return
+        with self._flusher_lock:
+            if self._flusher is None or self._flusher_pid != os.getpid():
+                self._flusher = threading.Thread(target=self._run_flusher, name='cart-flusher', daemon=True)
+                self._flusher_pid = os.getpid()
+                self._flusher.start()
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                with self.app.app_context():
+                    self.flush()
+            except Exception:
+                logger.exception('Failed to flush carts')
+
+    def _flush_at_exit(self):
+        if self._flusher is None:
+            return
+        try:
+            with self.app.app_context():
+                self.flush()
+        except Exception:
+            logger.exception('Failed to flush carts at exit')
+
+    # 把有变化的购物车写回 CartItem：每批先删除这些用户的行再批量插入当前内容，一批一个事务。
+    # 需在独立的应用上下文中调用（会提交当前线程的会话）；返回写回的购物车数
+    def flush(self):
+        flushed = 0
+        while True:
+            user_ids = self.backend.pop_dirty(self.batch_size)
+            if not user_ids:
+                return flushed
+            rows = []
+            for user_id in user_ids:
+                for item in self.backend.get(user_id) or []:
+                    rows.append(dict(item, user_id=user_id))
+            try:
+                CartItem.query.filter(CartItem.user_id.in_(user_ids)).delete(synchronize_session=False)
+                if rows:
+                    db.session.execute(CartItem.__table__.insert(), rows)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                # 未写回的购物车留待下次重试
+                self.backend.mark_dirty(user_ids)
+                raise
+            finally:
+                db.session.remove()
+            flushed += len(user_ids)
+
+
+# 根据 CART_STORE_URL 创建购物车存储：未配置时使用数据库，memory:// 或 redis://host:port/db
+class CartStore:
+    def __init__(self, app=None):
+        self.store = DatabaseCartStore()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CART_STORE_URL', None)
+        app.config.setdefault('CART_FLUSH_INTERVAL', 1.0)
+        app.config.setdefault('CART_FLUSH_BATCH_SIZE', 500)
+        url = app.config['CART_STORE_URL']
+        if not url:
+            self.store = DatabaseCartStore()
+            return
+        scheme = urlparse(url).scheme
+        if scheme == 'memory':
+            backend = MemoryCartBackend()
+        elif scheme in ('redis', 'rediss', 'unix'):
+            backend = RedisCartBackend.from_url(url)
+        else:
+            raise ValueError('Unsupported CART_STORE_URL: %s' % url)
+        self.store = KeyValueCartStore(app, backend, app.config['CART_FLUSH_INTERVAL'],
+                                       app.config['CART_FLUSH_BATCH_SIZE'])
+
+    def items(self, user_id):
+        return self.store.items(user_id)
+
+    def apply(self, user_id, operations):
+        return self.store.apply(user_id, operations)
+
+    def take(self, user_id):
+        return self.store.take(user_id)
+
+    def restore(self, user_id, items):
+        return self.store.restore(user_id, items)
+
+    def remove_dish(self, dish_id):
+        return self.store.remove_dish(dish_id)
+
+    def flush(self):
+        return self.store.flush()
+
+
+cart_store = AppExtension('cart_store', CartStore)
@@ -0,0 +1,138 @@
+import gzip
+import threading
+
+from flask import request
+
+from cache import LRUCache
+from extensions import AppExtension
+
+# 响应压缩：按 Accept-Encoding 协商 br（需安装 brotli 包）或 gzip，只压缩超过 COMPRESS_MIN_SIZE 字节的 JSON/CSV 响应。
+# 带 ETag 的响应（菜单缓存条目，ETag 含目录版本号与内容摘要）压缩结果按 ETag 缓存在进程内，
+# 同一版本的目录数据每个 worker 只压缩一次。其余 GET 响应按内容生成 ETag。
+# 压缩后的表示使用 "<ETag>-br"/"<ETag>-gzip" 作为 ETag，If-None-Match 携带任一表示的 ETag 时都返回304。
+
+ENCODINGS = ('br', 'gzip')
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def variant_etag(etag, encoding):
+    return '%s-%s' % (etag, encoding)
+
+
+# If-None-Match 中与该资源匹配的 ETag（未压缩或任一压缩表示），没有时返回 None
+def matching_etag(etag):
+    for candidate in (etag,) + tuple(variant_etag(etag, encoding) for encoding in ENCODINGS):
+        if request.if_none_match.contains(candidate):
+            return candidate
+    return None
+
+
+class Compression:
+    def __init__(self, app=None):
+        self.min_size = 1024
+        self.level = 6
+        self.brotli_quality = 5
+        self.mimetypes = ()
+        self._brotli = None
+        self._lock = threading.Lock()
+        self._cache = LRUCache(256)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+        app.config.setdefault('COMPRESS_LEVEL', 6)
+        app.config.setdefault('COMPRESS_BROTLI_QUALITY', 5)
+        app.config.setdefault('COMPRESS_MIMETYPES', ['application/json', 'text/csv'])
+        app.config.setdefault('COMPRESS_CACHE_ENTRIES', 256)
+        self.min_size = app.config['COMPRESS_MIN_SIZE']
+        self.level = app.config['COMPRESS_LEVEL']
+        self.brotli_quality = app.config['COMPRESS_BROTLI_QUALITY']
+        self.mimetypes = tuple(app.config['COMPRESS_MIMETYPES'])
+        self._brotli = _brotli()
+        self._cache = LRUCache(app.config['COMPRESS_CACHE_ENTRIES'])
+        app.after_request(self.after_request)
+
+    # 客户端可接受的编码中优先 br，其次 gzip
+    def negotiate(self):
+        accept = request.accept_encodings
+        if self._brotli is not None and accept['br']:
+            return 'br'
+        if accept['gzip']:
+            return 'gzip'
+        return None
+
+    def compress(self, data, encoding):
+        if encoding == 'br':
+            return self._brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, compresslevel=self.level, mtime=0)
+
+    def _compressed(self, data, encoding, etag):
+        if etag is None:
+            return self.compress(data, encoding)
+        with self._lock:
+            body = self._cache.get((etag, encoding))
+        if body is None:
+            body = self.compress(data, encoding)
+            with self._lock:
+                self._cache.put((etag, encoding), body)
+        return body
+
+    def after_request(self, response):
+        etag, weak = response.get_etag()
+        # 只有视图自带的强 ETag（菜单缓存条目）才缓存压缩结果
+        precompress = etag is not None and not weak
+        if response.status_code == 304:
+            # 304 响应回应客户端所持有的那个表示的 ETag
+            if precompress:
+                response.set_etag(matching_etag(etag) or etag)
+                response.vary.add('Accept-Encoding')
+            return response
+        if response.mimetype not in self.mimetypes:
+            return response
+        response.vary.add('Accept-Encoding')
+
+        # 流式响应（如订单导出）与已编码的响应保持原样
+        if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+                or 'Content-Encoding' in response.headers):
+            return response
+
+        # 未缓存的 GET 响应（如订单列表）按内容生成 ETag，客户端持有相同内容时返回304
+        if request.method in ('GET', 'HEAD'):
+            if etag is None:
+                response.add_etag()
+                etag, weak = response.get_etag()
+            matched = matching_etag(etag)
+            if matched:
+                response.status_code = 304
+                response.set_data(b'')
+                response.headers.pop('Content-Length', None)
+                response.set_etag(matched)
+                return response
+
+        encoding = self.negotiate()
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+
+        response.set_data(self._compressed(data, encoding, etag if precompress else None))
+        response.headers['Content-Encoding'] = encoding
+        if etag:
+            response.set_etag(variant_etag(etag, encoding), weak)
+        return response
+
+    def stats(self):
+        with self._lock:
+            return dict(self._cache.stats(), brotli=self._brotli is not None)
+
+
+compression = AppExtension('compression', Compression)
@@ -0,0 +1,140 @@
+import os
+
+
+# 默认配置。每一项都可以通过同名环境变量覆盖，也可以写在 FOOD_DELIVERY_SETTINGS 指向的 Python 配置文件中
+# （优先级：环境变量 > 配置文件 > 默认值）
+class Config:
+    # 数据库地址，环境变量 DATABASE_URL 也可用于设置此项
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///food_delivery.db'
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    JWT_SECRET_KEY = 'food-delivery-secret-key'
+    # 事件流令牌的查询参数名（只有事件流接口从查询参数读取令牌）
+    JWT_QUERY_STRING_NAME = 'token'
+    # 菜单缓存后端：memory://（默认）、sqlite:///path/to/cache.db 或 redis://host:port/db
+    CACHE_URL = 'memory://'
+
+    # SQLite：每个新连接都会执行以下 PRAGMA，设为 None 则保持 SQLite 默认值
+    SQLITE_JOURNAL_MODE = 'WAL'
+    SQLITE_SYNCHRONOUS = 'NORMAL'
+    SQLITE_BUSY_TIMEOUT = 5000  # 毫秒
+    SQLITE_MMAP_SIZE = 256 * 1024 * 1024  # 字节
+    SQLITE_CACHE_SIZE = -64 * 1024  # 负数表示KiB，即每个连接64MB页缓存
+
+    # 连接池（PostgreSQL/MySQL 等；SQLite 文件库同样使用连接池以复用连接上的页缓存，设为0则每次新建连接）
+    DB_POOL_SIZE = 5
+    DB_MAX_OVERFLOW = 10
+    DB_POOL_RECYCLE = 1800  # 秒，-1 表示不回收
+    DB_POOL_TIMEOUT = 30
+    DB_POOL_PRE_PING = True
+
+    # 只读副本地址（环境变量中用逗号分隔），菜品列表、详情与评论的查询随机发往其中之一
+    REPLICA_DATABASE_URLS = []
+    # 用户加入购物车或发表评论后，该客户端在此时间内的读请求仍走主库（读己之写）；
+    # 菜单被修改后的这段时间内，缓存未命中的请求也在主库上生成缓存条目。应大于副本的同步延迟
+    REPLICA_STICKY_SECONDS = 10
+    # 由副本生成的菜单缓存条目的有效期，限制副本延迟造成的过期内容存留时间
+    REPLICA_CACHE_TTL = 30
+
+    # 购物车存储：None 表示直接读写 CartItem 表；memory://（单 worker）或 redis://host:port/db 时
+    # 购物车保存在键值存储中，每隔 CART_FLUSH_INTERVAL 秒把有变化的购物车批量写回 CartItem
+    CART_STORE_URL = None
+    CART_FLUSH_INTERVAL = 1.0
+    CART_FLUSH_BATCH_SIZE = 500
+
+    # 响应压缩：超过 COMPRESS_MIN_SIZE 字节的 JSON/CSV 响应按 Accept-Encoding 使用 br（需安装 brotli 包）或 gzip
+    COMPRESS_MIN_SIZE = 1024
+    COMPRESS_LEVEL = 6  # gzip 压缩级别 1-9
+    COMPRESS_BROTLI_QUALITY = 5  # brotli 压缩质量 0-11
+
+    # 请求监控：/metrics 输出 Prometheus 指标，响应带 Server-Timing 头；
+    # 单个请求的SQL语句数或耗时（毫秒）超出预算时记录警告日志，None 表示不检查
+    METRICS_ENABLED = True
+    METRICS_TOKEN = None  # 设置后 /metrics 需要 Authorization: Bearer <token>
+    METRICS_SERVER_TIMING = True
+    METRICS_QUERY_BUDGET = None
+    METRICS_LATENCY_BUDGET_MS = None
+    METRICS_LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]  # 秒
+
+    # 订单事件推送（SSE）：memory://（单 worker）或 redis://host:port/db（多个 worker 共享）。
+    # 每个频道保留最近 EVENTS_BUFFER_SIZE 个事件用于断线续传；每个事件流连接保持 EVENTS_STREAM_SECONDS 秒后由客户端重连，
+    # 每个 worker 最多同时保持 EVENTS_MAX_STREAMS 个事件流
+    EVENTS_URL = 'memory://'
+    EVENTS_BUFFER_SIZE = 1000
+    EVENTS_HEARTBEAT = 15  # 秒
+    EVENTS_STREAM_SECONDS = 300
+    EVENTS_MAX_STREAMS = 50
+    EVENTS_TOKEN_EXPIRES = 60  # 秒，事件流令牌只在建立连接时校验
+
+    # 订单归档（flask archive-orders）：超过 ARCHIVE_AFTER_DAYS 天的已送达订单按批移到归档表，
+    # 每批 ARCHIVE_BATCH_SIZE 个订单，批之间暂停 ARCHIVE_BATCH_PAUSE 秒以免长时间占用写锁。
+    # ARCHIVE_DATABASE_URL 为 None 时归档表与主库在同一个数据库中，也可以设为单独的 sqlite:///path/to/archive.db
+    ARCHIVE_DATABASE_URL = None
+    ARCHIVE_AFTER_DAYS = 90
+    ARCHIVE_BATCH_SIZE = 500
+    ARCHIVE_BATCH_PAUSE = 0.2
+
+
+def _coerce(value, default):
+    if isinstance(default, list):
+        return [item.strip() for item in value.split(',') if item.strip()]
+    if isinstance(default, bool):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    if isinstance(default, int):
+        return int(value)
+    if isinstance(default, float):
+        return float(value)
+    if default is None and value.strip().lower() in ('', 'none'):
+        return None
+    return value
+
+
+# overrides 为 create_app() 传入的配置，优先级最高
+def load_config(app, overrides=None):
+    app.config.from_object(Config)
+    app.config.from_envvar('FOOD_DELIVERY_SETTINGS', silent=True)
+    if 'DATABASE_URL' in os.environ:
+        app.config['SQLALCHEMY_DATABASE_URI'] = os.environ['DATABASE_URL']
+    for key in dir(Config):
+        if key.isupper() and key in os.environ:
+            app.config[key] = _coerce(os.environ[key], getattr(Config, key))
+    if overrides:
+        app.config.update(overrides)
+    # 副本注册为 Flask-SQLAlchemy 的 bind：replica_0、replica_1 ...
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    # 归档表使用 archive bind，未单独配置时指向主库
+    binds['archive'] = app.config.get('ARCHIVE_DATABASE_URL') or app.config['SQLALCHEMY_DATABASE_URI']
+    replicas = []
+    for index, url in enumerate(app.config['REPLICA_DATABASE_URLS']):
+        replicas.append('replica_%d' % index)
+        binds[replicas[-1]] = url
+    app.config['SQLALCHEMY_BINDS'] = binds
+    app.config['REPLICA_BINDS'] = replicas
+
+
+# 新建 SQLite 连接时执行的 PRAGMA 语句
+def sqlite_pragmas(config):
+    pragmas = []
+    for key, name in (('SQLITE_JOURNAL_MODE', 'journal_mode'),
+                      ('SQLITE_SYNCHRONOUS', 'synchronous'),
+                      ('SQLITE_BUSY_TIMEOUT', 'busy_timeout'),
+                      ('SQLITE_MMAP_SIZE', 'mmap_size'),
+                      ('SQLITE_CACHE_SIZE', 'cache_size')):
+        value = config.get(key)
+        if value is not None:
+            pragmas.append('PRAGMA %s=%s' % (name, value))
+    return pragmas
+
+
+# 连接池参数；未配置（如只在 Flask 中设置了数据库地址）时沿用 Flask-SQLAlchemy 的默认行为
+def pool_options(config):
+    if config.get('DB_POOL_SIZE') is None:
+        return {}
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config.get('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 30),
+        'pool_pre_ping': config.get('DB_POOL_PRE_PING', False)
+    }
+    if config.get('DB_POOL_RECYCLE') is not None:
+        options['pool_recycle'] = config['DB_POOL_RECYCLE']
+    return options
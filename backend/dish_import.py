@@ -0,0 +1,360 @@
+import codecs
+import csv
+import io
+import json
+import math
+import os
+
+from sqlalchemy import bindparam
+
+import search
+from models import db, Dish, Category
+from serializers import dumps
+
+# 菜品批量导入导出。导入文件逐行读取、校验，分类名称在开始时一次查询解析为ID，
+# 有效行按批（IMPORT_BATCH_SIZE）批量插入或更新，全部在调用方的同一个事务中执行，由调用方决定提交或回滚。
+# 导出的列与导入相同（分类为名称），导出的文件修改后可以直接导入。
+
+FORMATS = ('csv', 'ndjson', 'json')
+FIELDS = ('id', 'name', 'description', 'price', 'image_url', 'category')
+# 可省略的列：文件（或 JSON 行）中没有的列在更新时保持原值，新建时为空
+OPTIONAL_COLUMNS = ('description', 'image_url', 'category_id')
+MATCH_KEYS = ('id', 'name')
+IMPORT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+EXPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+_MIMETYPE_FORMATS = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+    'application/json': 'json'
+}
+
+
+# 整个文件无法导入（格式未知、缺少必需的列、编码错误等）
+class ImportFileError(Exception):
+    pass
+
+
+# 格式优先取 format 参数，其次按文件扩展名和内容类型判断
+def detect_format(requested=None, filename=None, mimetype=None):
+    if requested:
+        if requested not in FORMATS:
+            raise ImportFileError('Format must be csv, ndjson or json')
+        return requested
+    extension = os.path.splitext(filename or '')[1].lstrip('.').lower()
+    if extension in FORMATS:
+        return extension
+    if extension == 'jsonl':
+        return 'ndjson'
+    if mimetype in _MIMETYPE_FORMATS:
+        return _MIMETYPE_FORMATS[mimetype]
+    raise ImportFileError('Unknown file format, pass format=csv|ndjson|json')
+
+
+# 逐行读取，产生 (行号, 记录, 错误)；行号从1开始，不含 CSV 表头。
+# CSV 与 NDJSON 流式读取；JSON 数组需要整体解析，大文件请使用 NDJSON
+def read_records(stream, file_format):
+    reader = codecs.getreader('utf-8-sig')(stream)
+    try:
+        if file_format == 'csv':
+            yield from _read_csv(reader)
+        elif file_format == 'ndjson':
+            yield from _read_ndjson(reader)
+        else:
+            yield from _read_json(reader)
+    except UnicodeDecodeError:
+        raise ImportFileError('File must be UTF-8 encoded')
+
+
+def _read_csv(reader):
+    rows = csv.DictReader(reader)
+    if rows.fieldnames is None:
+        return
+    fieldnames = [name.strip() for name in rows.fieldnames]
+    missing = [name for name in ('name', 'price') if name not in fieldnames]
+    if missing:
+        raise ImportFileError('Missing CSV columns: %s' % ', '.join(missing))
+    rows.fieldnames = fieldnames
+    for number, row in enumerate(rows, 1):
+        if None in row:
+            yield number, None, 'Row has more values than columns'
+        else:
+            yield number, row, None
+
+
+def _read_ndjson(reader):
+    number = 0
+    for line in reader:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield number, None, 'Invalid JSON'
+            continue
+        yield number, record, None if isinstance(record, dict) else 'Row must be a JSON object'
+
+
+def _read_json(reader):
+    try:
+        records = json.load(reader)
+    except ValueError:
+        raise ImportFileError('Invalid JSON')
+    if not isinstance(records, list):
+        raise ImportFileError('JSON upload must be an array of dishes')
+    for number, record in enumerate(records, 1):
+        yield number, record, None if isinstance(record, dict) else 'Row must be a JSON object'
+
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _integer(value):
+    if isinstance(value, bool):
+        raise ValueError()
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError()
+    return int(value)
+
+
+class DishImporter:
+    # key=name 时没有 id 的行按名称匹配已有菜品（名称唯一时更新，否则新建）；
+    # create_categories 为真时自动创建不存在的分类，否则该行报错
+    def __init__(self, key='id', create_categories=False, batch_size=IMPORT_BATCH_SIZE):
+        if key not in MATCH_KEYS:
+            raise ImportFileError('key must be id or name')
+        self.key = key
+        self.create_categories = create_categories
+        self.batch_size = batch_size
+        self.categories = {name: category_id for category_id, name in
+                           db.session.query(Category.id, Category.name)}
+        self.category_ids = set(self.categories.values())
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.created_categories = []
+        self.error_count = 0
+        self.errors = []
+        self._batch = []
+        self._seen = set()
+        self._updated_ids = []
+        # 导入前的最大菜品ID，结束时据此找出新插入的菜品并建立全文索引
+        self._max_id = db.session.query(db.func.max(Dish.id)).scalar() or 0
+
+    def error(self, number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': number, 'message': message})
+
+    def add(self, number, record, error=None):
+        self.rows += 1
+        if error is None:
+            values, error = self.validate(record)
+        if error is not None:
+            self.error(number, error)
+            return
+        # 同一文件中重复的菜品（相同ID，或按名称匹配时相同名称）只接受第一行
+        identity = ('id', values['id']) if values['id'] is not None else \
+            ('name', values['name']) if self.key == 'name' else None
+        if identity is not None:
+            if identity in self._seen:
+                self.error(number, 'Duplicate dish %s %s in file' % identity)
+                return
+            self._seen.add(identity)
+        self._batch.append((number, values))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def validate(self, record):
+        name = _text(record.get('name'))
+        if name is None:
+            return None, 'name is required'
+        if len(name) > 100:
+            return None, 'name must be at most 100 characters'
+
+        price = record.get('price')
+        try:
+            if isinstance(price, bool):
+                raise ValueError()
+            price = float(price)
+        except (TypeError, ValueError):
+            return None, 'price must be a number'
+        if not math.isfinite(price) or price < 0:
+            return None, 'price must not be negative'
+
+        image_url = _text(record.get('image_url'))
+        if image_url is not None and len(image_url) > 200:
+            return None, 'image_url must be at most 200 characters'
+
+        dish_id = record.get('id')
+        if _text(dish_id) is None:
+            dish_id = None
+        else:
+            try:
+                dish_id = _integer(dish_id)
+            except (TypeError, ValueError):
+                return None, 'id must be an integer'
+
+        values = {'id': dish_id, 'name': name, 'price': price}
+        if 'description' in record:
+            values['description'] = _text(record.get('description'))
+        if 'image_url' in record:
+            values['image_url'] = image_url
+        if 'category' in record or 'category_id' in record:
+            category, error = self.resolve_category(record)
+            if error:
+                return None, error
+            # 需要新建的分类以名称暂存，写入批次时只为通过全部检查的行创建
+            values['_category' if isinstance(category, str) else 'category_id'] = category
+        return values, None
+
+    # 分类按名称（category 列）解析，也接受 category_id。
+    # 返回分类ID；不存在且允许自动创建时返回分类名称
+    def resolve_category(self, record):
+        category_name = _text(record.get('category'))
+        if category_name is not None:
+            if category_name in self.categories:
+                return self.categories[category_name], None
+            if not self.create_categories:
+                return None, 'Unknown category: %s' % category_name
+            if len(category_name) > 50:
+                return None, 'category must be at most 50 characters'
+            return category_name, None
+
+        category_id = record.get('category_id')
+        if _text(category_id) is None:
+            return None, None
+        try:
+            category_id = _integer(category_id)
+        except (TypeError, ValueError):
+            return None, 'category_id must be an integer'
+        if category_id not in self.category_ids:
+            return None, 'Unknown category_id: %d' % category_id
+        return category_id, None
+
+    # 一批有效行：一次查询已有菜品，然后批量插入与批量更新
+    def flush(self):
+        batch, self._batch = self._batch, []
+        if not batch:
+            return
+
+        ids = [values['id'] for _, values in batch if values['id'] is not None]
+        existing = {row[0] for row in db.session.query(Dish.id).filter(Dish.id.in_(ids), Dish.active())} if ids else set()
+        by_name = {}
+        if self.key == 'name':
+            names = [values['name'] for _, values in batch if values['id'] is None]
+            if names:
+                for dish_id, name in db.session.query(Dish.id, Dish.name).filter(Dish.name.in_(names), Dish.active()):
+                    by_name.setdefault(name, []).append(dish_id)
+
+        inserts = []
+        updates = []
+        for number, values in batch:
+            dish_id = values.pop('id')
+            if dish_id is None:
+                matches = by_name.get(values['name'], ())
+                if len(matches) > 1:
+                    self.error(number, 'Name matches %d dishes, add an id column' % len(matches))
+                    continue
+                if not matches:
+                    inserts.append(values)
+                    continue
+                dish_id = matches[0]
+            elif dish_id not in existing:
+                self.error(number, 'Dish %d does not exist' % dish_id)
+                continue
+            values['_id'] = dish_id
+            updates.append(values)
+
+        for values in inserts + updates:
+            if '_category' in values:
+                values['category_id'] = self.create_category(values.pop('_category'))
+
+        table = Dish.__table__
+        if inserts:
+            for values in inserts:
+                for column in OPTIONAL_COLUMNS:
+                    values.setdefault(column, None)
+            db.session.execute(table.insert(), inserts)
+            self.created += len(inserts)
+        if updates:
+            # 只更新文件中有的列，评分聚合等保持不变；列不同的行分组批量更新
+            groups = {}
+            for values in updates:
+                groups.setdefault(tuple(sorted(values)), []).append(values)
+            for group in groups.values():
+                db.session.execute(table.update().where(table.c.id == bindparam('_id')), group)
+            self.updated += len(updates)
+            self._updated_ids.extend(values['_id'] for values in updates)
+
+    # 自动创建分类（同一文件中的同名分类只创建一次）
+    def create_category(self, name):
+        if name not in self.categories:
+            category = Category(name=name)
+            db.session.add(category)
+            db.session.flush()
+            self.categories[name] = category.id
+            self.category_ids.add(category.id)
+            self.created_categories.append(name)
+        return self.categories[name]
+
+    # 写入剩余的行并更新全文索引（仍在同一事务中）
+    def finish(self):
+        self.flush()
+        created_ids = [row[0] for row in db.session.query(Dish.id).filter(Dish.id > self._max_id)]
+        search.index_dishes(self._updated_ids + created_ids)
+
+    def report(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'created_categories': self.created_categories,
+            'error_count': self.error_count,
+            # 已有菜品的匹配错误在写入批次时才发现，按行号排序
+            'errors': sorted(self.errors, key=lambda error: error['row'])
+        }
+
+
+# 导出：按菜品ID顺序分批读取，积累到一定大小再输出
+def export_rows():
+    return db.session.query(Dish.id, Dish.name, Dish.description, Dish.price, Dish.image_url,
+                            Category.name.label('category')) \
+        .outerjoin(Category, Dish.category_id == Category.id) \
+        .filter(Dish.active()) \
+        .order_by(Dish.id) \
+        .execution_options(stream_results=True).yield_per(EXPORT_BATCH_SIZE)
+
+
+def export_ndjson(rows):
+    chunk = []
+    size = 0
+    for row in rows:
+        line = dumps(dict(zip(FIELDS, row))) + b'\n'
+        chunk.append(line)
+        size += len(line)
+        if size > EXPORT_CHUNK_SIZE:
+            yield b''.join(chunk)
+            chunk = []
+            size = 0
+    yield b''.join(chunk)
+
+
+def export_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    for row in rows:
+        writer.writerow(['' if value is None else value for value in row])
+        if buffer.tell() > EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
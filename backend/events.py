@@ -0,0 +1,235 @@
+import json
+import logging
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+from serializers import dumps
+from extensions import AppExtension
+
+logger = logging.getLogger(__name__)
+
+# 订单事件推送（Server-Sent Events）：下单和订单状态变化时向下单用户的频道和管理员频道发布事件，
+# 客户端打开事件流后只需加载一次订单列表，之后按事件更新。
+# 每个频道保留最近 EVENTS_BUFFER_SIZE 个事件，断线重连时按 Last-Event-ID 补发；
+# 请求的事件已不在缓冲区中（或ID无法识别）时发送 reset 事件，客户端应重新加载订单列表。
+#
+# EVENTS_URL：memory://（默认，进程内，仅适用于单 worker）或 redis://host:port/db（Redis Stream，多个 worker 共享）
+
+ADMIN_CHANNEL = 'admin'
+
+
+def user_channel(user_id):
+    return 'user:%d' % user_id
+
+
+class ResetRequired(Exception):
+    pass
+
+
+# 进程内事件缓冲区：事件ID为进程内递增的整数
+class MemoryEventBackend:
+    def __init__(self, buffer_size=1000):
+        self.buffer_size = buffer_size
+        self._condition = threading.Condition()
+        self._channels = {}
+        # 每个频道已被淘汰的最大事件ID，早于它的 Last-Event-ID 无法补发
+        self._dropped = {}
+        self._last_id = 0
+
+    def publish(self, channels, event):
+        with self._condition:
+            self._last_id += 1
+            for channel in channels:
+                events = self._channels.setdefault(channel, deque())
+                if len(events) >= self.buffer_size:
+                    self._dropped[channel] = events.popleft()[0]
+                events.append((self._last_id, event))
+            self._condition.notify_all()
+            return str(self._last_id)
+
+    def last_id(self, channel):
+        with self._condition:
+            return str(self._last_id)
+
+    def _parse(self, channel, after):
+        try:
+            after = int(after)
+        except (TypeError, ValueError):
+            raise ResetRequired()
+        # 进程重启后ID从头开始，大于当前ID的 Last-Event-ID 同样无法补发
+        if after > self._last_id or after < self._dropped.get(channel, 0):
+            raise ResetRequired()
+        return after
+
+    # 返回 after 之后的事件 [(id, event)]，没有新事件时最多等待 timeout 秒
+    def read(self, channel, after, timeout):
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            after = self._parse(channel, after)
+            while True:
+                events = [(str(event_id), event) for event_id, event in self._channels.get(channel, ())
+                          if event_id > after]
+                remaining = deadline - time.monotonic()
+                if events or remaining <= 0:
+                    return events
+                self._condition.wait(remaining)
+
+
+# Redis Stream：每个频道一个 stream，XADD 时按 MAXLEN 近似裁剪，XREAD BLOCK 等待新事件
+class RedisEventBackend:
+    def __init__(self, client, buffer_size=1000, prefix='food-delivery:'):
+        self.client = client
+        self.buffer_size = buffer_size
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url, buffer_size=1000):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('The redis package is required for EVENTS_URL=%s' % url)
+        return cls(redis.Redis.from_url(url), buffer_size)
+
+    def _key(self, channel):
+        return '%sorder-events:%s' % (self.prefix, channel)
+
+    def publish(self, channels, event):
+        data = dumps(event)
+        pipe = self.client.pipeline(transaction=False)
+        for channel in channels:
+            pipe.xadd(self._key(channel), {'data': data}, maxlen=self.buffer_size, approximate=True)
+        return pipe.execute()[0].decode('ascii')
+
+    def last_id(self, channel):
+        entries = self.client.xrevrange(self._key(channel), count=1)
+        return entries[0][0].decode('ascii') if entries else '0-0'
+
+    @staticmethod
+    def _id(value):
+        milliseconds, _, sequence = value.partition('-')
+        return int(milliseconds), int(sequence or 0)
+
+    def _check(self, channel, after):
+        try:
+            after_id = self._id(after)
+        except (AttributeError, ValueError):
+            raise ResetRequired()
+        if after_id == (0, 0):
+            return
+        # Last-Event-ID 早于缓冲区中最早的事件且自身已被裁剪时，之间的事件可能已丢失
+        first = self.client.xrange(self._key(channel), count=1)
+        if first and self._id(first[0][0].decode('ascii')) > after_id \
+                and not self.client.xrange(self._key(channel), after, after):
+            raise ResetRequired()
+
+    def read(self, channel, after, timeout):
+        self._check(channel, after)
+        result = self.client.xread({self._key(channel): after}, block=max(int(timeout * 1000), 1))
+        events = []
+        for _, entries in result or ():
+            for event_id, fields in entries:
+                events.append((event_id.decode('ascii'), json.loads(fields[b'data'])))
+        return events
+
+
+def create_backend(url, buffer_size=1000):
+    scheme = urlparse(url).scheme
+    if scheme == 'memory':
+        return MemoryEventBackend(buffer_size)
+    if scheme in ('redis', 'rediss', 'unix'):
+        return RedisEventBackend.from_url(url, buffer_size)
+    raise ValueError('Unsupported EVENTS_URL: %s' % url)
+
+
+def format_event(event_id, name, data):
+    return b'id: %s\nevent: %s\ndata: %s\n\n' % (event_id.encode('ascii'), name.encode('ascii'), dumps(data))
+
+
+class OrderEvents:
+    def __init__(self, app=None):
+        self.backend = None
+        self.heartbeat = 15
+        self.stream_seconds = 300
+        self.max_streams = 50
+        self.token_expires = 60
+        self._streams = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('EVENTS_URL', 'memory://')
+        app.config.setdefault('EVENTS_BUFFER_SIZE', 1000)
+        app.config.setdefault('EVENTS_HEARTBEAT', 15)
+        app.config.setdefault('EVENTS_STREAM_SECONDS', 300)
+        app.config.setdefault('EVENTS_MAX_STREAMS', 50)
+        app.config.setdefault('EVENTS_TOKEN_EXPIRES', 60)
+        self.backend = create_backend(app.config['EVENTS_URL'], app.config['EVENTS_BUFFER_SIZE'])
+        self.heartbeat = app.config['EVENTS_HEARTBEAT']
+        self.stream_seconds = app.config['EVENTS_STREAM_SECONDS']
+        self.max_streams = app.config['EVENTS_MAX_STREAMS']
+        self.token_expires = app.config['EVENTS_TOKEN_EXPIRES']
+
+    # 在事务提交之后调用；发布失败只记录日志，不影响已完成的操作（客户端重连后收到 reset 或重新加载）
+    def publish(self, user_id, name, data):
+        event = {'event': name, 'data': data}
+        try:
+            return self.backend.publish((user_channel(user_id), ADMIN_CHANNEL), event)
+        except Exception:
+            logger.exception('Failed to publish order event %s', name)
+            return None
+
+    def order_created(self, order):
+        return self.publish(order['user']['id'], 'order_created', order)
+
+    def order_status_changed(self, order_id, user_id, status, previous_status):
+        return self.publish(user_id, 'order_status', {
+            'id': order_id,
+            'status': status,
+            'previous_status': previous_status
+        })
+
+    # 频道当前的最后事件ID，以它作为 Last-Event-ID 建立的事件流从此刻之后开始推送
+    def last_id(self, channel):
+        return self.backend.last_id(channel)
+
+    # 每个 worker 同时保持的事件流数有上限，超出时返回 False（接口返回503）。
+    # 每个事件流占用一个服务线程，需要使用多线程（gthread）或协程 worker
+    def acquire_stream(self):
+        with self._lock:
+            if self._streams >= self.max_streams:
+                return False
+            self._streams += 1
+            return True
+
+    def release_stream(self):
+        with self._lock:
+            self._streams -= 1
+
+    # 事件流：不访问数据库和请求上下文。连接保持 EVENTS_STREAM_SECONDS 秒后结束，
+    # 浏览器的 EventSource 会带着 Last-Event-ID 自动重连
+    def stream(self, channel, last_event_id=None):
+        deadline = time.monotonic() + self.stream_seconds
+        yield b'retry: 3000\n\n'
+        cursor = last_event_id
+        if cursor is None:
+            cursor = self.backend.last_id(channel)
+        while time.monotonic() < deadline:
+            try:
+                events = self.backend.read(channel, cursor, min(self.heartbeat, deadline - time.monotonic()))
+            except ResetRequired:
+                cursor = self.backend.last_id(channel)
+                yield format_event(cursor, 'reset', {})
+                continue
+            if not events:
+                # 注释行作为心跳，防止代理关闭空闲连接，同时及时发现已断开的客户端
+                yield b': keepalive\n\n'
+                continue
+            for event_id, event in events:
+                yield format_event(event_id, event['event'], event['data'])
+            cursor = events[-1][0]
+
+
+order_events = AppExtension('order_events', OrderEvents)
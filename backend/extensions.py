@@ -0,0 +1,24 @@
+from flask import current_app
+
+
+# 扩展的状态按应用保存在 app.extensions 中：init_app 为每个应用创建一个独立的实例，
+# 模块级的扩展对象只是代理，把属性访问转发给当前应用（current_app）的实例。
+# 同一进程中创建的多个应用（测试、冷启动测量）各自拥有缓存、存储和指标，互不影响。
+# 需要在应用上下文之外使用的方法（如事件流生成器）应在视图中取得，取得时即绑定到当前应用的实例
+class AppExtension:
+    def __init__(self, name, factory):
+        self._name = name
+        self._factory = factory
+
+    def init_app(self, app):
+        state = self._factory()
+        state.init_app(app)
+        app.extensions[self._name] = state
+        return state
+
+    # 某个应用（默认为当前应用）的实例
+    def for_app(self, app=None):
+        return (app or current_app).extensions[self._name]
+
+    def __getattr__(self, name):
+        return getattr(self.for_app(), name)
@@ -0,0 +1,233 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from extensions import AppExtension
+
+logger = logging.getLogger(__name__)
+
+# 请求级监控：通过 SQLAlchemy 引擎事件统计每个请求执行的 SQL 语句数和数据库耗时，
+# 在请求结束时按接口（路由规则）记录延迟、查询数和响应大小的直方图，以 Prometheus 文本格式在 /metrics 输出。
+# 响应带 Server-Timing 头（浏览器开发者工具中可见），超出查询数或延迟预算的请求记录警告日志。
+# 指标保存在进程内，多 worker 部署时每个 worker 分别统计。
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+UNMATCHED_ENDPOINT = '<unmatched>'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class RequestStats:
+    __slots__ = ('started', 'queries', 'db_time', 'query_started')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.query_started = None
+
+
+# 当前请求的统计；不在请求中（命令行、后台线程）或未启用监控时返回 None
+def request_stats():
+    if not has_request_context():
+        return None
+    return g.get('_request_stats')
+
+
+# 所有引擎（主库与副本）共用的监听器，只统计请求线程中执行的语句
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = request_stats()
+    if stats is not None:
+        stats.query_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = request_stats()
+    if stats is not None and stats.query_started is not None:
+        stats.queries += 1
+        stats.db_time += time.perf_counter() - stats.query_started
+        stats.query_started = None
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value)) for name, value in pairs)
+
+
+def _number(value):
+    if isinstance(value, float):
+        if value == float('inf'):
+            return '+Inf'
+        return repr(round(value, 6))
+    return str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+
+    def inc(self, labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in sorted(self._values.items()):
+            yield self.name + _labels(self.labels, labels), value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [每个桶的计数..., +Inf 桶计数, 总和]
+        self._values = {}
+
+    def observe(self, labels, value):
+        counts = self._values.get(labels)
+        if counts is None:
+            counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0]
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def samples(self):
+        for labels, counts in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield self.name + '_bucket' + _labels(self.labels, labels, ('le', _number(float(bound)))), \
+                    cumulative
+            yield self.name + '_sum' + _labels(self.labels, labels), counts[-1]
+            yield self.name + '_count' + _labels(self.labels, labels), cumulative
+
+
+class Metrics:
+    def __init__(self, app=None):
+        self.enabled = True
+        self.token = None
+        self.server_timing = True
+        self.query_budget = None
+        self.latency_budget = None
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._create_metrics(LATENCY_BUCKETS)
+        if app is not None:
+            self.init_app(app)
+
+    def _create_metrics(self, latency_buckets):
+        endpoint = ('method', 'endpoint')
+        self.requests = Counter('http_requests_total', 'Requests by endpoint and status code',
+                                endpoint + ('status',))
+        self.latency = Histogram('http_request_duration_seconds', 'Request latency', endpoint,
+                                 latency_buckets)
+        self.queries = Histogram('http_request_db_queries', 'SQL statements executed per request', endpoint,
+                                 QUERY_BUCKETS)
+        self.db_time = Counter('http_request_db_seconds_total', 'Time spent executing SQL statements', endpoint)
+        self.response_size = Histogram('http_response_size_bytes', 'Response body size after compression',
+                                       endpoint, SIZE_BUCKETS)
+        self.over_budget = Counter('http_requests_over_budget_total', 'Requests exceeding a budget',
+                                   endpoint + ('budget',))
+        self._metrics = (self.requests, self.latency, self.queries, self.db_time, self.response_size,
+                         self.over_budget)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_TOKEN', None)
+        app.config.setdefault('METRICS_SERVER_TIMING', True)
+        app.config.setdefault('METRICS_QUERY_BUDGET', None)
+        app.config.setdefault('METRICS_LATENCY_BUDGET_MS', None)
+        app.config.setdefault('METRICS_LATENCY_BUCKETS', list(LATENCY_BUCKETS))
+        self.enabled = app.config['METRICS_ENABLED']
+        self.token = app.config['METRICS_TOKEN']
+        self.server_timing = app.config['METRICS_SERVER_TIMING']
+        # 预算默认为 None，通过环境变量设置时是字符串
+        query_budget = app.config['METRICS_QUERY_BUDGET']
+        self.query_budget = int(query_budget) if query_budget is not None else None
+        latency_budget = app.config['METRICS_LATENCY_BUDGET_MS']
+        self.latency_budget = float(latency_budget) / 1000 if latency_budget is not None else None
+        self._create_metrics([float(bound) for bound in app.config['METRICS_LATENCY_BUCKETS']])
+        if self.enabled:
+            app.before_request(self.before_request)
+            app.after_request(self.after_request)
+
+    def before_request(self):
+        g._request_stats = RequestStats()
+
+    def after_request(self, response):
+        stats = request_stats()
+        if stats is None:
+            return response
+        elapsed = time.perf_counter() - stats.started
+        labels = (request.method, request.url_rule.rule if request.url_rule else UNMATCHED_ENDPOINT)
+        # 流式响应（如订单导出）的大小在发送前未知，不记录
+        size = None if response.is_streamed else response.calculate_content_length()
+
+        over_budget = []
+        if self.query_budget is not None and stats.queries > self.query_budget:
+            over_budget.append('queries')
+        if self.latency_budget is not None and elapsed > self.latency_budget:
+            over_budget.append('latency')
+
+        with self._lock:
+            self.requests.inc(labels + (str(response.status_code),))
+            self.latency.observe(labels, elapsed)
+            self.queries.observe(labels, stats.queries)
+            self.db_time.inc(labels, stats.db_time)
+            if size is not None:
+                self.response_size.observe(labels, size)
+            for budget in over_budget:
+                self.over_budget.inc(labels + (budget,))
+
+        if over_budget:
+            logger.warning('%s %s exceeded its %s budget: %d queries, %.1f ms (db %.1f ms)',
+                           request.method, request.full_path.rstrip('?'), '/'.join(over_budget),
+                           stats.queries, elapsed * 1000, stats.db_time * 1000)
+        if self.server_timing:
+            response.headers.add('Server-Timing', 'db;dur=%.2f;desc="%d queries", app;dur=%.2f' % (
+                stats.db_time * 1000, stats.queries, elapsed * 1000))
+        return response
+
+    # 配置了 METRICS_TOKEN 时，/metrics 需要 Authorization: Bearer <token>
+    def authorized(self):
+        if not self.token:
+            return True
+        return request.headers.get('Authorization') == 'Bearer ' + self.token
+
+    def render(self):
+        lines = [
+            '# HELP process_start_time_seconds Start time of the process since unix epoch',
+            '# TYPE process_start_time_seconds gauge',
+            'process_start_time_seconds %s' % _number(float(self._started))
+        ]
+        with self._lock:
+            for metric in self._metrics:
+                lines.append('# HELP %s %s' % (metric.name, metric.help))
+                lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+                lines.extend('%s %s' % (name, _number(value)) for name, value in metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+metrics = AppExtension('metrics', Metrics)
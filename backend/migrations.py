@@ -0,0 +1,230 @@
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, inspect, text
+
+import search
+from models import db, rebuild_dish_ratings, OrderArchive, OrderItemArchive
+
+# 数据库结构迁移。db.create_all() 只会创建缺失的表，已有数据库上新增的列和索引由迁移补齐；
+# 已执行的版本记录在 schema_migration 表中（flask db upgrade / downgrade / current）。
+# 迁移在执行前检查列和索引是否已存在，因此对 create_all() 刚建好的新库执行时只记录版本。
+
+_metadata = MetaData()
+schema_migration = Table(
+    'schema_migration', _metadata,
+    Column('revision', String(32), primary_key=True),
+    Column('description', String(200)),
+    Column('applied_at', DateTime)
+)
+
+
+class Migration:
+    def __init__(self, revision, description, upgrade, downgrade=None):
+        self.revision = revision
+        self.description = description
+        self.upgrade = upgrade
+        self.downgrade = downgrade
+
+
+def _columns(table_name):
+    inspector = inspect(db.session.connection())
+    if not inspector.has_table(table_name):
+        return None
+    return {column['name'] for column in inspector.get_columns(table_name)}
+
+
+def _create_indexes(names):
+    connection = db.session.connection()
+    inspector = inspect(connection)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        for index in table.indexes:
+            if index.name in names:
+                index.create(bind=connection, checkfirst=True)
+
+
+def _drop_indexes(names):
+    connection = db.session.connection()
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name in names:
+                index.drop(bind=connection, checkfirst=True)
+
+
+# 0001：评分聚合列与令牌版本列是在 create_all() 之后加入模型的，旧数据库缺少这些列
+def _upgrade_0001():
+    user_columns = _columns('user')
+    if user_columns is not None and 'token_version' not in user_columns:
+        db.session.execute(text(
+            'ALTER TABLE "user" ADD COLUMN token_version INTEGER NOT NULL DEFAULT 1'
+        ))
+    dish_columns = _columns('dish')
+    if dish_columns is not None and 'rating_avg' not in dish_columns:
+        db.session.execute(text('ALTER TABLE dish ADD COLUMN rating_sum INTEGER NOT NULL DEFAULT 0'))
+        db.session.execute(text('ALTER TABLE dish ADD COLUMN rating_count INTEGER NOT NULL DEFAULT 0'))
+        db.session.execute(text('ALTER TABLE dish ADD COLUMN rating_avg FLOAT NOT NULL DEFAULT 5.0'))
+        rebuild_dish_ratings(histogram=False)
+
+
+# 0002：热点查询使用的索引
+#   购物车：add_to_cart 按 (user_id, dish_id, specifications) 查找，get_cart/create_order 按 user_id；删除菜品时按 dish_id
+#   评论：get_dish_reviews 按 dish_id，按时间排序
+#   订单项：订单列表按 order_id 批量加载；删除菜品时按 dish_id
+#   订单、菜品：按用户/状态与按分类的索引（已在模型中声明，旧数据库上补建）
+HOT_PATH_INDEXES = (
+    'ix_cart_item_user_dish',
+    'ix_cart_item_dish',
+    'ix_review_dish_created',
+    'ix_order_item_order',
+    'ix_order_item_dish',
+    'ix_order_user_created',
+    'ix_order_status_created',
+    'ix_dish_category_id',
+    'ix_dish_category_price',
+    'ix_dish_price',
+    'ix_dish_rating_avg',
+)
+
+
+def _upgrade_0002():
+    _create_indexes(HOT_PATH_INDEXES)
+
+
+def _downgrade_0002():
+    _drop_indexes(HOT_PATH_INDEXES)
+
+
+# 0003：评分分布列（1-5星评论数），由已有评论回填。
+# 评论时间原先由 SQLite 的 CURRENT_TIMESTAMP 生成（不含微秒），统一为 SQLAlchemy 的存储格式，
+# 否则按时间分页时游标中的时间与已有评论的时间无法正确比较
+def _upgrade_0003():
+    dish_columns = _columns('dish')
+    if dish_columns is not None and 'rating_count_1' not in dish_columns:
+        for rating in range(1, 6):
+            db.session.execute(text(
+                'ALTER TABLE dish ADD COLUMN rating_count_%d INTEGER NOT NULL DEFAULT 0' % rating
+            ))
+        rebuild_dish_ratings()
+    if _columns('review') is not None:
+        db.session.execute(text(
+            "UPDATE review SET created_at = created_at || '.000000' WHERE length(created_at) = 19"
+        ))
+
+
+def _downgrade_0003():
+    for rating in range(1, 6):
+        db.session.execute(text('ALTER TABLE dish DROP COLUMN rating_count_%d' % rating))
+
+
+# 0004：批量导入按名称匹配菜品所用的索引
+def _upgrade_0004():
+    _create_indexes(('ix_dish_name',))
+
+
+def _downgrade_0004():
+    _drop_indexes(('ix_dish_name',))
+
+
+# 0005：菜品软删除列与订单归档表。归档表建在 archive bind 上（可能是单独的数据库），先于主库的修改执行。
+# 不能回退：删除 deleted_at 会让已删除的菜品重新出现，删除归档表会丢失已归档的订单
+def _upgrade_0005():
+    engine = db.get_engine(bind='archive')
+    for model in (OrderArchive, OrderItemArchive):
+        model.__table__.create(bind=engine, checkfirst=True)
+    dish_columns = _columns('dish')
+    if dish_columns is not None and 'deleted_at' not in dish_columns:
+        db.session.execute(text('ALTER TABLE dish ADD COLUMN deleted_at DATETIME'))
+
+
+# 0006：订单时间原先由 SQLite 的 CURRENT_TIMESTAMP 生成（不含微秒），与 0003 对评论的处理相同，
+# 统一为 SQLAlchemy 的存储格式，否则按时间分页时游标所在的订单仍满足 created_at < 游标，翻页停在同一页。
+# 已复制到归档表的订单一并处理（归档表先于主库修改）
+def _pad_created_at(connection, table_name):
+    if inspect(connection).has_table(table_name):
+        connection.execute(text(
+            'UPDATE "%s" SET created_at = created_at || \'.000000\' WHERE length(created_at) = 19' % table_name
+        ))
+
+
+def _upgrade_0006():
+    with db.get_engine(bind='archive').begin() as connection:
+        _pad_created_at(connection, 'order_archive')
+    _pad_created_at(db.session.connection(), 'order')
+
+
+# 0007：管理员订单列表不按用户或状态筛选时按 (created_at, id) 分页所用的索引
+def _upgrade_0007():
+    _create_indexes(('ix_order_created',))
+
+
+def _downgrade_0007():
+    _drop_indexes(('ix_order_created',))
+
+
+# 0008：分词规则修正后（字母数字与中文相连时分别切分），按新规则重建已有的全文索引
+def _upgrade_0008():
+    if search.search_available() and inspect(db.session.connection()).has_table(search.FTS_TABLE):
+        search.rebuild_search_index()
+
+
+MIGRATIONS = [
+    Migration('0001', 'Add rating aggregate and token version columns', _upgrade_0001),
+    Migration('0002', 'Add hot-path indexes', _upgrade_0002, _downgrade_0002),
+    Migration('0003', 'Add rating histogram columns and normalize review times', _upgrade_0003, _downgrade_0003),
+    Migration('0004', 'Add dish name index for bulk imports', _upgrade_0004, _downgrade_0004),
+    Migration('0005', 'Add dish soft delete and order archive tables', _upgrade_0005),
+    Migration('0006', 'Normalize order times', _upgrade_0006),
+    Migration('0007', 'Add order time index', _upgrade_0007, _downgrade_0007),
+    Migration('0008', 'Rebuild search index with mixed-script tokens', _upgrade_0008),
+]
+
+
+def applied_revisions():
+    schema_migration.create(bind=db.session.connection(), checkfirst=True)
+    return [row.revision for row in db.session.execute(
+        schema_migration.select().order_by(schema_migration.c.revision)
+    )]
+
+
+def current_revision():
+    applied = applied_revisions()
+    return applied[-1] if applied else None
+
+
+# 尚未执行的迁移
+def pending():
+    applied = set(applied_revisions())
+    return [migration for migration in MIGRATIONS if migration.revision not in applied]
+
+
+# 依次执行尚未执行的迁移，每个迁移与其版本记录在同一事务中提交；返回执行的迁移
+def upgrade():
+    applied = set(applied_revisions())
+    executed = []
+    for migration in MIGRATIONS:
+        if migration.revision in applied:
+            continue
+        migration.upgrade()
+        db.session.execute(schema_migration.insert().values(
+            revision=migration.revision,
+            description=migration.description,
+            applied_at=datetime.utcnow()
+        ))
+        db.session.commit()
+        executed.append(migration)
+    return executed
+
+
+# 回退最近一次迁移；没有 downgrade 的迁移不能回退
+def downgrade():
+    revision = current_revision()
+    if revision is None:
+        return None
+    migration = next(m for m in MIGRATIONS if m.revision == revision)
+    if migration.downgrade is None:
+        raise RuntimeError('Migration %s cannot be downgraded' % revision)
+    migration.downgrade()
+    db.session.execute(schema_migration.delete().where(schema_migration.c.revision == revision))
+    db.session.commit()
+    return migration
@@ -1,8 +1,71 @@
-from flask_sqlalchemy import SQLAlchemy
-from flask_bcrypt import generate_password_hash, check_password_hash
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from config import pool_options, sqlite_pragmas
+from passwords import password_hasher
+from sqlalchemy import event, func, orm, select
+from sqlalchemy.pool import QueuePool
+from contextlib import contextmanager
 from datetime import datetime
+import random
 
-db = SQLAlchemy()
+
+# 会话在 read_bind 被设置时把查询发往只读副本；刷新（INSERT/UPDATE/DELETE）始终发往主库。
+# 归档表（archive bind）可能在单独的数据库中，始终使用自己的 bind
+class RoutingSession(SignallingSession):
+    read_bind = None
+
+    def get_bind(self, mapper=None, clause=None):
+        archived = mapper is not None and mapper.persist_selectable.info.get('bind_key') == 'archive'
+        if self.read_bind is not None and not self._flushing and not archived:
+            return get_state(self.app).db.get_engine(self.app, bind=self.read_bind)
+        return super().get_bind(mapper, clause)
+
+
+# 按应用配置创建引擎：设置连接池参数，并在每个新建的 SQLite 连接上执行 PRAGMA
+class Database(SQLAlchemy):
+    def apply_driver_hacks(self, app, sa_url, options):
+        pool = pool_options(app.config)
+        if sa_url.drivername.startswith('sqlite'):
+            # 文件库默认使用 NullPool（每次请求新建连接）；配置了连接池时改用 QueuePool 复用连接
+            if pool.get('pool_size') and sa_url.database not in (None, '', ':memory:'):
+                options.update(poolclass=QueuePool, pool_size=pool['pool_size'],
+                               max_overflow=pool['max_overflow'], pool_timeout=pool['pool_timeout'])
+                options.setdefault('connect_args', {})['check_same_thread'] = False
+        else:
+            options.update(pool)
+        return super().apply_driver_hacks(app, sa_url, options)
+    
+    def create_engine(self, sa_url, engine_opts):
+        engine = super().create_engine(sa_url, engine_opts)
+        if engine.dialect.name == 'sqlite':
+            pragmas = sqlite_pragmas(self.get_app().config)
+            
+            @event.listens_for(engine, 'connect')
+            def set_sqlite_pragmas(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                for pragma in pragmas:
+                    cursor.execute(pragma)
+                cursor.close()
+        return engine
+    
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+    
+    # 在 with 块内的只读查询随机发往一个副本（REPLICA_DATABASE_URLS）；未配置副本时仍使用主库
+    @contextmanager
+    def read_replica(self):
+        binds = self.get_app().config.get('REPLICA_BINDS')
+        if not binds:
+            yield None
+            return
+        session = self.session()
+        previous = session.read_bind
+        session.read_bind = random.choice(binds)
+        try:
+            yield session.read_bind
+        finally:
+            session.read_bind = previous
+
+db = Database()
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -10,12 +73,22 @@ class User(db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(128))
     is_admin = db.Column(db.Boolean, default=False)
+    # 令牌版本：写入JWT，递增后该用户此前签发的令牌全部失效
+    token_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     
+    # 哈希计算在进程池中执行，繁忙时抛出 PasswordPoolBusy
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password).decode('utf-8')
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.check(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        return password_hasher.needs_rehash(self.password_hash)
+    
+    # 使该用户此前签发的令牌全部失效：修改密码、变更角色或管理员撤销时调用（登录时的重新哈希不调用）
+    def revoke_tokens(self):
+        self.token_version = User.token_version + 1
 
 class Category(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -32,6 +105,43 @@ class Dish(db.Model):
     price = db.Column(db.Float, nullable=False)
     image_url = db.Column(db.String(200))
     category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=True)
+    # 评分聚合（评分总和与评论数），随评论写入同步维护，避免列表页逐个统计评论
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # 平均评分（无评论时为默认的5.0），单独存储以便按评分排序时走索引
+    rating_avg = db.Column(db.Float, nullable=False, default=5.0, server_default='5.0')
+    # 各星级的评论数（1-5星分布），同样随评论写入维护
+    rating_count_1 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_count_2 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_count_3 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_count_4 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_count_5 = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # 软删除：删除的菜品不再出现在菜单、购物车和下单中，历史订单项与评论仍保留
+    deleted_at = db.Column(db.DateTime, nullable=True)
+
+    # 菜品目录的筛选与键集分页索引
+    __table_args__ = (
+        db.Index('ix_dish_category_id', 'category_id', 'id'),
+        db.Index('ix_dish_category_price', 'category_id', 'price', 'id'),
+        db.Index('ix_dish_price', 'price', 'id'),
+        db.Index('ix_dish_rating_avg', 'rating_avg', 'id'),
+        # 批量导入时按名称匹配已有菜品
+        db.Index('ix_dish_name', 'name'),
+    )
+
+    # 未删除的菜品
+    @staticmethod
+    def active():
+        return Dish.deleted_at.is_(None)
+
+    @property
+    def average_rating(self):
+        return round(self.rating_avg, 1)
+
+    # 某个星级（1-5）对应的计数列
+    @staticmethod
+    def rating_count_column(rating):
+        return getattr(Dish, 'rating_count_%d' % rating)
 
 class CartItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -43,15 +153,28 @@ class CartItem(db.Model):
     
     user = db.relationship('User', backref=db.backref('cart_items', lazy=True))
     dish = db.relationship('Dish', backref=db.backref('cart_items', lazy=True))
+    
+    # 加入购物车时按用户、菜品和规格查找已有条目；删除菜品时按菜品清理
+    __table_args__ = (
+        db.Index('ix_cart_item_user_dish', 'user_id', 'dish_id', 'specifications'),
+        db.Index('ix_cart_item_dish', 'dish_id'),
+    )
 
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     total_amount = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(20), default='pending')  # pending, confirmed, delivered
-    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     user = db.relationship('User', backref=db.backref('orders', lazy=True))
+    
+    # 用户订单列表、管理员按状态筛选及不筛选的订单列表，均按 (下单时间, ID) 分页
+    __table_args__ = (
+        db.Index('ix_order_user_created', 'user_id', 'created_at'),
+        db.Index('ix_order_status_created', 'status', 'created_at'),
+        db.Index('ix_order_created', 'created_at', 'id'),
+    )
 
 class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -63,6 +186,52 @@ class OrderItem(db.Model):
     
     order = db.relationship('Order', backref=db.backref('order_items', lazy=True))
     dish = db.relationship('Dish', backref=db.backref('order_items', lazy=True))
+    
+    __table_args__ = (
+        db.Index('ix_order_item_order', 'order_id'),
+        db.Index('ix_order_item_dish', 'dish_id'),
+    )
+
+# 归档订单：超过一定天数的已送达订单从 Order/OrderItem 移到这两个表中，ID保持不变。
+# 使用名为 archive 的 bind，默认与主库是同一个数据库，也可以通过 ARCHIVE_DATABASE_URL 放在单独的 SQLite 文件中，
+# 因此不设外键，也不与主库的表联表查询
+class OrderArchive(db.Model):
+    __bind_key__ = 'archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    total_amount = db.Column(db.Float, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_order_archive_user_created', 'user_id', 'created_at'),
+        db.Index('ix_order_archive_created', 'created_at'),
+    )
+
+class OrderItemArchive(db.Model):
+    __bind_key__ = 'archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    order_id = db.Column(db.Integer, nullable=False)
+    dish_id = db.Column(db.Integer, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    specifications = db.Column(db.Text)
+    
+    __table_args__ = (
+        db.Index('ix_order_item_archive_order', 'order_id'),
+    )
+
+# 菜品每日库存；某天没有记录的菜品视为不限量
+class DishInventory(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    dish_id = db.Column(db.Integer, db.ForeignKey('dish.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    remaining = db.Column(db.Integer, nullable=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('dish_id', 'date', name='uq_dish_inventory_dish_date'),
+    )
 
 class Review(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -70,17 +239,77 @@ class Review(db.Model):
     dish_id = db.Column(db.Integer, db.ForeignKey('dish.id'), nullable=False)
     rating = db.Column(db.Integer, nullable=False)  # 评分 1-5
     comment = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    # 与订单一样在 Python 端生成时间，存储格式与键集分页游标中的时间一致
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     user = db.relationship('User', backref=db.backref('reviews', lazy=True))
     dish = db.relationship('Dish', backref=db.backref('reviews', lazy=True))
+    
+    # 菜品评论按时间列出
+    __table_args__ = (
+        db.Index('ix_review_dish_created', 'dish_id', 'created_at'),
+    )
 
-# 初始化默认数据
+# 销售汇总：按小时/按天、菜品、订单状态累计销售额与销量，由下单和订单状态变更增量维护
+# 菜品ID不设外键，菜品删除后历史汇总仍保留
+class DishSalesRollup(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(10), nullable=False)  # hour, day
+    bucket = db.Column(db.DateTime, nullable=False)
+    dish_id = db.Column(db.Integer, nullable=False)
+    category_id = db.Column(db.Integer)
+    status = db.Column(db.String(20), nullable=False)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('granularity', 'bucket', 'dish_id', 'status', name='uq_dish_sales_rollup'),
+    )
+
+# 订单维度的销售汇总（订单数与销售额时间序列）
+class OrderSalesRollup(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(10), nullable=False)  # hour, day
+    bucket = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('granularity', 'bucket', 'status', name='uq_order_sales_rollup'),
+    )
+
+# 根据评论表重建所有菜品的评分聚合（用于已有数据的一次性修复）
+def rebuild_dish_ratings(histogram=True):
+    rating_sum = select(func.coalesce(func.sum(Review.rating), 0)) \
+        .where(Review.dish_id == Dish.id).scalar_subquery()
+    rating_count = select(func.count(Review.id)) \
+        .where(Review.dish_id == Dish.id).scalar_subquery()
+    rating_avg = select(func.coalesce(func.avg(Review.rating), 5.0)) \
+        .where(Review.dish_id == Dish.id).scalar_subquery()
+
+    values = {
+        Dish.rating_sum: rating_sum,
+        Dish.rating_count: rating_count,
+        Dish.rating_avg: rating_avg
+    }
+    # 迁移 0001 在评分分布列加入（迁移 0003）之前调用，此时只重建总和与平均值
+    if histogram:
+        for rating in range(1, 6):
+            values[Dish.rating_count_column(rating)] = select(func.count(Review.id)) \
+                .where(Review.dish_id == Dish.id, Review.rating == rating).scalar_subquery()
+
+    updated = Dish.query.update(values, synchronize_session=False)
+    db.session.commit()
+    return updated
+
+# 初始化默认数据；已有数据时不做修改，返回是否写入了数据
 def init_default_data():
     # 检查是否已有数据
     with db.session.no_autoflush:
         if Category.query.first() is not None:
-            return
+            return False
     
     # 创建分类
     categories_data = [
@@ -145,4 +374,5 @@ def init_default_data():
         )
         db.session.add(dish)
     
-    db.session.commit()
\ No newline at end of file
+    db.session.commit()
+    return True
@@ -0,0 +1,48 @@
+import base64
+import json
+
+from sqlalchemy import and_, or_
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+class InvalidPageRequest(ValueError):
+    pass
+
+
+# 解析每页数量参数，超出上限时截断
+def parse_limit(value, default=DEFAULT_LIMIT, maximum=MAX_LIMIT):
+    if value is None or value == '':
+        return default
+    try:
+        limit = int(value)
+    except (ValueError, TypeError):
+        raise InvalidPageRequest('limit must be a positive integer')
+    if limit <= 0:
+        raise InvalidPageRequest('limit must be a positive integer')
+    return min(limit, maximum)
+
+
+# 游标对客户端不透明：base64编码的 [排序方式, 排序值..., id]
+def encode_cursor(sort, *values):
+    raw = json.dumps([sort, *values], separators=(',', ':'), ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, sort):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (ValueError, TypeError, UnicodeError):
+        raise InvalidPageRequest('Invalid cursor')
+    if not isinstance(data, list) or len(data) < 2 or data[0] != sort:
+        raise InvalidPageRequest('Invalid cursor')
+    return data[1:]
+
+
+# 生成键集分页条件：(key, id) 严格位于游标之后
+def keyset_after(key, id_column, key_value, id_value, descending=False):
+    if descending:
+        return or_(key < key_value, and_(key == key_value, id_column < id_value))
+    return or_(key > key_value, and_(key == key_value, id_column > id_value))
@@ -0,0 +1,113 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+from extensions import AppExtension
+
+
+class PasswordPoolBusy(Exception):
+    pass
+
+
+# 在子进程中执行的函数，只依赖 bcrypt。
+# bcrypt 只使用前72字节，新版本对超长输入会报错，因此统一截断
+def _hash_password(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8')[:72], bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check_password(password_hash, password):
+    try:
+        return bcrypt.checkpw(password.encode('utf-8')[:72], password_hash.encode('utf-8'))
+    except ValueError:  # 非 bcrypt 格式的哈希
+        return False
+
+
+# 默认进程数：每个 worker 各有一个进程池，按 WEB_CONCURRENCY（Gunicorn 的 worker 数）平分CPU核数；
+# 未设置时每个 worker 最多2个进程
+def default_pool_workers():
+    cpus = os.cpu_count() or 1
+    try:
+        web_workers = int(os.environ.get('WEB_CONCURRENCY', ''))
+    except ValueError:
+        web_workers = None
+    if web_workers and web_workers > 0:
+        return max(1, cpus // web_workers)
+    return min(2, cpus)
+
+
+# bcrypt 哈希与校验放到有界的进程池中执行，避免长时间占用请求线程。
+# 排队的任务数达到上限时抛出 PasswordPoolBusy，由接口返回429。
+class PasswordHasher:
+    def __init__(self, app=None):
+        self.rounds = 12
+        self.workers = 0
+        self.wait_timeout = 0
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._slots = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('BCRYPT_LOG_ROUNDS', 12)
+        # 进程数为0时在请求线程内直接计算（开发与测试环境）
+        app.config.setdefault('PASSWORD_POOL_WORKERS', default_pool_workers())
+        app.config.setdefault('PASSWORD_POOL_QUEUE_SIZE', 4 * app.config['PASSWORD_POOL_WORKERS'])
+        app.config.setdefault('PASSWORD_POOL_WAIT_TIMEOUT', 0.5)
+        self.rounds = app.config['BCRYPT_LOG_ROUNDS']
+        self.workers = app.config['PASSWORD_POOL_WORKERS']
+        self.wait_timeout = app.config['PASSWORD_POOL_WAIT_TIMEOUT']
+        self._slots = threading.BoundedSemaphore(self.workers + app.config['PASSWORD_POOL_QUEUE_SIZE']) \
+            if self.workers else None
+
+    # 进程池在第一次使用时才创建，不影响应用启动。
+    # 请求线程所在的进程是多线程的，不能安全地 fork；子进程由 forkserver（不支持时用 spawn）启动，
+    # 只导入本模块和 bcrypt（应用模块导入时不访问数据库，重新导入也没有副作用）
+    def _get_executor(self):
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    methods = multiprocessing.get_all_start_methods()
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                    )
+        return self._executor
+
+    def _run(self, func, *args):
+        if not self.workers:
+            return func(*args)
+        if not self._slots.acquire(timeout=self.wait_timeout):
+            raise PasswordPoolBusy()
+        try:
+            future = self._get_executor().submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+    def hash(self, password):
+        return self._run(_hash_password, password, self.rounds)
+
+    def check(self, password_hash, password):
+        if not password_hash or password is None:
+            return False
+        return self._run(_check_password, password_hash, password)
+
+    # 哈希的工作因子与当前配置不同（如调整了 BCRYPT_LOG_ROUNDS）时需要重新哈希
+    def needs_rehash(self, password_hash):
+        try:
+            return int(password_hash.split('$')[2]) != self.rounds
+        except (AttributeError, IndexError, ValueError):
+            return True
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+password_hasher = AppExtension('password_hasher', PasswordHasher)
@@ -0,0 +1,95 @@
+import re
+from datetime import date, datetime
+
+from sqlalchemy import inspect
+
+import archive
+from models import db, User, Dish, CartItem, Order, OrderItem, DishInventory, OrderArchive, OrderItemArchive
+from pagination import encode_cursor
+from serializers import order_rows
+
+# 热点查询的执行计划检查（SQLite EXPLAIN QUERY PLAN），flask check-query-plans 与 tests/test_query_plans.py 使用：
+# 以下查询与 app.py 中各接口的查询条件一致，执行计划中不应出现对整张表的扫描。
+# SQLite 3.36 之前输出 "SCAN TABLE order"，之后为 "SCAN order"（可能带 AS 别名）；
+# 带 USING INDEX 的扫描按索引顺序读取，带 LIMIT 时读到一页即可停止，不算全表扫描。
+# 但如果结果还要整体排序（USE TEMP B-TREE FOR ORDER BY），索引的顺序与 ORDER BY 不符，仍需读完整个索引
+_FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+_INDEX_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)? USING (?:COVERING )?INDEX ')
+_TEMP_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+
+
+# 菜品列表、评论与订单列表的查询由接口使用的同一组函数构建（app 导入了本模块，因此在调用时导入 app）
+def hot_path_queries():
+    import app as views
+
+    reviews_cursor = encode_cursor('reviews', datetime(2024, 1, 1).isoformat(), 100)
+    orders_cursor = encode_cursor('orders', datetime(2024, 1, 1).isoformat(), 100)
+    return [
+        ('login', User.query.filter_by(username='admin')),
+        ('get_dishes?category_id', views.dish_query({'category_id': '1'})[0]),
+        ('get_dishes?category_id&sort=price', views.dish_query({'category_id': '1', 'sort': 'price'})[0]),
+        ('get_dishes?category_id&sort=price&cursor', views.dish_query({
+            'category_id': '1', 'sort': 'price', 'cursor': encode_cursor('price', 10.0, 100)})[0]),
+        ('get_dish_reviews', views.review_query(1, {}).limit(20)),
+        ('get_dish_reviews?min_rating&cursor',
+         views.review_query(1, {'min_rating': '4', 'cursor': reviews_cursor}).limit(20)),
+        ('add_to_cart', CartItem.query.filter_by(user_id=1, dish_id=1, specifications='')),
+        ('get_cart', CartItem.query.filter_by(user_id=1).order_by(CartItem.id)),
+        ('get_cart.dishes', Dish.query.filter(Dish.id.in_([1, 2, 3]))),
+        ('create_order.cart_items', CartItem.query.filter_by(user_id=1).order_by(CartItem.id)),
+        ('create_order.dishes', db.session.query(Dish.id, Dish.price, Dish.category_id, DishInventory.remaining)
+         .outerjoin(DishInventory, (DishInventory.dish_id == Dish.id) & (DishInventory.date == date.today()))
+         .filter(Dish.id.in_([1, 2, 3]))),
+        ('get_orders', views.order_query(order_rows().filter(Order.user_id == 1), {}).limit(20)),
+        ('get_orders?cursor',
+         views.order_query(order_rows().filter(Order.user_id == 1), {'cursor': orders_cursor}).limit(20)),
+        ('get_orders.order_items', OrderItem.query.filter(OrderItem.order_id.in_([1, 2, 3]))),
+        ('admin_get_orders', views.order_query(order_rows(include_user=True), {}).limit(20)),
+        ('admin_get_orders?cursor',
+         views.order_query(order_rows(include_user=True), {'cursor': orders_cursor}).limit(20)),
+        ('admin_get_orders?status', views.order_query(order_rows(include_user=True), {'status': 'pending'}).limit(20)),
+        ('admin_get_orders?start', views.order_query(order_rows(include_user=True), {'start': '2024-01-01'}).limit(20)),
+        ('get_orders.archived',
+         views.order_query(archive.order_rows(user_id=1), {}, OrderArchive).limit(20)),
+        ('get_orders.archived_items', OrderItemArchive.query.filter(OrderItemArchive.order_id.in_([1, 2, 3]))),
+        ('admin_get_orders.archived?start',
+         views.order_query(archive.order_rows(), {'start': '2024-01-01'}, OrderArchive).limit(20)),
+        ('admin_delete_dish.cart_items', CartItem.query.filter_by(dish_id=1)),
+        ('admin_delete_category', Dish.query.filter(Dish.category_id == 1, Dish.active())),
+        ('archive_orders', db.session.query(Order.id).filter(
+            Order.status == 'delivered', Order.created_at < datetime(2024, 1, 1), Order.id > 0, Order.id < 1000
+        ).order_by(Order.id).limit(500)),
+        ('admin_import_dishes?key=name', db.session.query(Dish.id, Dish.name)
+         .filter(Dish.name.in_(['a', 'b']))),
+    ]
+
+
+def explain(query):
+    compiled = query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'render_postcompile': True})
+    params = compiled.construct_params()
+    values = tuple(params[name] for name in compiled.positiontup)
+    # 归档表可能在单独的数据库中，按查询的实体选择连接
+    mapper = inspect(query.column_descriptions[0]['entity'])
+    connection = db.session.connection(bind_arguments={'mapper': mapper})
+    return [row[-1] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), values)]
+
+
+# 执行计划中被全表扫描的表
+def full_scans(plan):
+    patterns = (_FULL_SCAN, _INDEX_SCAN) if _TEMP_SORT in plan else (_FULL_SCAN,)
+    tables = []
+    for line in plan:
+        for pattern in patterns:
+            match = pattern.match(line)
+            if match:
+                tables.append(match.group(1))
+    return tables
+
+
+# 返回 [(名称, 执行计划, 被全表扫描的表)]
+def check_query_plans():
+    results = []
+    for name, query in hot_path_queries():
+        plan = explain(query)
+        results.append((name, plan, full_scans(plan)))
+    return results
@@ -0,0 +1,54 @@
+import time
+from functools import wraps
+
+from flask import current_app, make_response, request
+
+from cache import cached_json, menu_cache
+from models import db
+
+# 记录“在此时间之前读主库”的 Cookie。多个 worker 之间无需共享状态
+STICKY_COOKIE = 'read_primary_until'
+
+
+def replicas_enabled():
+    return bool(current_app.config.get('REPLICA_BINDS'))
+
+
+def pinned_to_primary():
+    try:
+        return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+# 写操作成功后，让该客户端在 REPLICA_STICKY_SECONDS 内的读请求走主库，避免读不到自己刚写入的数据
+def stick_to_primary(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        response = make_response(f(*args, **kwargs))
+        seconds = current_app.config.get('REPLICA_STICKY_SECONDS')
+        if replicas_enabled() and seconds and response.status_code < 400:
+            response.set_cookie(STICKY_COOKIE, '%.3f' % (time.time() + seconds),
+                                max_age=seconds, httponly=True, samesite='Lax')
+        return response
+    return decorated_function
+
+
+# 目录类只读接口：缓存未命中时在副本上生成响应。
+# 处于读己之写窗口内的客户端在主库上重新生成并覆盖缓存条目，以免读到副本延迟期间写入的旧内容。
+# 目录在 REPLICA_STICKY_SECONDS 内刚被修改（缓存版本递增）时也在主库上生成：
+# 副本可能尚未同步这次修改，由它生成的条目会以新版本号缓存旧数据
+def cached_read(namespace, key, build):
+    if not replicas_enabled():
+        return cached_json(namespace, key, build)
+    if pinned_to_primary():
+        return cached_json(namespace, key, build, refresh=True)
+    
+    def build_on_replica():
+        seconds = current_app.config.get('REPLICA_STICKY_SECONDS') or 0
+        if menu_cache.bumped_at > time.time() - seconds:
+            return build()
+        with db.read_replica():
+            return build()
+    
+    return cached_json(namespace, key, build_on_replica, ttl=current_app.config.get('REPLICA_CACHE_TTL'))
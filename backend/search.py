@@ -0,0 +1,160 @@
+import re
+
+from sqlalchemy import Integer, bindparam, text
+
+from models import db, Dish, Category
+
+# 菜品全文索引（SQLite FTS5）。rowid 与菜品ID一致，
+# 存储的是经过 n-gram 切分后的词项而非原文，以便中文按字匹配。
+FTS_TABLE = 'dish_fts'
+
+# 连续的中日韩文字切分为单字和双字词，其余按字母数字串切分。
+# 字母数字串不包含中日韩文字（\w 也匹配汉字），"mapo麻婆" 切分为 "mapo" 和 "麻婆" 两段
+_TOKEN_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[^\W_\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+_CJK_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]')
+
+# bm25 各列权重：名称 > 分类 > 描述
+_RANK = f'bm25({FTS_TABLE}, 10.0, 1.0, 2.0)'
+
+
+def search_available():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def _index_tokens(value):
+    tokens = []
+    for run in _TOKEN_RE.findall((value or '').lower()):
+        if _CJK_RE.match(run):
+            tokens.extend(run)
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return ' '.join(tokens)
+
+
+def _query_tokens(value):
+    tokens = []
+    for run in _TOKEN_RE.findall((value or '').lower()):
+        if _CJK_RE.match(run) and len(run) > 1:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+# 把用户输入转换为 FTS5 MATCH 表达式；prefix 为真时最后一个英文词按前缀匹配（用于自动补全）
+def build_match_query(value, prefix=False):
+    tokens = _query_tokens(value)
+    if not tokens:
+        return None
+    terms = ['"%s"' % token for token in tokens]
+    # 中文已按单字和双字建索引，无需前缀展开
+    if prefix and not _CJK_RE.match(tokens[-1]):
+        terms[-1] += '*'
+    return ' AND '.join(terms)
+
+
+def ensure_search_index():
+    if not search_available():
+        return
+    exists = db.session.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+    ), {'name': FTS_TABLE}).first()
+    if exists:
+        return
+    db.session.execute(text(
+        f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+        f"name, description, category, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    ))
+    rebuild_search_index()
+
+
+def rebuild_search_index():
+    if not search_available():
+        return 0
+    db.session.execute(text(f'DELETE FROM {FTS_TABLE}'))
+    rows = db.session.query(Dish.id, Dish.name, Dish.description, Category.name) \
+        .outerjoin(Category, Dish.category_id == Category.id).filter(Dish.active()).all()
+    if rows:
+        db.session.execute(text(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, description, category) '
+            f'VALUES (:id, :name, :description, :category)'
+        ), [_index_row(*row) for row in rows])
+    db.session.commit()
+    return len(rows)
+
+
+def _index_row(dish_id, name, description, category_name):
+    return {
+        'id': dish_id,
+        'name': _index_tokens(name),
+        'description': _index_tokens(description),
+        'category': _index_tokens(category_name)
+    }
+
+
+# 以下同步函数只在当前会话中执行语句，由调用方与菜品的修改一起提交
+def index_dish(dish):
+    if not search_available():
+        return
+    # 按外键取分类（会话中通常已有缓存），避免读到修改前的 dish.category
+    category = Category.query.get(dish.category_id) if dish.category_id else None
+    category_name = category.name if category else None
+    db.session.execute(text(f'DELETE FROM {FTS_TABLE} WHERE rowid = :id'), {'id': dish.id})
+    db.session.execute(text(
+        f'INSERT INTO {FTS_TABLE} (rowid, name, description, category) '
+        f'VALUES (:id, :name, :description, :category)'
+    ), _index_row(dish.id, dish.name, dish.description, category_name))
+
+
+# 批量重建指定菜品的索引（批量导入），每批一次删除、一次查询和一次批量插入
+def index_dishes(dish_ids, batch_size=500):
+    if not search_available():
+        return
+    dish_ids = list(dish_ids)
+    for start in range(0, len(dish_ids), batch_size):
+        batch = dish_ids[start:start + batch_size]
+        db.session.execute(text(f'DELETE FROM {FTS_TABLE} WHERE rowid IN :ids')
+                           .bindparams(bindparam('ids', expanding=True)), {'ids': batch})
+        rows = db.session.query(Dish.id, Dish.name, Dish.description, Category.name) \
+            .outerjoin(Category, Dish.category_id == Category.id) \
+            .filter(Dish.id.in_(batch), Dish.active()).all()
+        if rows:
+            db.session.execute(text(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, description, category) '
+                f'VALUES (:id, :name, :description, :category)'
+            ), [_index_row(*row) for row in rows])
+
+
+def remove_dish(dish_id):
+    if not search_available():
+        return
+    db.session.execute(text(f'DELETE FROM {FTS_TABLE} WHERE rowid = :id'), {'id': dish_id})
+
+
+def reindex_category(category_id):
+    if not search_available():
+        return
+    for dish in Dish.query.filter(Dish.category_id == category_id, Dish.active()).all():
+        index_dish(dish)
+
+
+# 供 /api/dishes 的 q 参数使用：返回匹配菜品ID的子查询
+def matching_ids(value):
+    match = build_match_query(value, prefix=True)
+    if match is None:
+        return None
+    return text(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match') \
+        .bindparams(match=match).columns(rowid=Integer)
+
+
+# 按相关度返回匹配的菜品ID
+def search_dish_ids(value, limit, prefix=False):
+    match = build_match_query(value, prefix=prefix)
+    if match is None:
+        return []
+    rows = db.session.execute(text(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match '
+        f'ORDER BY {_RANK} LIMIT :limit'
+    ), {'match': match, 'limit': limit})
+    return [row[0] for row in rows]
@@ -0,0 +1,199 @@
+from flask import Response, json
+
+import archive
+from models import db, User, Dish, Category, Order, OrderItem, Review
+
+# 响应序列化：列表接口只查询需要的列（行元组，不构造 ORM 对象），在此处统一转换为响应结构，
+# 并优先使用 orjson 编码（未安装时回退到标准库 json）
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(payload):
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload).encode('utf-8')
+
+
+def json_response(payload, status=200):
+    return Response(dumps(payload), status=status, mimetype='application/json')
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+# 菜品：列表、搜索与管理接口共用
+DISH_COLUMNS = (
+    Dish.id, Dish.name, Dish.description, Dish.price, Dish.image_url, Dish.rating_avg, Dish.rating_count,
+    Category.id.label('category_id'), Category.name.label('category_name')
+)
+
+
+# 只包含未删除的菜品
+def dish_rows():
+    return db.session.query(*DISH_COLUMNS).outerjoin(Category, Dish.category_id == Category.id) \
+        .filter(Dish.active())
+
+
+def _dish_category(row):
+    if row.category_id is None:
+        return None
+    return {'id': row.category_id, 'name': row.category_name}
+
+
+def serialize_dish(row):
+    return {
+        'id': row.id,
+        'name': row.name,
+        'description': row.description,
+        'price': row.price,
+        'image_url': row.image_url,
+        'rating': round(row.rating_avg, 1),
+        'reviewCount': row.rating_count,
+        'category': _dish_category(row)
+    }
+
+
+def serialize_admin_dish(row):
+    return {
+        'id': row.id,
+        'name': row.name,
+        'description': row.description,
+        'price': row.price,
+        'image_url': row.image_url,
+        'category': _dish_category(row)
+    }
+
+
+# 菜品详情
+DISH_DETAIL_COLUMNS = (Dish.id, Dish.name, Dish.description, Dish.price, Dish.image_url,
+                       Dish.rating_avg, Dish.rating_count)
+
+
+def serialize_dish_detail(row):
+    return {
+        'id': row.id,
+        'name': row.name,
+        'description': row.description,
+        'price': row.price,
+        'image_url': row.image_url,
+        'averageRating': round(row.rating_avg, 1),
+        'reviewCount': row.rating_count
+    }
+
+
+# 评论：与用户一次联表查询
+REVIEW_COLUMNS = (Review.id, Review.rating, Review.comment, Review.created_at,
+                  User.id.label('user_id'), User.username)
+
+
+def review_rows():
+    return db.session.query(*REVIEW_COLUMNS).join(User, Review.user_id == User.id)
+
+
+def serialize_review(row):
+    return {
+        'id': row.id,
+        'rating': row.rating,
+        'comment': row.comment,
+        'created_at': _isoformat(row.created_at),
+        'user': {
+            'id': row.user_id,
+            'username': row.username
+        }
+    }
+
+
+# 评分分布：键为星级字符串 '1'-'5'
+RATING_SUMMARY_COLUMNS = (Dish.rating_count, Dish.rating_avg) + tuple(
+    Dish.rating_count_column(rating) for rating in range(1, 6))
+
+
+def serialize_rating_summary(row):
+    return {
+        'averageRating': round(row.rating_avg, 1),
+        'reviewCount': row.rating_count,
+        'histogram': {str(rating): getattr(row, 'rating_count_%d' % rating) for rating in range(1, 6)}
+    }
+
+
+# 购物车：购物车条目来自 cart_store，菜品按ID一次查询
+CART_DISH_COLUMNS = (Dish.id, Dish.name, Dish.price, Dish.image_url)
+
+
+def serialize_cart(items):
+    dish_ids = {item['dish_id'] for item in items}
+    if not dish_ids:
+        return []
+    dishes = {row.id: row for row in
+              db.session.query(*CART_DISH_COLUMNS).filter(Dish.id.in_(dish_ids), Dish.active())}
+    # 菜品已被删除的购物车项不返回
+    return [{
+        'id': item['id'],
+        'dish': {
+            'id': dish.id,
+            'name': dish.name,
+            'price': dish.price,
+            'image_url': dish.image_url
+        },
+        'quantity': item['quantity'],
+        'specifications': item['specifications']
+    } for item in items for dish in [dishes.get(item['dish_id'])] if dish is not None]
+
+
+# 订单：订单一次查询（管理员列表同时联表取用户名），订单项及菜品按订单ID一次查询。
+# 订单项中已删除的菜品仍返回其名称；已归档的订单（archived_ids）的订单项从归档表读取
+ORDER_COLUMNS = (Order.id, Order.total_amount, Order.status, Order.created_at)
+ORDER_USER_COLUMNS = (Order.user_id, User.username)
+ORDER_ITEM_COLUMNS = (OrderItem.order_id, OrderItem.dish_id, Dish.name, Dish.price,
+                      OrderItem.quantity, OrderItem.price.label('item_price'), OrderItem.specifications)
+
+
+def order_rows(include_user=False):
+    if include_user:
+        return db.session.query(*ORDER_COLUMNS, *ORDER_USER_COLUMNS).join(User, Order.user_id == User.id)
+    return db.session.query(*ORDER_COLUMNS)
+
+
+def serialize_orders(rows, include_user=False, archived_ids=()):
+    items = {row.id: [] for row in rows}
+    hot_ids = [order_id for order_id in items if order_id not in archived_ids]
+    item_rows = []
+    if hot_ids:
+        item_rows = db.session.query(*ORDER_ITEM_COLUMNS) \
+            .outerjoin(Dish, OrderItem.dish_id == Dish.id) \
+            .filter(OrderItem.order_id.in_(hot_ids)) \
+            .order_by(OrderItem.id).all()
+    if archived_ids:
+        item_rows += archive.item_rows(list(archived_ids))
+    for item in item_rows:
+        items[item.order_id].append({
+            'dish': {
+                'id': item.dish_id,
+                'name': item.name,
+                'price': item.price
+            },
+            'quantity': item.quantity,
+            'price': item.item_price,
+            'specifications': item.specifications
+        })
+
+    orders = []
+    for row in rows:
+        data = {
+            'id': row.id,
+            'total_amount': row.total_amount,
+            'status': row.status,
+            'created_at': _isoformat(row.created_at),
+            'items': items[row.id]
+        }
+        if include_user:
+            data['user'] = {
+                'id': row.user_id,
+                'username': row.username
+            }
+        orders.append(data)
+    return orders
@@ -0,0 +1,17 @@
+import pytest
+
+from app import create_app, init_db
+
+
+# 在临时目录中的 SQLite 数据库上建表并执行全部迁移；归档表放在单独的数据库中
+@pytest.fixture
+def app(tmp_path):
+    application = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///%s' % (tmp_path / 'app.db'),
+        'ARCHIVE_DATABASE_URL': 'sqlite:///%s' % (tmp_path / 'archive.db'),
+    })
+    with application.app_context():
+        init_db()
+        yield application
+        from models import db
+        db.session.remove()
@@ -0,0 +1,38 @@
+from auth_cache import auth_cache
+from models import db, User
+
+
+def add_user():
+    user = User(username='alice', email='alice@example.com')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+# 修改在提交后才使缓存失效；提交前重新写入的旧状态也会被清除
+def test_invalidates_after_commit(app):
+    user = add_user()
+    assert auth_cache.resolve(user.id) == (False, 1)
+    user.revoke_tokens()
+    db.session.flush()
+    auth_cache.set(user.id, False, 1)
+    db.session.commit()
+    assert auth_cache.get(user.id) is None
+    assert auth_cache.resolve(user.id) == (False, 2)
+
+
+def test_rollback_keeps_entry(app):
+    user = add_user()
+    auth_cache.resolve(user.id)
+    user.revoke_tokens()
+    db.session.flush()
+    db.session.rollback()
+    assert auth_cache.get(user.id) == (False, 1)
+
+
+# 查询期间发生失效时不写入查询到的（可能已过时的）状态
+def test_set_skips_after_concurrent_invalidation(app):
+    evictions = auth_cache._evictions
+    auth_cache.invalidate(1)
+    auth_cache.set(1, True, 1, evictions)
+    assert auth_cache.get(1) is None
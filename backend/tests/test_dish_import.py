@@ -0,0 +1,52 @@
+import io
+
+import dish_import
+from models import db, Category, Dish
+
+
+def run_import(text, file_format='ndjson', **options):
+    importer = dish_import.DishImporter(**options)
+    for number, record, error in dish_import.read_records(io.BytesIO(text.encode()), file_format):
+        importer.add(number, record, error)
+    importer.finish()
+    return importer
+
+
+def add_dish(**values):
+    category = Category(name='川菜')
+    dish = Dish(name='宫保鸡丁', price=28, description='花生', image_url='/a.jpg', category=category, **values)
+    db.session.add(dish)
+    db.session.commit()
+    return dish
+
+
+# 文件中没有的列保持原值
+def test_update_keeps_absent_columns(app):
+    dish = add_dish()
+    importer = run_import('id,name,price\n%d,宫保鸡丁,30\n' % dish.id, 'csv')
+    assert importer.updated == 1 and importer.error_count == 0
+    db.session.expire_all()
+    assert (dish.price, dish.description, dish.image_url, dish.category.name) == (30, '花生', '/a.jpg', '川菜')
+
+
+def test_update_rows_with_different_columns(app):
+    dish = add_dish()
+    other = Dish(name='麻婆豆腐', price=18, description='豆腐')
+    db.session.add(other)
+    db.session.commit()
+    run_import('{"id": %d, "name": "宫保鸡丁", "price": 30, "description": ""}\n'
+               '{"id": %d, "name": "麻婆豆腐", "price": 20, "category": "川菜"}\n' % (dish.id, other.id))
+    db.session.expire_all()
+    assert (dish.description, dish.image_url) == (None, '/a.jpg')
+    assert (other.description, other.category_id) == ('豆腐', dish.category_id)
+
+
+# 写入时失败的行不创建分类
+def test_failed_rows_do_not_create_categories(app):
+    importer = run_import('{"id": 999, "name": "水煮鱼", "price": 48, "category": "湘菜"}\n'
+                          '{"name": "剁椒鱼头", "price": 58, "category": "粤菜"}\n'
+                          '{"name": "白切鸡", "price": 38, "category": "粤菜"}\n',
+                          create_categories=True)
+    assert importer.errors == [{'row': 1, 'message': 'Dish 999 does not exist'}]
+    assert importer.created_categories == ['粤菜']
+    assert sorted(name for name, in db.session.query(Category.name)) == ['粤菜']
@@ -0,0 +1,26 @@
+import pytest
+
+from query_plans import check_query_plans, full_scans
+
+
+@pytest.mark.parametrize('plan, tables', [
+    (['SCAN TABLE order'], ['order']),
+    (['SCAN order'], ['order']),
+    (['SCAN TABLE order AS o'], ['order']),
+    (['SCAN order USING INDEX ix_order_created'], []),
+    (['SCAN order USING COVERING INDEX ix_order_created'], []),
+    (['SCAN order USING INDEX ix_order_user_created', 'USE TEMP B-TREE FOR ORDER BY'], ['order']),
+    (['SEARCH order USING INDEX ix_order_user_created (user_id=?)', 'USE TEMP B-TREE FOR ORDER BY'], []),
+    (['SCAN CONSTANT ROW'], []),
+])
+def test_full_scans(plan, tables):
+    assert full_scans(plan) == tables
+
+
+def test_hot_paths_do_not_scan_tables(app):
+    results = check_query_plans()
+    names = {name for name, _, _ in results}
+    assert {'get_dishes?category_id', 'get_dish_reviews', 'get_orders', 'admin_get_orders',
+            'admin_get_orders?status'} <= names
+    scans = {name: plan for name, plan, tables in results if tables}
+    assert scans == {}
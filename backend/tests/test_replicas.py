@@ -0,0 +1,54 @@
+import sqlite3
+
+import pytest
+
+from app import create_app, init_db
+from cache import menu_cache
+from models import db, Dish
+
+
+@pytest.fixture
+def replica_app(tmp_path):
+    application = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///%s' % (tmp_path / 'app.db'),
+        'ARCHIVE_DATABASE_URL': 'sqlite:///%s' % (tmp_path / 'archive.db'),
+        'REPLICA_DATABASE_URLS': ['sqlite:///%s' % (tmp_path / 'replica.db')],
+    })
+    with application.app_context():
+        init_db()
+        yield application
+        db.session.remove()
+
+
+# 复制主库的当前内容作为副本，之后主库上的修改副本看不到（相当于同步延迟）
+def snapshot_replica(tmp_path):
+    db.session.remove()
+    db.get_engine(bind='replica_0').dispose()
+    source = sqlite3.connect(tmp_path / 'app.db')
+    target = sqlite3.connect(tmp_path / 'replica.db')
+    source.backup(target)
+    source.close()
+    target.close()
+
+
+def rename_dish(dish_id, name):
+    Dish.query.get(dish_id).name = name
+    db.session.commit()
+    menu_cache.bump()
+
+
+def test_catalog_reads_use_primary_right_after_a_write(replica_app, tmp_path):
+    dish = Dish(name='旧名称', price=10)
+    db.session.add(dish)
+    db.session.commit()
+    dish_id = dish.id
+    snapshot_replica(tmp_path)
+    client = replica_app.test_client()
+
+    rename_dish(dish_id, '新名称')
+    assert client.get('/api/dishes/%d' % dish_id).json['name'] == '新名称'
+
+    # 超出同步延迟窗口后缓存未命中时从副本读取
+    replica_app.config['REPLICA_STICKY_SECONDS'] = 0
+    rename_dish(dish_id, '新名称2')
+    assert client.get('/api/dishes/%d' % dish_id).json['name'] == '旧名称'
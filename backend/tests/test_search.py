@@ -0,0 +1,25 @@
+import pytest
+
+import search
+from models import db, Dish
+
+
+@pytest.mark.parametrize('value, tokens', [
+    ('Mapo Tofu', ['mapo', 'tofu']),
+    ('麻婆豆腐', ['麻婆', '婆豆', '豆腐']),
+    ('mapo麻婆', ['mapo', '麻婆']),
+    ('麻婆tofu2', ['麻婆', 'tofu2']),
+    ('辣', ['辣']),
+])
+def test_query_tokens(value, tokens):
+    assert search._query_tokens(value) == tokens
+
+
+def test_mixed_script_names_match_each_part(app):
+    dish = Dish(name='Mapo麻婆豆腐', price=28)
+    db.session.add(dish)
+    db.session.flush()
+    search.index_dish(dish)
+    db.session.commit()
+    for q in ('mapo', '麻婆', '豆腐', 'mapo麻婆', 'ma'):
+        assert search.search_dish_ids(q, 10, prefix=True) == [dish.id], q